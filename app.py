@@ -1,6 +1,6 @@
 # app.py
 import streamlit as st
-import joblib, traceback
+import joblib, traceback, os
 import pandas as pd, numpy as np, matplotlib.pyplot as plt
 import shap, math
 import seaborn as sns
@@ -8,8 +8,14 @@ from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 
 # local helpers (must exist in your repo)
-from lca_input_utils import sanitize_and_validate_row
+from lca_input_utils import sanitize_and_validate_row, build_feature_schema, load_feature_schema, FEATURE_SCHEMA_PATH
+from lca_residuals import compute_residual_stats, load_residual_stats, residual_std_for, RESIDUALS_PATH
 from lca_recommend import generate_recommendations
+from lca_shap_index import ShapIndex, SHAP_INDEX_PATH, forest_fingerprint
+from lca_dataset import DATA_PATH, load_dataset
+from lca_optimize import MCIOptimizer, lever_bounds
+from lca_scenarios import LEVER_BOUNDS, SensitivityModel, base_row, scenario_inputs
+from lca_surrogate import Surrogate, SURROGATE_PATH
 
 # optional circularity module (if present)
 try:
@@ -33,14 +39,25 @@ def safe_df(df, max_chars=200):
 
 @st.cache_resource
 def load_artifacts():
-    """Load model and train/test split (cached)"""
+    """
+    Load model and the compact feature schema written by step3 (cached).
+    Older checkouts without feature_schema.json derive it from train_test_split.pkl.
+    """
     model = joblib.load("model_rf.pkl")
-    X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
-    return model, X_train, X_test, y_train, y_test
+    try:
+        schema = load_feature_schema(FEATURE_SCHEMA_PATH)
+    except Exception:
+        schema = build_feature_schema(joblib.load("train_test_split.pkl")[0])
+    return model, schema
+
+CIRCULARITY_ARTIFACT = "circularity_ai.pkl"
 
 @st.cache_resource
 def load_circularity_ai(possible_paths=None):
-    """Try to instantiate CircularityAIRefactored (cached). Returns (ai_obj, path) or (None, None)."""
+    """
+    Load the fitted CircularityAIRefactored artifact (cached), refitting only when the
+    dataset it was fitted on changed. Returns (ai_obj, path) or (None, None).
+    """
     if CircularityAIRefactored is None:
         return None, None
     candidates = possible_paths or [
@@ -49,13 +66,14 @@ def load_circularity_ai(possible_paths=None):
         "data/materials_dataset.csv",
         "data/sample_inputs.csv"
     ]
-    for p in candidates:
-        try:
-            ai = CircularityAIRefactored(p)
-            return ai, p
-        except Exception:
-            continue
-    return None, None
+    p = next((c for c in candidates if os.path.exists(c)), None)
+    if p is None:
+        return None, None
+    try:
+        ai = CircularityAIRefactored.load_or_fit(p, CIRCULARITY_ARTIFACT)
+        return ai, p
+    except Exception:
+        return None, None
 
 def find_tree_estimator_and_preprocessor(pipeline_or_estimator):
     """
@@ -80,96 +98,124 @@ def find_tree_estimator_and_preprocessor(pipeline_or_estimator):
             est = pipeline_or_estimator
     return est, preproc
 
+@st.cache_resource
+def get_tree_explainer(_estimator, model_key):
+    """Build the SHAP TreeExplainer once per model; `model_key` identifies the model for the cache."""
+    return shap.TreeExplainer(_estimator)
+
+@st.cache_resource
+def get_shap_index(_estimator, model_key):
+    """Nearest-neighbour SHAP index written by step14, if it was built for this model (else None)."""
+    try:
+        index = ShapIndex.load(SHAP_INDEX_PATH)
+    except Exception:
+        return None
+    return index if index.fingerprint == forest_fingerprint(_estimator) else None
+
+@st.cache_resource
+def get_surrogate(_estimator, model_key):
+    """Monotone what-if surrogate written by step16, if it was fitted to this model's forest (else None)."""
+    try:
+        sur = Surrogate.load(SURROGATE_PATH)
+    except Exception:
+        return None
+    return sur if sur.fingerprint == forest_fingerprint(_estimator) else None
+
+@st.cache_resource
+def get_sensitivity_model():
+    """Lever -> energy/emissions sensitivities for the optimizer (neutral without the dataset)."""
+    try:
+        return SensitivityModel.from_frame(load_dataset(DATA_PATH))
+    except Exception:
+        return SensitivityModel({}, {t: 0.0 for t in SensitivityModel.TARGETS})
+
+@st.cache_resource
+def get_residual_stats(_model, model_key):
+    """
+    Residual statistics written by step4 next to model_rf.pkl. Falls back to one
+    (cached) prediction pass over train+test when the file is missing.
+    """
+    try:
+        return load_residual_stats(RESIDUALS_PATH)
+    except Exception:
+        pass
+    X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+    X_all = pd.concat([pd.DataFrame(X_train), pd.DataFrame(X_test)], ignore_index=True)
+    y_all = np.concatenate([np.ravel(y_train), np.ravel(y_test)])
+    return compute_residual_stats(y_all, _model.predict(X_all), X_all)
+
+def model_cache_key(estimator):
+    return f"{type(estimator).__name__}:{id(estimator)}"
+
 # -------------------- load model artifacts --------------------
 try:
-    model, X_train, X_test, y_train, y_test = load_artifacts()
+    model, schema = load_artifacts()
 except Exception:
-    st.error("Failed to load model files. Put model_rf.pkl and train_test_split.pkl in app folder.")
+    st.error("Failed to load model files. Put model_rf.pkl and feature_schema.json (or train_test_split.pkl) in app folder.")
     st.text(traceback.format_exc())
     st.stop()
 
 # expected columns
-if isinstance(X_train, pd.DataFrame):
-    expected_cols = X_train.columns.tolist()
-else:
-    expected_cols = [f"f{i}" for i in range(X_train.shape[1])]
+expected_cols = schema["columns"]
 
-# compute residuals for CI
+# residual statistics for CI (precomputed at training time)
 try:
-    preds_train = model.predict(X_train)
-    preds_test = model.predict(X_test)
-    resid = np.concatenate([(y_train.ravel() - preds_train), (y_test.ravel() - preds_test)])
-    resid_std = float(np.std(resid))
-    resid_mae = float(np.mean(np.abs(resid)))
+    resid_stats = get_residual_stats(model, model_cache_key(model))
+    resid_std = resid_stats["overall"]["std"]
+    resid_mae = resid_stats["overall"]["mae"]
 except Exception:
+    resid_stats = None
     resid_std = None
     resid_mae = None
-    resid = None
 
 # -------------------- Circularity AI loading --------------------
 ai, ai_path = load_circularity_ai()
 if ai is None:
     st.info("Circularity AI dataset not loaded automatically. Place 'LCA_multi_metal_with_MCI.csv' in repo root or data/ if needed.")
 else:
-    st.info(f"Circularity AI dataset loaded from: {ai_path} (rows={len(ai.df)})")
+    st.info(f"Circularity AI dataset loaded from: {ai_path} (rows={ai.n_rows})")
 
 # -------------------- Sidebar: inputs --------------------
 st.sidebar.header("Input parameters (fill and Run prediction)")
 show_debug = st.sidebar.checkbox("Show detected columns (debug)", value=False)
+use_shap_index = st.sidebar.checkbox("Fast SHAP drivers (precomputed index)", value=True,
+                                     help="Nearest indexed training rows; exact SHAP only for inputs far from all of them")
+peer_k = int(st.sidebar.number_input("Peer benchmark: nearest records (0 = cluster means)", min_value=0, max_value=500,
+                                     value=25, step=5, help="Records with the same material and route"))
+target_mci = st.sidebar.number_input("Target MCI to optimize towards (0 = off)", min_value=0.0, max_value=1.0,
+                                     value=0.0, step=0.05,
+                                     help="Smallest change to the circularity levers that reaches this predicted MCI")
 
 # detect categorical columns robustly
 categorical_cols = []
-if isinstance(X_train, pd.DataFrame):
-    for c in expected_cols:
-        # consider object or category dtype, or small unique count as categorical
-        try:
-            dtype = X_train[c].dtype
-            if dtype == object or str(dtype).startswith("category") or X_train[c].nunique(dropna=True) <= 20:
-                categorical_cols.append(c)
-        except Exception:
-            continue
+for c in expected_cols:
+    # consider non-numeric dtype, or small unique count as categorical
+    if c in schema["categorical"] or schema["n_unique"].get(c, 0) <= 20:
+        categorical_cols.append(c)
 
 # detect metal/material column
 metal_candidates = [c for c in expected_cols if "metal" in c.lower() or "material" in c.lower()]
 metal_col = metal_candidates[0] if metal_candidates else None
 
-# prepare numeric defaults by coercing types safely (do not alter original X_train)
-numeric_defaults = {}
-if isinstance(X_train, pd.DataFrame):
-    # copy limited columns only
-    for c in expected_cols:
-        # attempt to coerce to numeric
-        try:
-            coerced = pd.to_numeric(X_train[c], errors="coerce")
-            # treat column as numeric if at least one non-NaN exists and dtype isn't object-like
-            if coerced.notna().sum() > 0 and (np.issubdtype(coerced.dtype, np.number) or X_train[c].dtype != object):
-                # compute mean ignoring NaN
-                mean_val = float(coerced.mean()) if coerced.notna().sum() > 0 else 0.0
-                numeric_defaults[c] = mean_val
-        except Exception:
-            continue
+# numeric defaults: training means of numeric columns with at least one value
+numeric_defaults = {
+    c: stats["mean"] for c, stats in schema["numeric"].items()
+    if c in expected_cols and stats["count"] > 0
+}
 
 # build sidebar form
 with st.sidebar.form("input_form"):
     # metals multiselect
-    if metal_col and isinstance(X_train, pd.DataFrame):
-        try:
-            metals_list = X_train[metal_col].dropna().unique().tolist()
-        except Exception:
-            metals_list = ["Aluminium", "Copper", "Steel"]
+    if metal_col and metal_col in schema["categorical"]:
+        metals_list = list(schema["categorical"][metal_col]["categories"])
         if len(metals_list) == 0:
             metals_list = ["Aluminium", "Copper", "Steel"]
         selected_metals = st.multiselect("Select metal(s)", options=metals_list, default=[metals_list[0]])
     else:
         selected_metals = st.multiselect("Select metal(s)", options=["Aluminium","Copper","Steel"], default=["Aluminium"])
     # route selectbox (if present in expected_cols)
-    if "route" in expected_cols and isinstance(X_train, pd.DataFrame):
-        try:
-            route_opts = X_train["route"].dropna().unique().tolist()
-            if len(route_opts) == 0:
-                route_opts = ["Primary", "Recycled"]
-        except Exception:
-            route_opts = ["Primary", "Recycled"]
+    if "route" in expected_cols and "route" in schema["categorical"]:
+        route_opts = list(schema["categorical"]["route"]["categories"]) or ["Primary", "Recycled"]
     else:
         route_opts = ["Primary", "Recycled"]
     route = st.selectbox("Route", options=route_opts)
@@ -179,10 +225,7 @@ with st.sidebar.form("input_form"):
     if numeric_defaults:
         # pick columns with most non-nulls first
         def non_null_count(col):
-            try:
-                return X_train[col].notna().sum()
-            except Exception:
-                return 0
+            return schema["non_null"].get(col, 0)
         sorted_cols = sorted(numeric_defaults.keys(), key=lambda c: (-non_null_count(c), c))
         for c in sorted_cols[:MAX_NUMERIC_CONTROLS]:
             default = numeric_defaults.get(c, 0.0)
@@ -192,7 +235,7 @@ with st.sidebar.form("input_form"):
             numeric_inputs[c] = st.number_input(c, value=float(default), format="%.6f")
 
     else:
-        # fallback generic numeric controls if X_train not a DataFrame
+        # fallback generic numeric controls if the schema has no numeric columns
         for i in range(min(MAX_NUMERIC_CONTROLS, len(expected_cols))):
             cname = f"f{i}"
             numeric_inputs[cname] = st.number_input(cname, value=0.0, format="%.6f")
@@ -216,6 +259,7 @@ recommendations_all = []
 # Prepare SHAP estimator & preprocessor once
 estimator_for_shap, preproc_for_shap = find_tree_estimator_and_preprocessor(model)
 
+inputs = []
 for metal in selected_metals:
     # build input dict
     input_dict = {}
@@ -235,7 +279,43 @@ for metal in selected_metals:
 
     if issues:
         st.warning(f"Issues for {metal}: {issues}")
+    inputs.append((metal, input_dict, df_row, issues))
+
+# SHAP for all selected metals in one batched call on the stacked rows
+shap_matrix = None
+shap_feature_names = None
+shap_failed = False
+shap_exact = None  # per row: True if exact SHAP, False if looked up in the index
+if estimator_for_shap is not None and inputs:
+    try:
+        X_rows = pd.concat([df_row for _, _, df_row, _ in inputs], ignore_index=True)
+        if preproc_for_shap is not None:
+            X_for_shap = preproc_for_shap.transform(X_rows)
+            try:
+                shap_feature_names = preproc_for_shap.get_feature_names_out()
+            except Exception:
+                shap_feature_names = [f"f{i}" for i in range(X_for_shap.shape[1])]
+        else:
+            X_for_shap = X_rows.values
+            shap_feature_names = X_rows.columns.tolist()
+
+        def exact_shap(X):
+            expl = get_tree_explainer(estimator_for_shap, model_cache_key(estimator_for_shap))
+            return expl.shap_values(X)
+
+        shap_index = get_shap_index(estimator_for_shap, model_cache_key(estimator_for_shap)) if use_shap_index else None
+        if shap_index is not None and len(shap_index.feature_names) == X_for_shap.shape[1]:
+            shap_matrix, far = shap_index.explain(X_for_shap, exact=exact_shap)
+            shap_exact = far
+        else:
+            shap_vals = exact_shap(X_for_shap)
+            if isinstance(shap_vals, list):
+                shap_vals = shap_vals[0]
+            shap_matrix = np.asarray(shap_vals).reshape(len(inputs), -1)
+    except Exception:
+        shap_failed = True
 
+for i, (metal, input_dict, df_row, issues) in enumerate(inputs):
     # prediction
     pred = np.nan
     try:
@@ -253,57 +333,54 @@ for metal in selected_metals:
     # CI estimate
     if resid_std is not None and not np.isnan(pred):
         z = 1.96
-        lower = max(0.0, pred - z * resid_std)
-        upper = min(1.0, pred + z * resid_std)
+        row_std = residual_std_for(resid_stats, input_dict)
+        lower = max(0.0, pred - z * row_std)
+        upper = min(1.0, pred + z * row_std)
     else:
         lower, upper = np.nan, np.nan
 
-    # SHAP-driven recs
-    recs_shap = []
+    # Smallest lever change reaching the target MCI
     try:
-        if estimator_for_shap is not None:
-            # prepare transformed X for SHAP
-            if preproc_for_shap is not None:
-                X_for_shap = preproc_for_shap.transform(df_row)
-                try:
-                    feature_names = preproc_for_shap.get_feature_names_out()
-                except Exception:
-                    feature_names = [f"f{i}" for i in range(X_for_shap.shape[1])]
-            else:
-                X_for_shap = df_row.values
-                feature_names = df_row.columns.tolist()
-
-            expl = shap.TreeExplainer(estimator_for_shap)
-            shap_vals = expl.shap_values(X_for_shap)
-            if isinstance(shap_vals, list):
-                shap_row = np.array(shap_vals[0]).ravel()
-            else:
-                shap_row = np.array(shap_vals).ravel()
-
-            try:
-                recs_shap = generate_recommendations(list(map(str, feature_names)), shap_row, max_recs=5)
-            except Exception:
-                # fallback: top absolute shap drivers
-                abs_idx = np.argsort(-np.abs(shap_row))[:5]
-                recs_shap = []
-                for i in abs_idx:
-                    fname = feature_names[i] if i < len(feature_names) else f"f{i}"
-                    recs_shap.append({
-                        "feature": fname,
-                        "shap": float(shap_row[i]),
-                        "message": "Driver identified by SHAP",
-                        "action": "Consider improving this parameter"
-                    })
-        else:
-            recs_shap = [{"feature": "N/A", "shap": 0.0, "message": "SHAP not available", "action": "none"}]
+        lever_base = base_row(df_row.iloc[0].to_dict(), schema)
     except Exception:
+        lever_base = None
+    opt_result = None
+    if target_mci > 0 and lever_base is not None and isinstance(model, Pipeline) and not np.isnan(pred):
+        try:
+            opt = MCIOptimizer(model.predict, expected_cols, lever_base, get_sensitivity_model())
+            opt_result = opt.optimize(target_mci)
+        except Exception:
+            opt_result = None
+
+    # SHAP-driven recs
+    recs_shap = []
+    if estimator_for_shap is None:
+        recs_shap = [{"feature": "N/A", "shap": 0.0, "message": "SHAP not available", "action": "none"}]
+    elif shap_failed:
         recs_shap = [{"feature": "N/A", "shap": 0.0, "message": "SHAP error", "action": "none"}]
+    else:
+        shap_row = shap_matrix[i]
+        feature_names = shap_feature_names
+        try:
+            recs_shap = generate_recommendations(list(map(str, feature_names)), shap_row, max_recs=5)
+        except Exception:
+            # fallback: top absolute shap drivers
+            abs_idx = np.argsort(-np.abs(shap_row))[:5]
+            recs_shap = []
+            for j in abs_idx:
+                fname = feature_names[j] if j < len(feature_names) else f"f{j}"
+                recs_shap.append({
+                    "feature": fname,
+                    "shap": float(shap_row[j]),
+                    "message": "Driver identified by SHAP",
+                    "action": "Consider improving this parameter"
+                })
 
     # Circularity AI analysis (if loaded)
     circ_result = None
     if ai is not None:
         try:
-            circ_result = ai.run_analysis(input_dict)
+            circ_result = ai.run_analysis(input_dict, peers=peer_k or None)
         except Exception:
             circ_result = None
 
@@ -315,12 +392,56 @@ for metal in selected_metals:
         "issues": issues,
         "input_row": df_row,
         "shap_recs": recs_shap,
+        "shap_indexed": shap_exact is not None and not shap_exact[i],
+        "optimization": opt_result,
+        "lever_base": lever_base,
         "circ": circ_result
     })
 
+# -------------------- what-if panel --------------------
+@st.fragment
+def what_if_panel(key, base, pred, surrogate):
+    """
+    Lever sliders scored by the surrogate. Runs as a fragment: moving a slider
+    re-runs only this panel, not the forest, SHAP and optimizer above it.
+    """
+    levers = [l for l in LEVER_BOUNDS if np.isfinite(base.get(l, np.nan))]
+    lo, hi = lever_bounds(levers)
+    values = {}
+    cols = st.columns(2)
+    for j, l in enumerate(levers):
+        step = (hi[j] - lo[j]) / 100.0
+        values[l] = cols[j % 2].slider(l, float(lo[j]), float(hi[j]), float(np.clip(base[l], lo[j], hi[j])),
+                                       step=float(step), key=f"whatif_{key}_{l}")
+    X, _ = scenario_inputs(base, {l: np.array([v]) for l, v in values.items()}, expected_cols, get_sensitivity_model())
+    y = float(surrogate.predict(X)[0])
+    st.metric("What-if MCI (surrogate)", f"{y:.4f}", delta=f"{y - pred:+.4f} vs forest prediction")
+
+    lever = st.selectbox("Response curve for", levers, key=f"whatif_{key}_curve")
+    j = levers.index(lever)
+    grid = np.linspace(lo[j], hi[j], 41)
+    sweep = {l: np.full(len(grid), v) for l, v in values.items()}
+    sweep[lever] = grid
+    Xg, _ = scenario_inputs(base, sweep, expected_cols, get_sensitivity_model())
+    st.line_chart(pd.DataFrame({"surrogate MCI": surrogate.predict(Xg)}, index=pd.Index(grid, name=lever)))
+
+    fid = surrogate.fidelity
+    if fid:
+        slider_gaps = [v for k, v in fid.items() if k.startswith("slider_mae_")]
+        st.caption(f"Surrogate vs forest on held-out rows: R² {fid.get('r2_vs_forest_test', float('nan')):.3f}, "
+                   f"MAE {fid.get('mae_vs_forest_test', float('nan')):.4f} MCI"
+                   + (f", {np.mean(slider_gaps):.4f} along lever sweeps" if slider_gaps else "")
+                   + ". The forest gives the final number.")
+    if st.button("Confirm with RandomForest", key=f"whatif_{key}_confirm"):
+        y_rf = float(model.predict(X)[0])
+        st.write(f"Forest MCI for this scenario: {y_rf:.4f} (surrogate gap {y - y_rf:+.4f})")
+
+
 # -------------------- display --------------------
+surrogate = get_surrogate(estimator_for_shap, model_cache_key(estimator_for_shap)) \
+    if isinstance(model, Pipeline) and estimator_for_shap is not None else None
 st.header("Prediction results")
-for r in results:
+for i, r in enumerate(results):
     st.subheader(f"{r['metal']}")
     st.write("Input (first 20 cols):")
     try:
@@ -336,12 +457,31 @@ for r in results:
             st.caption(f"Approx 95% CI ≈ [{r['ci_lower']:.6f}, {r['ci_upper']:.6f}] (residual-based)")
 
     st.markdown("**SHAP-driven recommendations (top drivers):**")
+    if r.get("shap_indexed"):
+        st.caption("Drivers interpolated from the nearest indexed training rows (approximate SHAP).")
     try:
         for rec in r["shap_recs"]:
             st.write(f"- **{rec.get('feature','?')}** (SHAP={rec.get('shap',0.0):.4f}): {rec.get('message','')}")
     except Exception:
         st.write("- No SHAP recommendations available.")
 
+    o = r.get("optimization")
+    if o is not None:
+        st.markdown(f"**Path to target MCI {o['target']:.2f}:** {o['status']}")
+        if o["status"] == "already met":
+            st.write("The predicted MCI already meets the target.")
+        else:
+            st.write(f"Predicted MCI {o['mci_before']:.4f} → {o['mci_after']:.4f} "
+                     f"(weighted change {o['cost']:.3f})")
+            st.write(safe_df(o["changes"]))
+            if o["status"] == "infeasible":
+                st.caption("Target not reachable within the lever bounds; closest candidate shown.")
+        st.caption(f"{o['n_evaluations']} candidates scored in {o['elapsed_s']:.2f}s")
+
+    if surrogate is not None and r["lever_base"] is not None and not math.isnan(r["predicted_MCI"]):
+        with st.expander("What-if levers (surrogate)"):
+            what_if_panel(i, r["lever_base"], r["predicted_MCI"], surrogate)
+
     # Circularity AI outputs
     if r["circ"] is not None:
         st.markdown("**Circularity AI: Baseline / Optimized / Ideal**")
@@ -376,8 +516,10 @@ for r in results:
 st.header("Diagnostics (training residuals)")
 if resid_std is not None:
     st.write(f"Residual std (train+test): {resid_std:.6f}  —  MAE: {resid_mae:.6f}")
+    hist = resid_stats["histogram"]
+    edges = np.asarray(hist["edges"])
     fig, ax = plt.subplots()
-    sns.histplot(resid, bins=40, kde=True, ax=ax)
+    ax.hist(edges[:-1], bins=edges, weights=hist["counts"])
     ax.set_title("Residuals (train+test)")
     st.pyplot(fig)
 else:
@@ -1,21 +1,295 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import os
+import pickle
+import tempfile
+
+import joblib
 import pandas as pd
 import numpy as np
 from sklearn.cluster import KMeans
+from sklearn.neighbors import KDTree
 from sklearn.preprocessing import StandardScaler
 from sklearn.pipeline import Pipeline
 from sklearn.impute import SimpleImputer
 
+from lca_dataset import dataset_content_hash, dataset_fingerprint, load_dataset
+
+ARTIFACT_VERSION = 2
+
+# Ellen MacArthur MCI: utility X = lifetime / L_avg, F(X) = 0.9 / X
+MCI_REFERENCE_LIFETIME = 15.0
+MCI_UTILITY_CONSTANT = 0.9
+VIRGIN_ROUTE_PREFIXES = ('primary', 'virgin')
+
+
+def virgin_route_mask(route):
+    """
+    Boolean array: does each route count the non-recycled input as virgin material?
+    The route column is encoded as a categorical, so the prefix test runs once per
+    distinct route rather than once per row.
+    """
+    cat = pd.Categorical(np.asarray(route, dtype=object).ravel())
+    is_virgin = np.array([str(c).lower().startswith(VIRGIN_ROUTE_PREFIXES) for c in cat.categories] + [False])
+    return is_virgin[cat.codes]   # code -1 (missing) indexes the trailing False
+
+
+def round_like_python(values, ndigits=1):
+    """
+    np.round(values, ndigits), except that values within float noise of a rounding
+    tie go through Python's correctly rounded round(), as the scalar path does
+    (np.round scales by 10**ndigits first, which can push a value across the tie).
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.round(values, ndigits)
+    scaled = values * 10.0 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        out.flat[i] = round(float(values.flat[i]), ndigits)
+    return out
+
+
+def mci_components(material_mass=1.0, lifetime=1.0, recycled_content=0.0, is_virgin=True,
+                   eol_reuse_pct=0.0, eol_recycle_pct=0.0):
+    """
+    Closed-form MCI terms for whole arrays at once (arguments broadcast together):
+    virgin mass V, unrecoverable waste W, linear flow index LFI = (V + W) / 2M,
+    utility factor F = 0.9 / (lifetime / 15), MCI_raw = 1 - LFI * F and MCI clipped
+    to [0, 1]. Same arithmetic as `CircularityAIRefactored.calculate_mci_score`
+    (M <= 0 gives LFI = 1, lifetime <= 0 gives X = 1).
+    """
+    m, life, rc, virgin, reuse, recycle = np.broadcast_arrays(
+        np.asarray(material_mass, dtype=float), np.asarray(lifetime, dtype=float),
+        np.asarray(recycled_content, dtype=float), np.asarray(is_virgin, dtype=bool),
+        np.asarray(eol_reuse_pct, dtype=float), np.asarray(eol_recycle_pct, dtype=float))
+    virgin_mass = np.where(virgin, m * (1 - rc), 0.0)
+    unrecoverable_waste = m * (1 - (reuse + recycle) / 100.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lfi = np.where(m > 0, (virgin_mass + unrecoverable_waste) / (2 * m), 1.0)
+        utility = np.where(life > 0, life / MCI_REFERENCE_LIFETIME, 1.0)
+        f = np.where(utility > 0, MCI_UTILITY_CONSTANT / utility, 100.0)
+    mci_raw = 1 - lfi * f
+    return {
+        'virgin_mass': virgin_mass,
+        'unrecoverable_waste': unrecoverable_waste,
+        'LFI': lfi,
+        'F': f,
+        'MCI_raw': mci_raw,
+        'MCI': np.clip(mci_raw, 0.0, 1.0),
+    }
+
+
+class BenchmarkProfile:
+    """
+    Dataset-level arrays used to score rows against the ideal case.
+    Fitted once per dataset; scoring never needs the raw DataFrame again.
+    """
+
+    def __init__(self, features, ideal, medians, ranges, good_mask, bad_mask, ideal_row):
+        self.features = list(features)
+        self.ideal = np.asarray(ideal, dtype=float)
+        self.medians = np.asarray(medians, dtype=float)
+        self.ranges = np.asarray(ranges, dtype=float)
+        self.good_mask = np.asarray(good_mask, dtype=bool)
+        self.bad_mask = np.asarray(bad_mask, dtype=bool)
+        self.ideal_row = dict(ideal_row)
+
+    @classmethod
+    def from_frame(cls, df, all_features, numeric_medians, categorical_modes, good_params, bad_params):
+        features = [c for c in all_features if c in numeric_medians.index]
+        ideal_row = {}
+        for col in all_features:
+            if col in numeric_medians.index:
+                ideal_row[col] = float(numeric_medians[col])
+            else:
+                ideal_row[col] = categorical_modes.get(col, np.nan)
+        for g in good_params:
+            if g in df.columns:
+                ideal_row[g] = float(df[g].max())
+        for b in bad_params:
+            if b in df.columns:
+                ideal_row[b] = float(df[b].min())
+        if 'material_mass_kg' in all_features and 'material_mass_kg' in ideal_row:
+            ideal_row['material_mass_kg'] = float(numeric_medians.get('material_mass_kg', 1))
+        col_max = df[features].max()
+        col_min = df[features].min()
+        return cls(
+            features=features,
+            ideal=[ideal_row[c] for c in features],
+            medians=numeric_medians[features].to_numpy(dtype=float),
+            ranges=[float(col_max[c] - col_min[c]) or 1.0 for c in features],
+            good_mask=[c in good_params for c in features],
+            bad_mask=[c in bad_params for c in features],
+            ideal_row=ideal_row
+        )
+
+    def score(self, values):
+        """Mean closeness to the ideal case for each row of an (n_rows, n_features) matrix."""
+        values = np.asarray(values, dtype=float)
+        if values.shape[1] == 0:
+            return np.zeros(values.shape[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            good = np.where(self.ideal > 0, np.minimum(1.0, values / self.ideal), 0.0)
+            bad = np.where(values > 0, np.minimum(1.0, self.ideal / values), 0.0)
+        other = 1.0 - np.minimum(1.0, np.abs(values - self.medians) / self.ranges)
+        scores = np.where(self.good_mask, good, np.where(self.bad_mask, bad, other))
+        return scores.mean(axis=1)
+
+    def to_dict(self):
+        """Plain (JSON-serializable) representation."""
+        return {
+            'features': self.features,
+            'ideal': self.ideal.tolist(),
+            'medians': self.medians.tolist(),
+            'ranges': self.ranges.tolist(),
+            'good_mask': self.good_mask.tolist(),
+            'bad_mask': self.bad_mask.tolist(),
+            'ideal_row': {k: (v.item() if isinstance(v, np.generic) else v) for k, v in self.ideal_row.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class PeerIndex:
+    """
+    Nearest-peer lookup: one KD-tree per (material, route) group over the numeric
+    features standardized with the clustering imputer/scaler, with the raw values of
+    the benchmark parameters kept next to the points.
+
+    Rows added later go to a per-group buffer that is searched by brute force and
+    merged into that group's tree once it outgrows `rebuild_frac` of the tree, so an
+    update only ever rebuilds the groups it touches.
+    """
+
+    def __init__(self, features, value_cols, key_cols, fill, mean, scale, rebuild_frac=0.1, min_rebuild=1000):
+        self.features = list(features)
+        self.value_cols = list(value_cols)
+        self.key_cols = list(key_cols)
+        self.fill = np.asarray(fill, dtype=float)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.rebuild_frac = rebuild_frac
+        self.min_rebuild = min_rebuild
+        self.groups = {}   # key -> {'points', 'values', 'tree', 'new_points', 'new_values'}
+
+    @classmethod
+    def from_frame(cls, df, features, value_cols, key_cols, imputer, scaler):
+        index = cls(features, value_cols, key_cols, imputer.statistics_, scaler.mean_, scaler.scale_)
+        return index.add(df)
+
+    @property
+    def n_rows(self):
+        return sum(len(g['points']) + len(g['new_points']) for g in self.groups.values())
+
+    def _standardize(self, X):
+        X = np.asarray(X, dtype=float)
+        return ((np.where(np.isnan(X), self.fill, X) - self.mean) / self.scale).astype(np.float32)
+
+    def _frame_arrays(self, frame):
+        values = frame.reindex(columns=self.features).apply(pd.to_numeric, errors='coerce')
+        Z = self._standardize(values.to_numpy(dtype=float))
+        keys = list(zip(*[frame[c].astype(str) if c in frame.columns else [''] * len(frame)
+                          for c in self.key_cols])) if self.key_cols else [()] * len(frame)
+        return Z, keys
+
+    @staticmethod
+    def _rows_by_key(keys):
+        rows = {}
+        for i, key in enumerate(keys):
+            rows.setdefault(key, []).append(i)
+        return {key: np.asarray(r) for key, r in rows.items()}
+
+    def _rebuild(self, group):
+        group['points'] = np.concatenate([group['points'], group['new_points']])
+        group['values'] = np.concatenate([group['values'], group['new_values']])
+        group['new_points'] = group['new_points'][:0]
+        group['new_values'] = group['new_values'][:0]
+        group['tree'] = KDTree(group['points'])
+
+    def add(self, frame):
+        """Add the rows of `frame` (numeric features, value and key columns); rebuilds only the groups that overflow."""
+        Z, keys = self._frame_arrays(frame)
+        V = frame.reindex(columns=self.value_cols).to_numpy(dtype=float)
+        for key, rows in self._rows_by_key(keys).items():
+            group = self.groups.get(key)
+            if group is None:
+                empty_z, empty_v = Z[:0], V[:0]
+                group = self.groups[key] = {'points': empty_z, 'values': empty_v, 'tree': None,
+                                            'new_points': Z[rows], 'new_values': V[rows]}
+                self._rebuild(group)
+                continue
+            group['new_points'] = np.concatenate([group['new_points'], Z[rows]])
+            group['new_values'] = np.concatenate([group['new_values'], V[rows]])
+            if len(group['new_points']) > max(self.min_rebuild, self.rebuild_frac * len(group['points'])):
+                self._rebuild(group)
+        return self
+
+    def _candidates(self, key):
+        """Groups searched for `key`: its own, else those sharing the first key (material), else all."""
+        if key in self.groups:
+            return [key]
+        same = [g for g in self.groups if key and g and g[0] == key[0]]
+        return same or list(self.groups)
+
+    def _query(self, Z, keys, k):
+        means = np.full((len(Z), len(self.value_cols)), np.nan)
+        distance = np.full(len(Z), np.nan)
+        for key, rows in self._rows_by_key(keys).items():
+            dists, values = [], []
+            for g in (self.groups[c] for c in self._candidates(key)):
+                if len(g['points']):
+                    d, i = g['tree'].query(Z[rows], k=min(k, len(g['points'])))
+                    dists.append(d)
+                    values.append(g['values'][i])
+                if len(g['new_points']):
+                    d = np.sqrt(((Z[rows, None, :] - g['new_points'][None, :, :]) ** 2).sum(axis=2))
+                    i = np.argsort(d, axis=1)[:, :k]
+                    dists.append(np.take_along_axis(d, i, axis=1))
+                    values.append(g['new_values'][i])
+            if not dists:
+                continue
+            d, v = np.concatenate(dists, axis=1), np.concatenate(values, axis=1)
+            if d.shape[1] > k:
+                top = np.argpartition(d, k - 1, axis=1)[:, :k]
+                d, v = np.take_along_axis(d, top, axis=1), np.take_along_axis(v, top[:, :, None], axis=1)
+            means[rows] = v.mean(axis=1)
+            distance[rows] = d.mean(axis=1)
+        return means, distance
+
+    def query(self, frame, k=25):
+        """(peer means of `value_cols` (n_rows, n_values), mean peer distance) for every row of `frame`."""
+        Z, keys = self._frame_arrays(frame)
+        return self._query(Z, keys, k)
+
+    def query_row(self, row, k=25):
+        """`query` for one dict row, without building a DataFrame: (Series of peer means, mean distance)."""
+        # coerce like _align_batch: unparseable values become NaN (imputed in _standardize)
+        values = np.array([row.get(c, np.nan) for c in self.features], dtype=object)
+        x = pd.to_numeric(values, errors='coerce').astype(float).reshape(1, -1)
+        key = tuple(str(row.get(c, '')) for c in self.key_cols)
+        means, distance = self._query(self._standardize(x), [key], k)
+        return pd.Series(means[0], index=self.value_cols), float(distance[0])
+
+
 class CircularityAIRefactored:
     """
     Circularity AI module (clean version without LightGBM).
     """
 
-    def __init__(self, csv_path):
+    # fitted state persisted by save()/load()
+    _STATE_ATTRS = (
+        'csv_path', 'dataset_hash', 'n_rows', 'features', 'all_features',
+        'numeric_medians', 'categorical_modes', 'global_means', 'global_medians',
+        'cluster_imputer', 'cluster_scaler', 'kmeans', 'cluster_benchmarks', 'peer_index'
+    )
+
+    def __init__(self, csv_path=None, n_clusters=5):
         self.csv_path = csv_path
-        self.df = pd.read_csv(csv_path)
+        self.n_clusters = n_clusters
+        self.df = None
 
         self.good_params = [
             'recycled_content_frac',
@@ -29,10 +303,8 @@ class CircularityAIRefactored:
             'transport_distance_km'
         ]
         self.targets = ['emissions_kgCO2e_per_kg', 'MCI_percent', 'MCI']
-        self.features = [c for c in self.df.columns if c not in self.targets + ['cluster']]
-
-        self._compute_fill_values()
-        self._build_clusters(n_clusters=5)
+        self.peer_keys = ['material', 'route']
+        self.peer_index = None
 
         self.recommendation_templates = {
             'energy_MJ_per_kg': "Your energy expenditure is higher than peers. Improve equipment and install VSDs.",
@@ -44,6 +316,80 @@ class CircularityAIRefactored:
             'renewable_electricity_frac': "Low renewable electricity use. Consider PPAs or on-site solar."
         }
 
+        if csv_path is not None:
+            self.fit(csv_path)
+
+    def fit(self, csv_path=None):
+        """Read the dataset and fit fill values, clusters and the benchmark profile."""
+        self.csv_path = csv_path or self.csv_path
+        self.df = load_dataset(self.csv_path)
+        self.dataset_hash = self.df.attrs.get('sha256') or dataset_content_hash(self.csv_path)
+        self.n_rows = len(self.df)
+        self.features = [c for c in self.df.columns if c not in self.targets + ['cluster']]
+
+        self._compute_fill_values()
+        self._build_clusters(n_clusters=self.n_clusters)
+        self._build_peers()
+        self.benchmark_profile = BenchmarkProfile.from_frame(
+            self.df, self.all_features, self.numeric_medians, self.categorical_modes,
+            self.good_params, self.bad_params
+        )
+        return self
+
+    def save(self, path):
+        """Persist the fitted state (no raw data) to a compressed joblib artifact."""
+        state = {attr: getattr(self, attr) for attr in self._STATE_ATTRS}
+        state['n_clusters'] = self.n_clusters
+        state['benchmark_profile'] = self.benchmark_profile.to_dict()
+        state['artifact_version'] = ARTIFACT_VERSION
+        # write a private temp file and rename it over `path`, so concurrent workers
+        # saving the same artifact never leave (or read) a partial file
+        fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                   dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                joblib.dump(state, f, compress=3)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return path
+
+    @classmethod
+    def load(cls, path, csv_path=None):
+        """
+        Restore a fitted instance saved with `save`.
+        If `csv_path` is given, raises ValueError when the dataset content no longer
+        matches the hash the artifact was fitted on.
+        """
+        state = joblib.load(path)
+        if state.get('artifact_version') != ARTIFACT_VERSION:
+            raise ValueError(f"{path}: unsupported artifact version {state.get('artifact_version')}")
+        if csv_path is not None and dataset_fingerprint(csv_path) != state['dataset_hash']:
+            raise ValueError(f"{path} is stale: {csv_path} changed since it was fitted")
+        ai = cls(n_clusters=state['n_clusters'])
+        for attr in cls._STATE_ATTRS:
+            setattr(ai, attr, state[attr])
+        ai.benchmark_profile = BenchmarkProfile.from_dict(state['benchmark_profile'])
+        return ai
+
+    @classmethod
+    def load_or_fit(cls, csv_path, artifact_path):
+        """Load `artifact_path` if it matches `csv_path`, otherwise refit and re-save it."""
+        try:
+            return cls.load(artifact_path, csv_path=csv_path)
+        except (OSError, ValueError, KeyError, EOFError, AttributeError, pickle.UnpicklingError):
+            pass   # missing, stale, truncated or corrupt artifact: refit below
+        ai = cls(csv_path)
+        try:
+            ai.save(artifact_path)
+        except OSError:
+            pass
+        return ai
+
     def _compute_fill_values(self):
         numeric_cols = self.df.select_dtypes(include=[np.number]).columns.tolist()
         object_cols = self.df.select_dtypes(include=['object', 'category']).columns.tolist()
@@ -70,10 +416,10 @@ class CircularityAIRefactored:
 
     def _build_clusters(self, n_clusters=5):
         numeric_features = [c for c in self.all_features if c in self.numeric_medians.index]
-        imputer = SimpleImputer(strategy='median')
-        scaler = StandardScaler()
-        Xnum = imputer.fit_transform(self.df[numeric_features])
-        Xnum = scaler.fit_transform(Xnum)
+        self.cluster_imputer = SimpleImputer(strategy='median')
+        self.cluster_scaler = StandardScaler()
+        Xnum = self.cluster_imputer.fit_transform(self.df[numeric_features])
+        Xnum = self.cluster_scaler.fit_transform(Xnum)
         self.kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10).fit(Xnum)
         self.df['cluster'] = self.kmeans.predict(Xnum)
         self.cluster_benchmarks = {}
@@ -85,11 +431,35 @@ class CircularityAIRefactored:
                 'counts': len(cluster_df)
             }
 
+    def _build_peers(self):
+        """KD-tree peer index on the same standardized features as the clusters."""
+        numeric_features = [c for c in self.all_features if c in self.numeric_medians.index]
+        value_cols = [p for p in (self.bad_params + self.good_params) if p in numeric_features]
+        key_cols = [c for c in self.peer_keys if c in self.df.columns]
+        self.peer_index = PeerIndex.from_frame(self.df, numeric_features, value_cols, key_cols,
+                                               self.cluster_imputer, self.cluster_scaler)
+
+    def add_rows(self, frame):
+        """
+        Fold new dataset rows into the peer index without refitting (only the
+        (material, route) groups they fall in are touched). Fill values, clusters and
+        the benchmark profile stay as fitted.
+        """
+        aligned = self._align_batch(frame)
+        self.peer_index.add(aligned)
+        self.n_rows += len(frame)
+        return self
+
+    def peer_benchmark(self, user_row, k=25):
+        """Means of the benchmark parameters over the k nearest records with the same material and route."""
+        return self.peer_index.query_row(user_row, k=k)[0]
+
     def calculate_mci_score(self, user_data):
         material_mass = float(user_data.get('material_mass_kg', 1))
         lifespan = float(user_data.get('product_lifetime_years', 1))
         recycled_content = float(user_data.get('recycled_content_frac', 0))
-        route = str(user_data.get('route', 'Primary')).lower()
+        route = user_data.get('route', 'Primary')
+        route = 'primary' if pd.isna(route) else str(route).lower()   # a missing route reads as 'Primary'
         virgin_mass = 0
         if route.startswith('primary') or route.startswith('virgin'):
             virgin_mass = material_mass * (1 - recycled_content)
@@ -104,40 +474,12 @@ class CircularityAIRefactored:
         return round(mci_score, 1)
 
     def _ideal_case_row(self):
-        ideal = {}
-        for col in self.all_features:
-            if col in self.numeric_medians.index:
-                ideal[col] = float(self.numeric_medians[col])
-            else:
-                ideal[col] = self.categorical_modes.get(col, np.nan)
-        for g in self.good_params:
-            if g in self.df.columns:
-                ideal[g] = float(self.df[g].max())
-        for b in self.bad_params:
-            if b in self.df.columns:
-                ideal[b] = float(self.df[b].min())
-        if 'material_mass_kg' in self.all_features and 'material_mass_kg' in ideal:
-            ideal['material_mass_kg'] = float(self.numeric_medians.get('material_mass_kg', 1))
-        return ideal
+        return dict(self.benchmark_profile.ideal_row)
 
     def _score_against_ideal(self, feature_row):
-        ideal = self._ideal_case_row()
-        closeness = []
-        for col in self.all_features:
-            if col not in self.numeric_medians.index:
-                continue
-            val = float(feature_row.get(col, self.numeric_medians[col]))
-            ideal_val = float(ideal.get(col, self.numeric_medians[col]))
-            if col in self.good_params:
-                score = min(1.0, val / ideal_val) if ideal_val > 0 else 0.0
-            elif col in self.bad_params:
-                score = min(1.0, ideal_val / val) if val > 0 else 0.0
-            else:
-                med = float(self.numeric_medians[col])
-                rng = float(self.df[col].max() - self.df[col].min()) or 1.0
-                score = 1.0 - min(1.0, abs(val - med) / rng)
-            closeness.append(score)
-        return float(np.mean(closeness)) if closeness else 0.0
+        profile = self.benchmark_profile
+        values = [[float(feature_row.get(col, med)) for col, med in zip(profile.features, profile.medians)]]
+        return float(profile.score(values)[0])
 
     def _optimize_user_row(self, user_row):
         optimized = user_row.copy()
@@ -149,10 +491,17 @@ class CircularityAIRefactored:
                 optimized[b] = float(self.global_medians[b])
         return optimized
 
-    def generate_recommendations(self, user_row, cluster_id=None):
+    def generate_recommendations(self, user_row, cluster_id=None, peers=None):
+        """
+        Compare `user_row` with a benchmark: the mean of its `peers` nearest records
+        (same material and route) when given, else its cluster's means, else the
+        global means.
+        """
         recs = []
         bench = self.global_means
-        if cluster_id is not None and cluster_id in self.cluster_benchmarks:
+        if peers and self.peer_index is not None:
+            bench = self.peer_benchmark(user_row, k=peers).dropna()
+        elif cluster_id is not None and cluster_id in self.cluster_benchmarks:
             bench = self.cluster_benchmarks[cluster_id]['means']
         for p in (self.bad_params + self.good_params):
             if p in user_row and p in bench:
@@ -164,7 +513,127 @@ class CircularityAIRefactored:
                     recs.append(self.recommendation_templates.get(p, f"{p}: below peer average."))
         return recs
 
-    def run_analysis(self, user_input):
+    def _align_batch(self, frame):
+        """Column-wise equivalent of `_align_user_input` for a whole DataFrame."""
+        aligned = {}
+        for col in self.all_features:
+            if col in self.numeric_medians.index:
+                fill = self.numeric_medians[col]
+                if col in frame.columns:
+                    aligned[col] = pd.to_numeric(frame[col], errors='coerce').fillna(fill)
+                else:
+                    aligned[col] = pd.Series(fill, index=frame.index, dtype=float)
+            elif col in frame.columns:
+                aligned[col] = frame[col]
+            else:
+                aligned[col] = pd.Series(self.categorical_modes.get(col, np.nan), index=frame.index)
+        return pd.DataFrame(aligned, index=frame.index)[self.all_features]
+
+    def mci_components(self, frame):
+        """
+        `mci_components` for every row of `frame`, reading the same columns (and
+        defaults) as `calculate_mci_score`. Returns a DataFrame with one column per term.
+        """
+        def column(name, default):
+            if name in frame.columns:
+                return frame[name].to_numpy(dtype=float)
+            return np.full(len(frame), float(default))
+
+        if 'route' in frame.columns:
+            # a missing route reads as the scalar default, 'Primary'
+            route = frame['route'].astype(object).where(frame['route'].notna(), 'Primary')
+        else:
+            route = np.full(len(frame), 'Primary', dtype=object)
+        terms = mci_components(
+            material_mass=column('material_mass_kg', 1),
+            lifetime=column('product_lifetime_years', 1),
+            recycled_content=column('recycled_content_frac', 0),
+            is_virgin=virgin_route_mask(route),
+            eol_reuse_pct=column('eol_reuse_pct', 0),
+            eol_recycle_pct=column('eol_recycle_pct', 0),
+        )
+        return pd.DataFrame(terms, index=frame.index)
+
+    def calculate_mci_scores(self, frame):
+        """Vectorized `calculate_mci_score` for every row of `frame` (MCI in percent, rounded to 0.1)."""
+        return round_like_python(np.clip(self.mci_components(frame)['MCI_raw'].to_numpy() * 100, 0, 100), 1)
+
+    def run_analysis_batch(self, frame, peers=None):
+        """
+        Score every row of `frame` in one vectorized pass.
+        Returns a DataFrame (same index as `frame`) with the numbers `run_analysis`
+        produces per row: cluster id, baseline/optimized/ideal MCI, composite and
+        efficiency, plus the list of recommendations (against the `peers` nearest
+        records when given, as in `run_analysis`).
+        """
+        aligned = self._align_batch(frame)
+        profile = self.benchmark_profile
+        numeric_features = profile.features
+        values = aligned[numeric_features].to_numpy(dtype=float)
+
+        cluster_ids = pd.array([pd.NA] * len(aligned), dtype='Int64')
+        try:
+            cluster_ids = pd.array(self.kmeans.predict(values), dtype='Int64')
+        except Exception:
+            pass
+
+        ideal = self._ideal_case_row()
+        ideal_comp = float(profile.score(profile.ideal[np.newaxis, :])[0])
+        ideal_mci = self.calculate_mci_score(ideal)
+        denom = ideal_comp if ideal_comp > 0 else 1.0
+
+        baseline_comp = profile.score(values)
+        baseline_mci = self.calculate_mci_scores(aligned)
+
+        optimized = aligned.copy()
+        for params, better in ((self.good_params, np.greater), (self.bad_params, np.less)):
+            for p in params:
+                if p in optimized.columns and p in self.global_medians.index:
+                    med = float(self.global_medians[p])
+                    col = optimized[p].to_numpy(dtype=float)
+                    optimized[p] = np.where(better(med, col), med, col)
+        optimized_comp = profile.score(optimized[numeric_features].to_numpy(dtype=float))
+        optimized_mci = self.calculate_mci_scores(optimized)
+
+        # recommendations: compare against the cluster means when available, else global means
+        rec_params = [p for p in (self.bad_params + self.good_params)
+                      if p in aligned.columns and p in self.global_means.index]
+        bench = np.tile(self.global_means[rec_params].to_numpy(dtype=float), (len(aligned), 1))
+        for cid, b in self.cluster_benchmarks.items():
+            mask = (cluster_ids == cid).to_numpy(dtype=bool, na_value=False)
+            if mask.any():
+                bench[mask] = b['means'].reindex(rec_params).to_numpy(dtype=float)
+        if peers and self.peer_index is not None:
+            peer_means, _ = self.peer_index.query(aligned, k=peers)
+            peer_means = pd.DataFrame(peer_means, columns=self.peer_index.value_cols, index=aligned.index)
+            # as in generate_recommendations: peers replace the cluster benchmark outright,
+            # and a parameter without a peer mean (NaN) is not compared
+            bench = peer_means.reindex(columns=rec_params).to_numpy(dtype=float)
+        user_vals = aligned[rec_params].to_numpy(dtype=float)
+        is_bad = np.array([p in self.bad_params for p in rec_params])
+        flags = np.where(is_bad, user_vals > bench, user_vals < bench)
+        messages = [
+            self.recommendation_templates.get(
+                p, f"{p}: above peer average." if p in self.bad_params else f"{p}: below peer average.")
+            for p in rec_params
+        ]
+        recs = [[messages[j] for j in np.flatnonzero(row)] for row in flags]
+
+        return pd.DataFrame({
+            'cluster_id': cluster_ids,
+            'baseline_mci': baseline_mci,
+            'baseline_composite': np.round(baseline_comp, 3),
+            'baseline_efficiency_pct': np.round(100.0 * baseline_comp / denom, 1),
+            'optimized_mci': optimized_mci,
+            'optimized_composite': np.round(optimized_comp, 3),
+            'optimized_efficiency_pct': np.round(100.0 * optimized_comp / denom, 1),
+            'ideal_mci': ideal_mci,
+            'ideal_composite': round(ideal_comp, 3),
+            'recommendations': recs
+        }, index=aligned.index)
+
+    def run_analysis(self, user_input, peers=None):
+        """Baseline/optimized/ideal scores and recommendations (against the `peers` nearest records if given)."""
         aligned = self._align_user_input(user_input).iloc[0].to_dict()
         numeric_features = [c for c in self.all_features if c in self.numeric_medians.index]
         cluster_id = None
@@ -189,7 +658,7 @@ class CircularityAIRefactored:
         efficiency_baseline_pct = round(100.0 * baseline_comp / (ideal_comp if ideal_comp > 0 else 1.0), 1)
         efficiency_optimized_pct = round(100.0 * optimized_comp / (ideal_comp if ideal_comp > 0 else 1.0), 1)
 
-        recs = self.generate_recommendations(aligned, cluster_id=cluster_id)
+        recs = self.generate_recommendations(aligned, cluster_id=cluster_id, peers=peers)
 
         result = {
             'cluster_id': cluster_id,
@@ -0,0 +1,235 @@
+# lca_batch_score.py
+"""
+Headless batch scoring of CSV/Parquet inventories with the trained pipeline.
+
+    python lca_batch_score.py inventory.csv scored.parquet --shap-top-k 5 --circularity
+
+The input is streamed in chunks; each chunk is aligned/validated, predicted with
+model_rf.pkl, given residual-based CIs and (optionally) top-k SHAP drivers and
+Circularity AI outputs, then appended to the output file. Memory is bounded by
+--chunksize x --n-jobs rows.
+
+With --flat-model (a directory written by model/step11_export_forest.py) the workers
+predict with the memory-mapped FlatForest: all worker processes share one copy of
+the tree arrays and model_rf.pkl is only unpickled when SHAP drivers are requested.
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+
+from lca_forest_export import FlatForest
+from lca_input_utils import (NUMERIC_RANGES, expected_columns, iter_input_chunks, sanitize_and_validate_frame,
+                             single_threaded)
+from lca_residuals import load_residual_stats, residual_std_array, RESIDUALS_PATH
+
+CIRCULARITY_ARTIFACT = "circularity_ai.pkl"
+CIRCULARITY_DATA = "LCA_multi_metal_with_MCI.csv"
+
+# per-process scoring state, filled by _init_worker
+_STATE = {}
+
+
+# -------------------- io --------------------
+class ChunkWriter:
+    """Append DataFrame chunks to a CSV or Parquet file as they are produced."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = path.lower().endswith((".parquet", ".pq"))
+        self._writer = None
+        self._header = True
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# -------------------- model helpers --------------------
+def split_pipeline(model):
+    """Return (preprocessor_or_None, final_estimator) for a Pipeline or bare estimator."""
+    if isinstance(model, Pipeline) and len(model.steps) > 1:
+        return model[:-1], model[-1]
+    if isinstance(model, Pipeline):
+        return None, model[-1]
+    return None, model
+
+
+def numeric_columns(model, expected_cols):
+    """Columns the preprocessor scales as numeric ('num' transformer), else NUMERIC_RANGES keys."""
+    preproc, _ = split_pipeline(model)
+    if preproc is not None:
+        for step in preproc.named_steps.values():
+            if isinstance(step, ColumnTransformer):
+                for name, _, cols in step.transformers_:
+                    if name == "num":
+                        return list(cols)
+    return [c for c in expected_cols if c in NUMERIC_RANGES]
+
+
+# -------------------- scoring --------------------
+def top_shap_drivers(shap_vals, names, k):
+    """Top-k |SHAP| drivers per row: (feature-name matrix, value matrix), both (n_rows, k)."""
+    shap_vals = np.asarray(shap_vals)
+    top = np.argsort(-np.abs(shap_vals), axis=1)[:, :k]
+    return np.asarray(names, dtype=object)[top], np.take_along_axis(shap_vals, top, axis=1)
+
+
+def _init_worker(config):
+    _STATE.clear()
+    _STATE["config"] = config
+    model = None
+    if not config.get("flat_model") or config["shap_top_k"] > 0:
+        model = joblib.load(config["model"])
+        if config["single_thread"]:
+            single_threaded(model)
+    if config.get("flat_model"):
+        flat = FlatForest.load(config["flat_model"], mmap_mode="r")
+        _STATE["predict"] = flat.predict
+        _STATE["expected_cols"] = flat.columns
+        _STATE["numeric_cols"] = flat.num_cols
+    else:
+        _STATE["predict"] = model.predict
+        _STATE["expected_cols"] = expected_columns(model)
+        _STATE["numeric_cols"] = numeric_columns(model, _STATE["expected_cols"])
+    try:
+        _STATE["resid_stats"] = load_residual_stats(config["residuals"])
+    except Exception:
+        _STATE["resid_stats"] = None
+    if config["shap_top_k"] > 0:
+        import shap
+        preproc, est = split_pipeline(model)
+        _STATE["shap_preproc"] = preproc
+        _STATE["explainer"] = shap.TreeExplainer(est)
+        try:
+            _STATE["shap_names"] = np.asarray(preproc.get_feature_names_out(), dtype=object)
+        except Exception:
+            _STATE["shap_names"] = None
+    if config["circularity"]:
+        from circularity_ai_refactor import CircularityAIRefactored
+        _STATE["ai"] = CircularityAIRefactored.load_or_fit(config["circularity_data"], config["circularity_artifact"])
+
+
+def score_chunk(chunk):
+    """Score one input chunk; returns the chunk with prediction columns appended."""
+    config = _STATE["config"]
+    X, found = sanitize_and_validate_frame(chunk, _STATE["expected_cols"], _STATE["numeric_cols"])
+    issues = found["messages"].map("; ".join).to_numpy()
+
+    out = chunk.reset_index(drop=True)
+    pred = _STATE["predict"](X)
+    out["predicted_MCI"] = pred
+    if _STATE["resid_stats"] is not None:
+        half_width = config["z"] * residual_std_array(_STATE["resid_stats"], X)
+        out["ci_lower"] = np.maximum(0.0, pred - half_width)
+        out["ci_upper"] = np.minimum(1.0, pred + half_width)
+    out["issues"] = issues
+
+    k = config["shap_top_k"]
+    if k > 0:
+        preproc = _STATE["shap_preproc"]
+        Xt = preproc.transform(X) if preproc is not None else X.to_numpy(dtype=float)
+        shap_vals = _STATE["explainer"].shap_values(Xt)
+        if isinstance(shap_vals, list):
+            shap_vals = shap_vals[0]
+        shap_vals = np.asarray(shap_vals)
+        names = _STATE["shap_names"]
+        if names is None:
+            names = np.array([f"f{i}" for i in range(shap_vals.shape[1])], dtype=object)
+        top_names, top_vals = top_shap_drivers(shap_vals, names, k)
+        for j in range(top_names.shape[1]):
+            out[f"shap_top{j + 1}_feature"] = top_names[:, j]
+            out[f"shap_top{j + 1}_value"] = top_vals[:, j]
+
+    if config["circularity"]:
+        circ = _STATE["ai"].run_analysis_batch(chunk.reset_index(drop=True))
+        circ["recommendations"] = circ["recommendations"].map("; ".join)
+        out = pd.concat([out, circ.add_prefix("circ_")], axis=1)
+    return out
+
+
+# -------------------- driver --------------------
+def run(config, input_path, output_path, chunksize=50000, n_jobs=1):
+    writer = ChunkWriter(output_path)
+    n_rows = 0
+    t0 = time.time()
+    try:
+        if n_jobs <= 1:
+            _init_worker(config)
+            for chunk in iter_input_chunks(input_path, chunksize):
+                writer.write(score_chunk(chunk))
+                n_rows += len(chunk)
+        else:
+            config = dict(config, single_thread=True)
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(config,)) as pool:
+                pending = deque()
+                for chunk in iter_input_chunks(input_path, chunksize):
+                    pending.append(pool.submit(score_chunk, chunk))
+                    n_rows += len(chunk)
+                    # keep at most 2 chunks per worker in flight; write in input order
+                    while len(pending) >= 2 * n_jobs:
+                        writer.write(pending.popleft().result())
+                while pending:
+                    writer.write(pending.popleft().result())
+    finally:
+        writer.close()
+    elapsed = time.time() - t0
+    print(f"Scored {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/s) -> {output_path}")
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-score an LCA inventory (CSV/Parquet) with the trained MCI model.")
+    parser.add_argument("input", help="input .csv or .parquet")
+    parser.add_argument("output", help="output .csv or .parquet (written incrementally)")
+    parser.add_argument("--model", default="model_rf.pkl")
+    parser.add_argument("--flat-model", default=None,
+                        help="predict with a memory-mapped FlatForest directory (see step11_export_forest.py)")
+    parser.add_argument("--residuals", default=RESIDUALS_PATH)
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--n-jobs", type=int, default=1, help="worker processes (-1 = all cores)")
+    parser.add_argument("--z", type=float, default=1.96, help="CI half-width in residual std units")
+    parser.add_argument("--shap-top-k", type=int, default=0, help="add the top-k SHAP drivers per row")
+    parser.add_argument("--circularity", action="store_true", help="add Circularity AI baseline/optimized/ideal outputs")
+    parser.add_argument("--circularity-data", default=CIRCULARITY_DATA)
+    parser.add_argument("--circularity-artifact", default=CIRCULARITY_ARTIFACT)
+    args = parser.parse_args(argv)
+
+    n_jobs = (os.cpu_count() or 1) if args.n_jobs == -1 else args.n_jobs
+    config = {
+        "model": args.model,
+        "flat_model": args.flat_model,
+        "residuals": args.residuals,
+        "z": args.z,
+        "shap_top_k": args.shap_top_k,
+        "circularity": args.circularity,
+        "circularity_data": args.circularity_data,
+        "circularity_artifact": args.circularity_artifact,
+        "single_thread": False,
+    }
+    run(config, args.input, args.output, chunksize=args.chunksize, n_jobs=n_jobs)
+
+
+if __name__ == "__main__":
+    main()
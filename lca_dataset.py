@@ -0,0 +1,152 @@
+# lca_dataset.py
+"""
+Typed, cached access to the LCA dataset.
+
+    df = load_dataset("LCA_multi_metal_with_MCI.csv")
+
+The CSV is parsed once into a Parquet cache (.lca_cache/<name>.parquet) with the
+categorical columns stored as pandas categoricals. The cache is reused while the
+source file's mtime and size are unchanged; if those changed but the SHA-256 of
+the contents did not (e.g. a fresh checkout), the cache is kept and re-stamped.
+Without pyarrow the CSV is parsed directly (same dtypes, no cache).
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+DATA_PATH = "LCA_multi_metal_with_MCI.csv"
+CACHE_DIR = ".lca_cache"
+CACHE_VERSION = 1
+CATEGORICAL_COLS = ["material", "country", "route", "end_of_life_route", "transport_mode"]
+TARGET_COL = "MCI"
+# columns that leak the target (or are not useful) and never enter the model
+DROP_COLS = [
+    "MCI", "MCI_percent", "MCI_raw", "circularity_index_default",
+    "missing_data_flag", "LFI", "F", "W_kg", "V_kg", "recovered_kg", "lifespan_clipped"
+]
+
+
+def dataset_content_hash(path, chunk_size=1 << 20):
+    """SHA-256 of the file contents, used to invalidate caches and fitted artifacts."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_paths(path, cache_dir=None):
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}.parquet"), os.path.join(cache_dir, f"{stem}.meta.json")
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+
+def _replace_atomically(path, write):
+    """Call write(tmp_path) on a private temp file next to `path`, then rename it over `path`."""
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _write_meta(meta_path, meta):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+    _replace_atomically(meta_path, write)
+
+
+def _fresh_meta(path, meta_path):
+    """Cache metadata if it still describes `path` (re-stamping it after a content-neutral touch), else None."""
+    meta = _read_meta(meta_path)
+    if meta is None:
+        return None
+    stamp = _stamp(path)
+    if all(meta.get(k) == v for k, v in stamp.items()):
+        return meta
+    if meta.get("size") == stamp["size"] and meta.get("sha256") == dataset_content_hash(path):
+        meta.update(stamp)
+        try:
+            _write_meta(meta_path, meta)
+        except OSError:
+            pass
+        return meta
+    return None
+
+
+def read_csv_typed(path, categorical_cols=CATEGORICAL_COLS):
+    """Parse the CSV with the categorical columns as pandas categoricals."""
+    header = pd.read_csv(path, nrows=0).columns
+    return pd.read_csv(path, dtype={c: "category" for c in categorical_cols if c in header})
+
+
+def dataset_fingerprint(path, cache_dir=None):
+    """
+    SHA-256 of the dataset contents, taken from the cache metadata while the file's
+    mtime/size are unchanged (no re-hash of a large file on every startup).
+    """
+    meta = _fresh_meta(path, _cache_paths(path, cache_dir)[1])
+    return meta["sha256"] if meta is not None else dataset_content_hash(path)
+
+
+def load_dataset(path=DATA_PATH, cache_dir=None, use_cache=True):
+    """
+    Load the dataset as a typed DataFrame, through the Parquet cache when possible.
+    `df.attrs["sha256"]` holds the content hash of the source file.
+    """
+    if not use_cache:
+        df = read_csv_typed(path)
+        df.attrs["sha256"] = dataset_content_hash(path)
+        return df
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return load_dataset(path, use_cache=False)
+
+    parquet_path, meta_path = _cache_paths(path, cache_dir)
+    meta = _fresh_meta(path, meta_path)
+    if meta is not None and os.path.exists(parquet_path):
+        try:
+            df = pd.read_parquet(parquet_path)
+            df.attrs["sha256"] = meta["sha256"]
+            return df
+        except Exception:
+            pass   # unreadable cache: rebuild it below
+
+    stamp = _stamp(path)
+    df = read_csv_typed(path)
+    sha = dataset_content_hash(path)
+    try:
+        os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+        # concurrent builders each write their own temp file; the renames are atomic
+        _replace_atomically(parquet_path, lambda tmp: df.to_parquet(tmp, index=False))
+        _write_meta(meta_path, dict(version=CACHE_VERSION, source=os.path.abspath(path), sha256=sha,
+                                    categorical_cols=[c for c in CATEGORICAL_COLS if c in df.columns], **stamp))
+    except OSError:
+        pass   # read-only location: serve the parsed frame uncached
+    df.attrs["sha256"] = sha
+    return df
@@ -0,0 +1,250 @@
+# lca_forest_export.py
+"""
+Flat, array-backed export of the trained MCI pipeline (StandardScaler + OneHotEncoder
+ColumnTransformer followed by a RandomForest).
+
+    flat = FlatForest.from_pipeline(joblib.load("model_rf.pkl"))
+    flat.save("model_rf_flat")                       # directory of .npy files + meta.json
+    FlatForest.load("model_rf_flat").predict(df)     # arrays memory-mapped read-only
+
+The ColumnTransformer is folded into plain array indexing: numeric columns are
+standardized with the stored mean/scale (cast to float32, as sklearn's trees see
+them) and each categorical column's code indexes a row of an identity matrix to
+produce its one-hot block. All trees are stored in one set of node arrays, laid out
+so that a node's children are adjacent, and are traversed level by level for every
+(row, tree) pair at once: a prediction is a few dozen NumPy gathers.
+
+The gain is on the single-row path, where the pipeline's per-call overhead
+dominates: about 5 ms against 26-39 ms for 200 trees. For large batches, sklearn's
+compiled per-tree traversal stays ahead (1000 rows: about 65-75 ms against 50-66 ms),
+so bulk scoring that does not need the shared memory map is faster with the pickle.
+
+Arrays are saved uncompressed, one .npy per array, and loaded with mmap_mode="r":
+loading is a page-in rather than a deserialization, and every process that loads
+the same directory shares one physical copy of the tree arrays via the page cache.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+FLAT_FOREST_PATH = "model_rf_flat"
+FLAT_FOREST_VERSION = 1
+
+_META_FILE = "meta.json"
+_ARRAYS = ("mean", "scale", "roots")
+# node arrays, concatenated over all trees (global node ids)
+# (children of node i are child[i] and child[i] + 1; leaves point at themselves)
+_NODE_ARRAYS = ("child", "feature", "threshold", "missing_left", "value")
+# levels between retiring the paths that already reached a leaf
+_COMPACT_EVERY = 3
+
+
+def _unwrap(step):
+    """A single-step Pipeline (e.g. Pipeline([("scaler", StandardScaler())])) -> its step."""
+    while isinstance(step, Pipeline) and len(step.steps) == 1:
+        step = step.steps[0][1]
+    return step
+
+
+def _find_column_transformer(model):
+    """Split a fitted Pipeline into (ColumnTransformer, forest); only that layout is supported."""
+    if not isinstance(model, Pipeline):
+        raise ValueError("expected a fitted Pipeline(preprocessor, forest)")
+    pre = [_unwrap(s) for _, s in model.steps[:-1] if s not in (None, "passthrough")]
+    if len(pre) != 1 or not isinstance(pre[0], ColumnTransformer):
+        raise ValueError("expected exactly one ColumnTransformer before the forest")
+    forest = model.steps[-1][1]
+    if not hasattr(forest, "estimators_"):
+        raise ValueError(f"unsupported final estimator: {type(forest).__name__}")
+    return pre[0], forest
+
+
+class FlatForest:
+    """Tree ensemble stored as flat node arrays, with the column preprocessing folded in."""
+
+    def __init__(self, num_cols, mean, scale, cat_cols, categories, roots, max_depth, **nodes):
+        self.num_cols = list(num_cols)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.cat_cols = list(cat_cols)
+        self.categories = [np.asarray(c, dtype=object) for c in categories]
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.max_depth = int(max_depth)
+        for name in _NODE_ARRAYS:
+            setattr(self, name, nodes[name])
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.child)
+
+    @property
+    def n_features(self):
+        return len(self.num_cols) + sum(len(c) for c in self.categories)
+
+    @property
+    def columns(self):
+        """Input columns, in the order the ColumnTransformer reads them."""
+        return self.num_cols + self.cat_cols
+
+    # -------------------- export --------------------
+    @classmethod
+    def from_pipeline(cls, model):
+        ct, forest = _find_column_transformer(model)
+
+        # transformed feature index -> position in the encoded matrix (numeric block, then one-hot blocks)
+        num_cols, means, scales, cat_cols, categories = [], [], [], [], []
+        feature_slots = []
+        for name, trans, cols in ct.transformers_:
+            if trans == "drop" or len(cols) == 0:
+                continue
+            trans = _unwrap(trans)
+            if trans == "passthrough" or isinstance(trans, StandardScaler):
+                n = len(cols)
+                if isinstance(trans, StandardScaler):
+                    means.append(trans.mean_ if trans.with_mean else np.zeros(n))
+                    scales.append(trans.scale_ if trans.with_std else np.ones(n))
+                else:
+                    means.append(np.zeros(n))
+                    scales.append(np.ones(n))
+                feature_slots += [("num", len(num_cols) + i) for i in range(n)]
+                num_cols += list(cols)
+            elif isinstance(trans, OneHotEncoder):
+                if trans.drop_idx_ is not None or trans.max_categories is not None or trans.min_frequency is not None:
+                    raise ValueError("OneHotEncoder with drop/infrequent categories is not supported")
+                for col, cats in zip(cols, trans.categories_):
+                    start = sum(len(c) for c in categories)
+                    feature_slots += [("cat", start + k) for k in range(len(cats))]
+                    cat_cols.append(col)
+                    categories.append(cats)
+            else:
+                raise ValueError(f"unsupported transformer '{name}': {type(trans).__name__}")
+        n_num = len(num_cols)
+        position = np.array([i if kind == "num" else n_num + i for kind, i in feature_slots], dtype=np.int32)
+
+        roots, parts, offset = [], {name: [] for name in _NODE_ARRAYS}, 0
+        for est in forest.estimators_:
+            t = est.tree_
+            # breadth-first relabelling: the two children of a node get consecutive ids
+            order = [0]
+            for i in order:
+                if t.children_left[i] != -1:
+                    order += [t.children_left[i], t.children_right[i]]
+            order = np.asarray(order)
+            new_id = np.empty(t.node_count, dtype=np.int64)
+            new_id[order] = np.arange(t.node_count)
+            leaf = t.children_left[order] == -1
+            # leaves point at themselves and always test "left", so traversal can run
+            # a fixed number of levels
+            child = np.where(leaf, np.arange(t.node_count), new_id[t.children_left[order]])
+            parts["child"].append((child + offset).astype(np.int32))
+            parts["feature"].append(np.where(leaf, 0, position[np.where(leaf, 0, t.feature[order])]).astype(np.int32))
+            parts["threshold"].append(np.where(leaf, np.inf, t.threshold[order]).astype(np.float64))
+            missing = getattr(t, "missing_go_to_left", None)
+            missing = np.zeros(t.node_count, dtype=bool) if missing is None else missing[order].astype(bool)
+            parts["missing_left"].append(missing | leaf)
+            parts["value"].append(t.value[order, 0, 0].astype(np.float64))
+            roots.append(offset)
+            offset += t.node_count
+        nodes = {name: np.concatenate(arrs) for name, arrs in parts.items()}
+        max_depth = max(est.tree_.max_depth for est in forest.estimators_)
+
+        return cls(num_cols, np.concatenate(means) if means else np.zeros(0),
+                   np.concatenate(scales) if scales else np.ones(0),
+                   cat_cols, categories, roots, max_depth, **nodes)
+
+    # -------------------- prediction --------------------
+    def encode(self, X):
+        """
+        Dense (n_rows, n_features) float64 matrix as the trees see it: standardized
+        numeric values (rounded to float32) followed by one one-hot block per
+        categorical column (all zeros for categories unseen at fit time).
+        """
+        if not isinstance(X, pd.DataFrame):
+            X = pd.DataFrame(X, columns=self.columns)
+        Z = np.empty((len(X), self.n_features), dtype=np.float64)
+        n_num = len(self.num_cols)
+        if n_num:
+            num = X[self.num_cols].to_numpy(dtype=np.float64)
+            Z[:, :n_num] = ((num - self.mean) / self.scale).astype(np.float32)
+        start = n_num
+        for col, cats in zip(self.cat_cols, self.categories):
+            codes = pd.Categorical(X[col].to_numpy(dtype=object), categories=cats).codes
+            # code -1 (unseen / missing) picks the extra all-zero row
+            Z[:, start:start + len(cats)] = np.eye(len(cats) + 1)[codes, :len(cats)]
+            start += len(cats)
+        return Z
+
+    def leaves(self, Z):
+        """Leaf node id reached by every (tree, row): shape (n_trees, n_rows)."""
+        n_rows, n_features = Z.shape
+        # tree-major, so consecutive gathers stay within one tree's nodes
+        node = np.repeat(self.roots, n_rows)
+        row_offset = np.tile(np.arange(n_rows, dtype=np.int64) * n_features, self.n_trees)
+        pair = np.arange(node.size)
+        leaf = node.copy()
+        flat = Z.ravel()
+        has_nan = bool(np.isnan(Z).any())
+        for level in range(self.max_depth):
+            v = flat[row_offset + self.feature[node]]
+            go_right = v > self.threshold[node]
+            if has_nan:
+                go_right = np.where(np.isnan(v), ~self.missing_left[node], go_right)
+            node = self.child[node] + go_right
+            # every few levels, retire the (tree, row) pairs that reached a leaf so the
+            # deeper levels only walk the paths still descending
+            if level % _COMPACT_EVERY == _COMPACT_EVERY - 1:
+                done = self.child[node] == node
+                if done.any():
+                    leaf[pair[done]] = node[done]
+                    active = ~done
+                    node, row_offset, pair = node[active], row_offset[active], pair[active]
+                    if not node.size:
+                        break
+        leaf[pair] = node
+        return leaf.reshape(self.n_trees, n_rows)
+
+    def predict(self, X):
+        # summed tree by tree, then divided: the same arithmetic as the forest's predict
+        return self.value[self.leaves(self.encode(X))].sum(axis=0) / self.n_trees
+
+    # -------------------- persistence --------------------
+    def _meta(self):
+        return {
+            "version": FLAT_FOREST_VERSION,
+            "num_cols": self.num_cols,
+            "cat_cols": self.cat_cols,
+            "categories": [c.tolist() for c in self.categories],
+            "max_depth": self.max_depth,
+        }
+
+    def save(self, path=FLAT_FOREST_PATH):
+        """Write `path/` with one uncompressed .npy per array (mmap-able) and meta.json."""
+        os.makedirs(path, exist_ok=True)
+        for name in _ARRAYS + _NODE_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)), allow_pickle=False)
+        with open(os.path.join(path, _META_FILE), "w") as f:
+            json.dump(self._meta(), f)
+        return path
+
+    @classmethod
+    def load(cls, path=FLAT_FOREST_PATH, mmap_mode="r"):
+        """Load a saved directory; with mmap_mode="r" the arrays are read-only views of the files."""
+        with open(os.path.join(path, _META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("version") != FLAT_FOREST_VERSION:
+            raise ValueError(f"{path}: flat forest version {meta.get('version')} != {FLAT_FOREST_VERSION}")
+        # np.asarray drops the memmap subclass (cheaper indexing) but keeps the mapping
+        arrays = {name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False))
+                  for name in _ARRAYS + _NODE_ARRAYS}
+        nodes = {name: arrays[name] for name in _NODE_ARRAYS}
+        return cls(meta["num_cols"], arrays["mean"], arrays["scale"], meta["cat_cols"], meta["categories"],
+                   arrays["roots"], meta["max_depth"], **nodes)
@@ -0,0 +1,161 @@
+# lca_incremental.py
+"""
+Incremental ("append") updates of the trained MCI pipeline.
+
+New rows extend the OneHotEncoder vocabularies; the existing trees are
+re-expressed in the new feature space (one-hot features re-indexed by name) and
+new trees are grown on the new rows with warm_start. No existing tree is refit.
+
+The scaler feeding the trees is kept as fitted by default: trees are invariant to
+re-centering/re-scaling, while re-expressing every threshold in a new scaling is
+only approximate (inputs are rounded to float32 before the comparison, and raw
+values that differ by float noise can stop being separable), which moves some
+predictions. `rescale=True` does it anyway, mapping thresholds through the
+old and new scaling; up-to-date moments are kept in the feature schema either way.
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.tree._tree import Tree
+
+from lca_forest_export import _find_column_transformer, _unwrap
+
+
+def _named(ct, kind):
+    """(name, fitted transformer, columns) of the first transformer of type `kind`, else None."""
+    for name, trans, cols in ct.transformers_:
+        if isinstance(_unwrap(trans), kind):
+            return name, _unwrap(trans), list(cols)
+    return None
+
+
+def update_preprocessor(ct, X_new, rescale=False):
+    """
+    Fitted copy of ColumnTransformer `ct` whose one-hot vocabularies are extended
+    with categories first seen in `X_new`, and, with `rescale`, whose scaler
+    statistics include `X_new` (StandardScaler.partial_fit on the stored moments).
+    Returns (new_ct, added) with added = {column: [new categories]}.
+    """
+    new_ct = clone(ct)
+    added = {}
+    enc = _named(ct, OneHotEncoder)
+    if enc is not None:
+        name, encoder, cols = enc
+        categories = []
+        for col, old in zip(cols, encoder.categories_):
+            seen = set(old.tolist())
+            new = sorted({v for v in X_new[col].dropna().tolist() if v not in seen}, key=str)
+            if new:
+                added[col] = new
+            categories.append(np.array(sorted(seen | set(new), key=str), dtype=old.dtype))
+        new_ct.set_params(**{f"{name}__categories": categories})
+    new_ct.fit(X_new)
+
+    scaler = _named(ct, StandardScaler)
+    if scaler is not None:
+        _, old_scaler, cols = scaler
+        merged = copy.deepcopy(old_scaler)
+        if rescale:
+            merged.partial_fit(X_new[cols])
+        _named(new_ct, StandardScaler)[1].__dict__.update(merged.__dict__)
+    return new_ct, added
+
+
+def _feature_affine_map(old_ct, new_ct):
+    """
+    For every old transformed feature: (new index, a, b) such that the new value is
+    a * old value + b (a=1, b=0 for anything that is not re-scaled).
+    """
+    old_names = list(old_ct.get_feature_names_out())
+    index = {n: i for i, n in enumerate(new_ct.get_feature_names_out())}
+    missing = [n for n in old_names if n not in index]
+    if missing:
+        raise ValueError(f"features dropped by the update: {missing[:5]}")
+    feature_map = np.array([index[n] for n in old_names], dtype=np.intp)
+    a = np.ones(len(old_names))
+    b = np.zeros(len(old_names))
+    old_scaler, new_scaler = _named(old_ct, StandardScaler), _named(new_ct, StandardScaler)
+    if old_scaler is not None and new_scaler is not None:
+        name, s0, _ = old_scaler
+        s1 = new_scaler[1]
+        m0 = s0.mean_ if s0.with_mean else 0.0
+        m1 = s1.mean_ if s1.with_mean else 0.0
+        sc0 = s0.scale_ if s0.with_std else 1.0
+        sc1 = s1.scale_ if s1.with_std else 1.0
+        # x_new = (x - m1) / sc1 = x_old * sc0 / sc1 + (m0 - m1) / sc1
+        sl = old_ct.output_indices_[name]
+        a[sl] = sc0 / sc1
+        b[sl] = (m0 - m1) / sc1
+    return feature_map, a, b, len(index)
+
+
+def _map_threshold(t, a, b):
+    """
+    Map split thresholds through x_new = a * x_old + b. Trees compare float32 inputs,
+    so a split really separates float32 values <= f (the largest float32 <= t) from
+    larger ones; map the edge of f's rounding cell and round it to float32 the same
+    way the rescaled inputs will be.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    f = t.astype(np.float32)
+    f = np.where(f > t, np.nextafter(f, np.float32(-np.inf)), f)
+    edge = f.astype(np.float64) + (np.nextafter(f, np.float32(np.inf)).astype(np.float64) - f) / 2.0
+    mapped = (edge * a + b).astype(np.float32).astype(np.float64)
+    return np.where((a == 1.0) & (b == 0.0), t, mapped)
+
+
+def remap_forest(forest, old_ct, new_ct):
+    """Rewrite every tree of `forest` (in place) from `old_ct`'s feature space to `new_ct`'s."""
+    feature_map, a, b, n_features = _feature_affine_map(old_ct, new_ct)
+    for est in forest.estimators_:
+        state = est.tree_.__getstate__()
+        nodes = state["nodes"].copy()
+        internal = nodes["left_child"] != -1
+        f = nodes["feature"][internal]
+        nodes["threshold"][internal] = _map_threshold(nodes["threshold"][internal], a[f], b[f])
+        nodes["feature"][internal] = feature_map[f]
+        tree = Tree(n_features, np.ones(est.n_outputs_, dtype=np.intp), est.n_outputs_)
+        tree.__setstate__(dict(state, nodes=nodes))
+        est.tree_ = tree
+        est.n_features_in_ = n_features
+    forest.n_features_in_ = n_features
+    return forest
+
+
+def grow_forest(forest, Xt, y, n_new_trees, max_trees=None):
+    """Add `n_new_trees` trees fitted on (Xt, y); keep only the newest `max_trees` if given."""
+    forest.set_params(warm_start=True, n_estimators=len(forest.estimators_) + n_new_trees)
+    forest.fit(Xt, y)
+    forest.set_params(warm_start=False)
+    if max_trees is not None and len(forest.estimators_) > max_trees:
+        forest.estimators_ = forest.estimators_[-max_trees:]
+        forest.set_params(n_estimators=max_trees)
+    return forest
+
+
+def append_update(model, X_new, y_new, n_new_trees=20, X_replay=None, y_replay=None, max_trees=None,
+                  rescale=False):
+    """
+    Update a fitted Pipeline(ColumnTransformer, forest) with new rows; returns
+    (updated model, added categories). The new trees are fitted on the new rows plus
+    the optional replay sample of earlier data, so they do not only see the latest batch.
+    """
+    old_ct, _ = _find_column_transformer(model)
+    model = copy.deepcopy(model)
+    _, forest = _find_column_transformer(model)
+    new_ct, added = update_preprocessor(old_ct, X_new, rescale=rescale)
+    remap_forest(forest, old_ct, new_ct)
+
+    X_fit, y_fit = X_new, np.ravel(y_new)
+    if X_replay is not None and len(X_replay):
+        X_fit = pd.concat([X_new, X_replay[X_new.columns]], ignore_index=True)
+        y_fit = np.concatenate([y_fit, np.ravel(y_replay)])
+    grow_forest(forest, new_ct.transform(X_fit), y_fit, n_new_trees, max_trees=max_trees)
+
+    for i, (name, step) in enumerate(model.steps[:-1]):
+        if step not in (None, "passthrough"):
+            model.steps[i] = (name, new_ct)
+    return model, added
@@ -1,6 +1,10 @@
 # lca_input_utils.py
+import json
 import pandas as pd
 import numpy as np
+from sklearn.pipeline import Pipeline
+
+FEATURE_SCHEMA_PATH = "feature_schema.json"   # written by step3_preprocess
 
 NUMERIC_RANGES = {
     # sensible defaults; adjust to your domain
@@ -43,3 +47,245 @@ def sanitize_and_validate_row(row: dict, expected_cols: list):
     # Create DataFrame
     df = pd.DataFrame([row_copy], columns=expected_cols)
     return df, issues
+
+
+def sanitize_and_validate_frame(df: pd.DataFrame, expected_cols: list, numeric_cols: list = None):
+    """
+    Vectorized `sanitize_and_validate_row` for a whole DataFrame.
+    Reindexes to `expected_cols` (missing numeric columns become NaN, other missing
+    columns ""), coerces `numeric_cols` plus the NUMERIC_RANGES keys to float and
+    range-checks them with array masks.
+    Returns (df_out, issues) where issues is a dict with:
+      - "missing_columns": expected columns absent from `df`
+      - "unparseable" / "out_of_range" / "missing": boolean DataFrames (rows x checked columns)
+      - "violations": their element-wise OR
+      - "messages": Series of per-row message lists (empty list when the row is clean)
+    """
+    numeric_cols = [c for c in (numeric_cols or []) if c in expected_cols]
+    checked = numeric_cols + [c for c in NUMERIC_RANGES if c in expected_cols and c not in numeric_cols]
+    missing_columns = [c for c in expected_cols if c not in df.columns]
+
+    out = df.reindex(columns=expected_cols)
+    for c in missing_columns:
+        if c not in checked:
+            out[c] = ""
+
+    unparseable = pd.DataFrame(False, index=out.index, columns=checked)
+    out_of_range = pd.DataFrame(False, index=out.index, columns=checked)
+    missing = pd.DataFrame(False, index=out.index, columns=checked)
+    messages = [[] for _ in range(len(out))]
+    for c in checked:
+        raw = out[c]
+        values = pd.to_numeric(raw, errors="coerce")
+        out[c] = values
+        v = values.to_numpy(dtype=float)
+        is_nan = np.isnan(v)
+        raw_nan = raw.isna().to_numpy()
+        unparseable[c] = is_nan & ~raw_nan
+        missing[c] = raw_nan
+        for i in np.flatnonzero(is_nan & ~raw_nan):
+            messages[i].append(f"{c} could not be converted to float")
+        for i in np.flatnonzero(raw_nan):
+            messages[i].append(f"{c} is missing")
+        if c in NUMERIC_RANGES:
+            lo, hi = NUMERIC_RANGES[c]
+            bad = ~is_nan & ((v < lo) | (v > hi))
+            out_of_range[c] = bad
+            for i in np.flatnonzero(bad):
+                messages[i].append(f"{c}={v[i]} out of expected range [{lo}, {hi}]")
+
+    issues = {
+        "missing_columns": missing_columns,
+        "unparseable": unparseable,
+        "out_of_range": out_of_range,
+        "missing": missing,
+        "violations": unparseable | out_of_range | missing,
+        "messages": pd.Series(messages, index=out.index, dtype=object),
+    }
+    return out, issues
+
+
+def _native(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def build_feature_schema(X: pd.DataFrame):
+    """
+    Compact description of the training features, enough to build inputs and
+    validate requests without the training data itself:
+    column order, dtypes, non-null / unique counts, numeric count/mean/std/min/max
+    and categorical vocabularies (order of first appearance) with counts.
+    """
+    schema = {
+        "columns": X.columns.tolist(),
+        "dtypes": {c: str(X[c].dtype) for c in X.columns},
+        "n_rows": int(len(X)),
+        "non_null": {c: int(X[c].notna().sum()) for c in X.columns},
+        "n_unique": {c: int(X[c].nunique(dropna=True)) for c in X.columns},
+        "numeric": {},
+        "categorical": {},
+    }
+    for c in X.columns:
+        col = X[c]
+        if pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+            v = col.dropna().to_numpy(dtype=float)
+            schema["numeric"][c] = {
+                "count": int(v.size),
+                "mean": float(v.mean()) if v.size else 0.0,
+                "std": float(v.std()) if v.size else 0.0,
+                "min": float(v.min()) if v.size else 0.0,
+                "max": float(v.max()) if v.size else 0.0,
+            }
+        else:
+            counts = col.dropna().astype(str).value_counts(sort=False)
+            order = pd.unique(col.dropna().astype(str))
+            schema["categorical"][c] = {
+                "categories": [_native(v) for v in order],
+                "counts": [int(counts[v]) for v in order],
+            }
+    return schema
+
+
+class FeatureSchemaAccumulator:
+    """
+    Builds the `build_feature_schema` output over DataFrame chunks, for data that
+    does not fit in memory. Numeric mean/std are merged per chunk (Chan et al.);
+    numeric distinct counts are exact up to `max_unique` values per column, beyond
+    which `n_unique` reports the number tracked (only "is it low-cardinality?" matters).
+    """
+
+    def __init__(self, max_unique=10000):
+        self.max_unique = max_unique
+        self.columns = None
+        self.dtypes = {}
+        self.n_rows = 0
+        self.non_null = {}
+        self.moments = {}      # numeric col -> [count, mean, M2, min, max]
+        self.uniques = {}      # numeric col -> set of seen values (capped)
+        self.counts = {}       # categorical col -> {value: count}, first-appearance order
+        self.unique_floor = {}  # numeric col -> n_unique of a seeding schema (values unknown)
+
+    @classmethod
+    def from_schema(cls, schema: dict, max_unique=10000):
+        """Continue accumulating from a saved schema (e.g. to fold in newly arrived rows)."""
+        acc = cls(max_unique=max_unique)
+        acc.columns = list(schema["columns"])
+        acc.dtypes = dict(schema["dtypes"])
+        acc.n_rows = int(schema["n_rows"])
+        acc.non_null = dict(schema["non_null"])
+        for c, st in schema["numeric"].items():
+            n = st["count"]
+            acc.moments[c] = [n, st["mean"], st["std"] ** 2 * n, st["min"] if n else np.inf, st["max"] if n else -np.inf]
+            acc.uniques[c] = set()
+            acc.unique_floor[c] = int(schema["n_unique"].get(c, 0))
+        for c, cat in schema["categorical"].items():
+            acc.counts[c] = dict(zip(cat["categories"], cat["counts"]))
+        return acc
+
+    def update(self, X: pd.DataFrame):
+        if self.columns is None:
+            self.columns = X.columns.tolist()
+            self.dtypes = {c: str(X[c].dtype) for c in self.columns}
+            for c in self.columns:
+                self.non_null[c] = 0
+                if pd.api.types.is_numeric_dtype(X[c]) and not pd.api.types.is_bool_dtype(X[c]):
+                    self.moments[c] = [0, 0.0, 0.0, np.inf, -np.inf]
+                    self.uniques[c] = set()
+                else:
+                    self.counts[c] = {}
+        self.n_rows += len(X)
+        for c in self.columns:
+            col = X[c]
+            self.non_null[c] += int(col.notna().sum())
+            if c in self.moments:
+                v = pd.to_numeric(col, errors="coerce").dropna().to_numpy(dtype=float)
+                if v.size:
+                    n, mean, m2, lo, hi = self.moments[c]
+                    n_b, mean_b = v.size, float(v.mean())
+                    delta = mean_b - mean
+                    total = n + n_b
+                    self.moments[c] = [
+                        total,
+                        mean + delta * n_b / total,
+                        m2 + float(((v - mean_b) ** 2).sum()) + delta ** 2 * n * n_b / total,
+                        min(lo, float(v.min())),
+                        max(hi, float(v.max())),
+                    ]
+                    seen = self.uniques[c]
+                    if len(seen) < self.max_unique:
+                        seen.update(np.unique(v)[: self.max_unique - len(seen)].tolist())
+            else:
+                values = col.dropna().astype(str)
+                counts = values.value_counts(sort=False)
+                acc = self.counts[c]
+                for v in pd.unique(values):
+                    acc[v] = acc.get(v, 0) + int(counts[v])
+        return self
+
+    def result(self):
+        schema = {
+            "columns": list(self.columns or []),
+            "dtypes": dict(self.dtypes),
+            "n_rows": int(self.n_rows),
+            "non_null": dict(self.non_null),
+            "n_unique": {},
+            "numeric": {},
+            "categorical": {},
+        }
+        for c in schema["columns"]:
+            if c in self.moments:
+                n, mean, m2, lo, hi = self.moments[c]
+                # after from_schema only a lower bound: the earlier values are not kept
+                schema["n_unique"][c] = max(len(self.uniques[c]), self.unique_floor.get(c, 0))
+                schema["numeric"][c] = {
+                    "count": int(n),
+                    "mean": float(mean) if n else 0.0,
+                    "std": float(np.sqrt(m2 / n)) if n else 0.0,
+                    "min": float(lo) if n else 0.0,
+                    "max": float(hi) if n else 0.0,
+                }
+            else:
+                acc = self.counts[c]
+                schema["n_unique"][c] = len(acc)
+                schema["categorical"][c] = {
+                    "categories": [_native(v) for v in acc],
+                    "counts": list(acc.values()),
+                }
+        return schema
+
+
+def save_feature_schema(schema: dict, path: str = FEATURE_SCHEMA_PATH):
+    with open(path, "w") as f:
+        json.dump(schema, f, indent=2)
+    return path
+
+
+def load_feature_schema(path: str = FEATURE_SCHEMA_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def expected_columns(model, schema_path: str = FEATURE_SCHEMA_PATH):
+    """Input columns of the fitted pipeline, else those recorded in the feature schema."""
+    cols = getattr(model, "feature_names_in_", None)
+    if cols is not None:
+        return list(cols)
+    return load_feature_schema(schema_path)["columns"]
+
+
+def single_threaded(model):
+    """Avoid nested parallelism: one worker process per core, one thread per worker."""
+    for est in (model.named_steps.values() if isinstance(model, Pipeline) else [model]):
+        if hasattr(est, "n_jobs"):
+            est.n_jobs = 1
+    return model
+
+
+def iter_input_chunks(path: str, chunksize: int):
+    """Yield DataFrame chunks of at most `chunksize` rows from a CSV or Parquet file."""
+    if path.lower().endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
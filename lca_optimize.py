@@ -0,0 +1,211 @@
+# lca_optimize.py
+"""
+Smallest lever change that brings a product to a target MCI.
+
+    python lca_optimize.py --row 6 --target 0.5
+    python lca_optimize.py --input product.csv --target 0.6 --weights transport_distance_km=3
+
+The controllable levers are those of lca_scenarios (LEVER_BOUNDS, tightened by
+NUMERIC_RANGES where both define a bound). The cost of a change is
+sum_j w_j * |x_j - x0_j| / (hi_j - lo_j), and the constraint is a predicted MCI of
+at least the target. The forest is piecewise constant, so the search is
+gradient-free and works on batches of candidates:
+  1. a global batch of single-lever moves and uniform samples of the box,
+  2. a line search from the base row towards the cheapest feasible candidates,
+  3. rounds of coordinate pull-backs towards the base row plus Gaussian steps of
+     shrinking width around the incumbent,
+  4. resetting levers whose change turns out not to be needed.
+Every batch is one predict call, and predictions are cached per candidate, so
+repeated candidates are never re-scored.
+"""
+import argparse
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from lca_dataset import DATA_PATH, load_dataset
+from lca_input_utils import NUMERIC_RANGES, FEATURE_SCHEMA_PATH, expected_columns, load_feature_schema
+from lca_scenarios import LEVER_BOUNDS, SensitivityModel, base_row, formula_mci, scenario_inputs
+
+
+def lever_bounds(levers):
+    """(lo, hi) arrays: LEVER_BOUNDS intersected with NUMERIC_RANGES."""
+    lo, hi = [], []
+    for name in levers:
+        a, b = LEVER_BOUNDS[name]
+        if name in NUMERIC_RANGES:
+            a, b = max(a, NUMERIC_RANGES[name][0]), min(b, NUMERIC_RANGES[name][1])
+        lo.append(a)
+        hi.append(b)
+    return np.array(lo, dtype=float), np.array(hi, dtype=float)
+
+
+class MCIOptimizer:
+    """
+    Batched pattern search for the cheapest lever change reaching a target MCI.
+
+        opt = MCIOptimizer(model.predict, expected_columns(model), base_row(row), sensitivity)
+        result = opt.optimize(target=0.5)
+    """
+
+    def __init__(self, predict, columns, base, sensitivity, levers=None, weights=None, objective="model"):
+        self.predict = predict
+        self.columns = list(columns)
+        self.base = dict(base)
+        self.sensitivity = sensitivity
+        self.levers = [l for l in (levers or LEVER_BOUNDS) if l in self.base]
+        self.lo, self.hi = lever_bounds(self.levers)
+        self.span = np.where(self.hi > self.lo, self.hi - self.lo, 1.0)
+        self.weights = np.array([float((weights or {}).get(l, 1.0)) for l in self.levers])
+        self.x0 = np.array([float(self.base[l]) for l in self.levers])
+        self.objective = objective
+        self.cache = {}
+        self.n_evaluations = 0
+
+    def cost(self, X):
+        return (np.abs(np.atleast_2d(X) - self.x0) / self.span * self.weights).sum(axis=1)
+
+    def _levers(self, X):
+        return {l: X[:, j] for j, l in enumerate(self.levers)}
+
+    def evaluate(self, X):
+        """MCI of every candidate row of X (n, n_levers); only candidates not seen before are scored."""
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        keys = [row.tobytes() for row in np.round(X, 9)]
+        todo = {}
+        for i, key in enumerate(keys):
+            if key not in self.cache and key not in todo:
+                todo[key] = i
+        if todo:
+            rows = X[list(todo.values())]
+            if self.objective == "formula":
+                y = formula_mci(self.base, self._levers(rows))
+            else:
+                inputs, _ = scenario_inputs(self.base, self._levers(rows), self.columns, self.sensitivity)
+                y = self.predict(inputs)
+            self.cache.update(zip(todo, np.asarray(y, dtype=float)))
+            self.n_evaluations += len(todo)
+        return np.array([self.cache[k] for k in keys])
+
+    def _clip(self, X):
+        return np.clip(X, self.lo, self.hi)
+
+    def _improve(self, X, target, best, best_cost):
+        """Best feasible candidate of X if it is cheaper than the incumbent."""
+        X = self._clip(X)
+        y = self.evaluate(X)
+        c = self.cost(X)
+        ok = (y >= target) & (c < best_cost)
+        if ok.any():
+            i = np.flatnonzero(ok)[np.argmin(c[ok])]
+            return X[i], c[i], True
+        return best, best_cost, False
+
+    def optimize(self, target, n_samples=512, rounds=8, levels=9, seed=0):
+        t0 = time.perf_counter()
+        rng = np.random.default_rng(seed)
+        d = len(self.levers)
+        y0 = float(self.evaluate(self.x0[None, :])[0])
+        if y0 >= target:
+            return self._result(target, y0, self.x0, y0, "already met", t0)
+
+        # 1. global batch: each lever alone over its range, plus uniform samples of the box
+        single = np.repeat(self.x0[None, :], d * levels, axis=0)
+        for j in range(d):
+            single[j * levels:(j + 1) * levels, j] = np.linspace(self.lo[j], self.hi[j], levels)
+        box = self.lo + rng.random((n_samples, d)) * (self.hi - self.lo)
+        X = self._clip(np.vstack([single, box, self.x0 + 0.5 * (box - self.x0)]))
+        y = self.evaluate(X)
+        feasible = y >= target
+        if not feasible.any():
+            i = int(np.argmax(y))
+            return self._result(target, y0, X[i], float(y[i]), "infeasible", t0)
+        c = self.cost(X)
+        order = np.flatnonzero(feasible)[np.argsort(c[feasible])]
+        best, best_cost = X[order[0]], c[order[0]]
+
+        # 2. line search from x0 towards the cheapest feasible candidates
+        t = np.linspace(0.0, 1.0, 33)[1:, None]
+        for i in order[:5]:
+            best, best_cost, _ = self._improve(self.x0 + t * (X[i] - self.x0), target, best, best_cost)
+
+        # 3. pull single levers back towards x0, and sample around the incumbent
+        fractions = np.array([0.0, 0.25, 0.5, 0.75, 0.9])
+        sigma = 0.1
+        for _ in range(rounds):
+            pull = np.repeat(best[None, :], d * len(fractions), axis=0)
+            for j in range(d):
+                pull[j * len(fractions):(j + 1) * len(fractions), j] = self.x0[j] + fractions * (best[j] - self.x0[j])
+            local = best + sigma * self.span * rng.standard_normal((n_samples // 4, d))
+            shrink = self.x0 + rng.uniform(0.7, 1.0, (n_samples // 4, 1)) * (local - self.x0)
+            best, best_cost, _ = self._improve(np.vstack([pull, local, shrink]), target, best, best_cost)
+            sigma *= 0.6
+
+        # 4. put back, one at a time, levers whose change is not needed
+        for _ in range(d):
+            moved = np.flatnonzero(np.abs(best - self.x0) > 0)
+            if not len(moved):
+                break
+            snap = np.repeat(best[None, :], len(moved), axis=0)
+            snap[np.arange(len(moved)), moved] = self.x0[moved]
+            best, best_cost, improved = self._improve(snap, target, best, best_cost)
+            if not improved:
+                break
+        return self._result(target, y0, best, float(self.evaluate(best[None, :])[0]), "reached", t0)
+
+    def _result(self, target, y0, x, y, status, t0):
+        changes = pd.DataFrame({"lever": self.levers, "from": self.x0, "to": x, "delta": x - self.x0})
+        return {
+            "status": status,
+            "target": target,
+            "mci_before": y0,
+            "mci_after": y,
+            "cost": float(self.cost(x)[0]),
+            "levers": dict(zip(self.levers, x.tolist())),
+            "changes": changes[np.abs(changes["delta"]) > 1e-12].reset_index(drop=True),
+            "n_evaluations": self.n_evaluations,
+            "elapsed_s": time.perf_counter() - t0,
+        }
+
+
+def _parse_weight(spec):
+    name, _, w = spec.partition("=")
+    if name not in LEVER_BOUNDS:
+        raise argparse.ArgumentTypeError(f"unknown lever {name!r}; expected one of {list(LEVER_BOUNDS)}")
+    return name, float(w)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the smallest lever change that reaches a target MCI.")
+    parser.add_argument("--input", default=DATA_PATH, help="CSV holding the product row")
+    parser.add_argument("--row", type=int, default=0)
+    parser.add_argument("--target", type=float, required=True, help="target MCI (0..1)")
+    parser.add_argument("--weights", nargs="+", type=_parse_weight, default=[],
+                        help="relative cost of moving a lever, e.g. transport_distance_km=3")
+    parser.add_argument("--objective", choices=["model", "formula"], default="model",
+                        help="predicted MCI (model_rf.pkl) or the closed-form MCI")
+    parser.add_argument("--model", default="model_rf.pkl")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    df = load_dataset(DATA_PATH) if args.input == DATA_PATH else pd.read_csv(args.input)
+    try:
+        schema = load_feature_schema(FEATURE_SCHEMA_PATH)
+    except Exception:
+        schema = None
+    model = joblib.load(args.model)
+    opt = MCIOptimizer(model.predict, expected_columns(model), base_row(df.iloc[args.row].to_dict(), schema),
+                       SensitivityModel.from_frame(load_dataset(DATA_PATH) if args.input != DATA_PATH else df),
+                       weights=dict(args.weights), objective=args.objective)
+    result = opt.optimize(args.target, seed=args.seed)
+    print(f"{result['status']}: MCI {result['mci_before']:.4f} -> {result['mci_after']:.4f} "
+          f"(target {args.target}), cost {result['cost']:.4f}, "
+          f"{result['n_evaluations']} evaluations in {result['elapsed_s']:.2f}s")
+    if len(result["changes"]):
+        print(result["changes"].to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
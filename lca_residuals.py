@@ -0,0 +1,113 @@
+# lca_residuals.py
+import json
+import numpy as np
+import pandas as pd
+
+RESIDUALS_PATH = "model_rf_residuals.json"   # written next to model_rf.pkl by step4
+GROUP_COLS = ["material", "route"]
+MIN_GROUP_COUNT = 30   # strata with fewer residuals fall back to the overall spread
+
+
+def _summary(resid):
+    resid = np.asarray(resid, dtype=float)
+    return {
+        "n": int(resid.size),
+        "mean": float(resid.mean()) if resid.size else 0.0,
+        "std": float(resid.std()) if resid.size else 0.0,
+        "mae": float(np.abs(resid).mean()) if resid.size else 0.0,
+    }
+
+
+def stratum_key(values):
+    return "|".join(str(v) for v in values)
+
+
+def compute_residual_stats(y_true, y_pred, X=None, group_cols=GROUP_COLS, bins=40):
+    """
+    Summarise residuals (actual - predicted) overall and per stratum of `group_cols`.
+    Returns a JSON-serializable dict; the histogram lets the app plot residuals
+    without keeping (or recomputing) the residual vector.
+    """
+    resid = np.ravel(np.asarray(y_true, dtype=float)) - np.ravel(np.asarray(y_pred, dtype=float))
+    counts, edges = np.histogram(resid, bins=bins)
+    stats = {
+        "overall": _summary(resid),
+        "histogram": {"counts": counts.tolist(), "edges": edges.tolist()},
+        "group_cols": [],
+        "groups": {},
+    }
+    if isinstance(X, pd.DataFrame):
+        cols = [c for c in group_cols if c in X.columns]
+        if cols:
+            stats["group_cols"] = cols
+            keys = X[cols].astype(str).agg("|".join, axis=1).to_numpy()
+            for key in np.unique(keys):
+                stats["groups"][key] = _summary(resid[keys == key])
+    return stats
+
+
+def _merge_summary(a, b):
+    n = a["n"] + b["n"]
+    if n == 0:
+        return dict(a)
+    mean = (a["n"] * a["mean"] + b["n"] * b["mean"]) / n
+    second = (a["n"] * (a["std"] ** 2 + a["mean"] ** 2) + b["n"] * (b["std"] ** 2 + b["mean"] ** 2)) / n
+    return {
+        "n": int(n),
+        "mean": float(mean),
+        "std": float(np.sqrt(max(second - mean ** 2, 0.0))),
+        "mae": float((a["n"] * a["mae"] + b["n"] * b["mae"]) / n),
+    }
+
+
+def merge_residual_stats(stats, y_true, y_pred, X=None):
+    """
+    Fold new residuals into existing stats: summaries are pooled exactly, the
+    histogram keeps its bin edges (values outside land in the end bins).
+    """
+    new = compute_residual_stats(y_true, y_pred, X, group_cols=stats.get("group_cols") or GROUP_COLS)
+    resid = np.ravel(np.asarray(y_true, dtype=float)) - np.ravel(np.asarray(y_pred, dtype=float))
+    edges = np.asarray(stats["histogram"]["edges"], dtype=float)
+    counts = np.histogram(np.clip(resid, edges[0], edges[-1]), bins=edges)[0]
+    groups = dict(stats["groups"])
+    for key, summary in new["groups"].items():
+        groups[key] = _merge_summary(groups[key], summary) if key in groups else summary
+    return {
+        "overall": _merge_summary(stats["overall"], new["overall"]),
+        "histogram": {"counts": (np.asarray(stats["histogram"]["counts"]) + counts).tolist(), "edges": edges.tolist()},
+        "group_cols": stats.get("group_cols") or new["group_cols"],
+        "groups": groups,
+    }
+
+
+def save_residual_stats(stats, path=RESIDUALS_PATH):
+    with open(path, "w") as f:
+        json.dump(stats, f, indent=2)
+    return path
+
+
+def load_residual_stats(path=RESIDUALS_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def residual_std_for(stats, row=None, min_count=MIN_GROUP_COUNT):
+    """Residual std for the stratum of `row` (dict), falling back to the overall std."""
+    if row is not None and stats.get("group_cols"):
+        group = stats["groups"].get(stratum_key(row.get(c) for c in stats["group_cols"]))
+        if group is not None and group["n"] >= min_count:
+            return group["std"]
+    return stats["overall"]["std"]
+
+
+def residual_std_array(stats, frame, min_count=MIN_GROUP_COUNT):
+    """Vectorized `residual_std_for` over the rows of a DataFrame."""
+    out = np.full(len(frame), stats["overall"]["std"], dtype=float)
+    cols = stats.get("group_cols") or []
+    if not cols or not all(c in frame.columns for c in cols):
+        return out
+    keys = frame[cols].astype(str).agg("|".join, axis=1).to_numpy()
+    for key, group in stats["groups"].items():
+        if group["n"] >= min_count:
+            out[keys == key] = group["std"]
+    return out
@@ -0,0 +1,359 @@
+# lca_scenarios.py
+"""
+What-if scenario sweeps over the circularity levers of one product.
+
+    python lca_scenarios.py --row 12 --random 1000000 --n-jobs 4
+    python lca_scenarios.py --input product.csv --grid recycled_content_frac=0:1:21 eol_recycle_pct=0:100:21
+
+Scenarios (grids or random samples of LEVER_BOUNDS) are generated lazily in
+batches. Each batch is turned into model inputs, scored with the trained pipeline
+(or the memory-mapped FlatForest) and with the closed-form MCI, and reduced to its
+MCI-vs-emissions Pareto points in a worker process. Only those points come back to
+the parent, which merges them into the running frontiers. Memory is bounded by
+--batch-size x --n-jobs scenarios.
+
+Levers map onto the model's inputs as in the dataset: eol_recycle_pct is
+100 x recycled_output_kg_per_kg, electricity_grid_renewable_pct is
+100 x renewable_electricity_frac. Energy and emissions follow the levers through a
+SensitivityModel (per-material slopes on recycled content from the dataset, plus
+electricity and transport emission factors).
+"""
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from circularity_ai_refactor import mci_components, virgin_route_mask
+from lca_dataset import DATA_PATH, load_dataset
+from lca_forest_export import FlatForest
+from lca_input_utils import FEATURE_SCHEMA_PATH, expected_columns, load_feature_schema, single_threaded
+
+# sensible defaults; adjust to your domain
+LEVER_BOUNDS = {
+    "recycled_content_frac": (0.0, 1.0),
+    "renewable_electricity_frac": (0.0, 1.0),
+    "transport_distance_km": (0.0, 10000.0),
+    "eol_recycle_pct": (0.0, 100.0),
+    "product_lifetime_years": (0.5, 50.0),
+}
+ELECTRICITY_SHARE = 0.5        # share of process energy drawn as electricity
+GRID_KGCO2E_PER_MJ = 0.14      # non-renewable grid electricity (~0.5 kgCO2e/kWh)
+TRANSPORT_KGCO2E_PER_TKM = {"Truck": 0.10, "Rail": 0.03, "Ship": 0.015, "Truck+Ship": 0.05, "Air": 0.60}
+
+# per-process sweep state, filled by _init_worker
+_STATE = {}
+
+
+# -------------------- lever -> input model --------------------
+class SensitivityModel:
+    """
+    How energy and emissions per kg move with the levers, as deltas from the base row:
+    per-material least-squares slopes of energy_MJ_per_kg and emissions_kgCO2e_per_kg
+    on recycled_content_frac (primary vs secondary production), electricity emissions
+    removed by renewable share, and transport emissions by mode.
+    """
+
+    TARGETS = ("energy_MJ_per_kg", "emissions_kgCO2e_per_kg")
+
+    def __init__(self, slopes, default_slopes):
+        self.slopes = {m: dict(s) for m, s in slopes.items()}
+        self.default_slopes = dict(default_slopes)
+
+    @classmethod
+    def from_frame(cls, df, group_col="material"):
+        def fit(g):
+            x = g["recycled_content_frac"].to_numpy(dtype=float)
+            out = {}
+            for t in cls.TARGETS:
+                y = g[t].to_numpy(dtype=float)
+                ok = ~(np.isnan(x) | np.isnan(y))
+                out[t] = float(np.polyfit(x[ok], y[ok], 1)[0]) if ok.sum() > 2 and np.ptp(x[ok]) > 0 else 0.0
+            return out
+
+        slopes = {str(m): fit(g) for m, g in df.groupby(group_col)} if group_col in df.columns else {}
+        return cls(slopes, fit(df))
+
+    def apply(self, base, levers):
+        """(energy, emissions) arrays for the scenarios in `levers`, starting from `base` (a dict row)."""
+        s = self.slopes.get(str(base.get("material")), self.default_slopes)
+        n = len(next(iter(levers.values())))
+        d_rc = levers.get("recycled_content_frac", np.full(n, base["recycled_content_frac"])) - base["recycled_content_frac"]
+        energy = base["energy_MJ_per_kg"] + s["energy_MJ_per_kg"] * d_rc
+        emissions = base["emissions_kgCO2e_per_kg"] + s["emissions_kgCO2e_per_kg"] * d_rc
+        if "renewable_electricity_frac" in levers:
+            d_ren = levers["renewable_electricity_frac"] - base["renewable_electricity_frac"]
+            emissions = emissions - np.maximum(energy, 0.0) * ELECTRICITY_SHARE * GRID_KGCO2E_PER_MJ * d_ren
+        if "transport_distance_km" in levers:
+            factor = TRANSPORT_KGCO2E_PER_TKM.get(str(base.get("transport_mode")), TRANSPORT_KGCO2E_PER_TKM["Truck"])
+            emissions = emissions + factor * (levers["transport_distance_km"] - base["transport_distance_km"]) / 1000.0
+        return np.maximum(energy, 0.0), np.maximum(emissions, 0.0)
+
+
+def scenario_inputs(base, levers, columns, sensitivity):
+    """Model input frame (one row per scenario) for `levers` applied to the `base` row."""
+    n = len(next(iter(levers.values())))
+    X = pd.DataFrame({
+        c: np.asarray(levers[c], dtype=float) if c in levers
+        else np.full(n, base.get(c, np.nan), dtype=object if isinstance(base.get(c), str) else float)
+        for c in columns
+    })
+    if "eol_recycle_pct" in levers and "recycled_output_kg_per_kg" in X.columns:
+        X["recycled_output_kg_per_kg"] = levers["eol_recycle_pct"] / 100.0
+    if "renewable_electricity_frac" in levers and "electricity_grid_renewable_pct" in X.columns:
+        X["electricity_grid_renewable_pct"] = 100.0 * levers["renewable_electricity_frac"]
+    energy, emissions = sensitivity.apply(base, levers)
+    if "energy_MJ_per_kg" in X.columns:
+        X["energy_MJ_per_kg"] = energy
+    if "emissions_kgCO2e_per_kg" in X.columns:
+        X["emissions_kgCO2e_per_kg"] = emissions
+    return X, emissions
+
+
+def formula_mci(base, levers):
+    """Closed-form MCI (0..1, as `calculate_mci_score` / 100 before rounding) for every scenario."""
+    def lever(name, default):
+        return levers.get(name, np.asarray(base.get(name, default), dtype=float))
+
+    terms = mci_components(
+        material_mass=lever("material_mass_kg", 1.0),
+        lifetime=lever("product_lifetime_years", 1.0),
+        recycled_content=lever("recycled_content_frac", 0.0),
+        is_virgin=virgin_route_mask([base.get("route", "Primary")])[0],
+        eol_reuse_pct=lever("eol_reuse_pct", 0.0),
+        eol_recycle_pct=lever("eol_recycle_pct", 0.0),
+    )
+    return np.broadcast_to(terms["MCI"], (len(next(iter(levers.values()))),))
+
+
+# -------------------- scenario generators --------------------
+def grid_batches(levels, batch_size=50000):
+    """Lazily enumerate the full grid `levels` ({lever: values}) in batches of flat indices."""
+    names = list(levels)
+    values = [np.asarray(levels[n], dtype=float) for n in names]
+    shape = tuple(len(v) for v in values)
+    total = int(np.prod(shape))
+    for start in range(0, total, batch_size):
+        idx = np.unravel_index(np.arange(start, min(start + batch_size, total)), shape)
+        yield {n: v[i] for n, v, i in zip(names, values, idx)}
+
+
+def random_batches(bounds, n, batch_size=50000, seed=42):
+    """`n` uniform samples of the levers in `bounds` ({lever: (lo, hi)}), reproducible per batch."""
+    for b, start in enumerate(range(0, n, batch_size)):
+        rng = np.random.default_rng([seed, b])
+        size = min(batch_size, n - start)
+        yield {name: rng.uniform(lo, hi, size) for name, (lo, hi) in bounds.items()}
+
+
+def pareto_mask(mci, emissions):
+    """Non-dominated scenarios (higher MCI, lower emissions); one scenario is kept per duplicated point."""
+    mci, emissions = np.asarray(mci, dtype=float), np.asarray(emissions, dtype=float)
+    order = np.lexsort((-mci, emissions))   # by emissions, best MCI first among ties
+    best = np.maximum.accumulate(mci[order])
+    keep = np.empty(len(order), dtype=bool)
+    keep[:1] = True
+    keep[1:] = mci[order][1:] > best[:-1]
+    mask = np.zeros(len(mci), dtype=bool)
+    mask[order[keep]] = True
+    return mask
+
+
+def pareto_front(df, mci_col, emissions_col="emissions_kgCO2e_per_kg"):
+    front = df[pareto_mask(df[mci_col].to_numpy(), df[emissions_col].to_numpy())]
+    return front.sort_values(emissions_col).reset_index(drop=True)
+
+
+# -------------------- evaluation --------------------
+def _init_worker(config):
+    _STATE.clear()
+    _STATE["config"] = config
+    if config.get("flat_model"):
+        flat = FlatForest.load(config["flat_model"], mmap_mode="r")
+        _STATE["predict"] = flat.predict
+        _STATE["columns"] = flat.columns
+    else:
+        model = joblib.load(config["model"])
+        if config["single_thread"]:
+            single_threaded(model)
+        _STATE["predict"] = model.predict
+        _STATE["columns"] = expected_columns(model)
+
+
+def score_levers(levers):
+    """Levers, emissions, model MCI and closed-form MCI for every scenario in `levers`."""
+    config = _STATE["config"]
+    base = config["base"]
+    X, emissions = scenario_inputs(base, levers, _STATE["columns"], config["sensitivity"])
+    out = pd.DataFrame({name: np.asarray(v, dtype=float) for name, v in levers.items()})
+    out["emissions_kgCO2e_per_kg"] = emissions
+    out["mci_model"] = _STATE["predict"](X)
+    out["mci_formula"] = formula_mci(base, levers)
+    return out
+
+
+def evaluate_batch(levers):
+    """Score one batch of scenarios; returns (scored scenarios if config["keep_all"] else None, its Pareto points)."""
+    out = score_levers(levers)
+    em = out["emissions_kgCO2e_per_kg"]
+    front = out[pareto_mask(out["mci_model"], em) | pareto_mask(out["mci_formula"], em)]
+    return (out if _STATE["config"]["keep_all"] else None), front
+
+
+def run_sweep(config, batches, n_jobs=1):
+    """
+    Evaluate every batch from the `batches` iterator; returns a dict with the number
+    of scenarios, the merged Pareto points and, with config["keep_all"], every
+    scored scenario.
+    """
+    n, fronts, kept = 0, [], []
+    t0 = time.time()
+
+    def collect(result):
+        nonlocal n
+        all_rows, front = result
+        fronts.append(front)
+        if all_rows is not None:
+            kept.append(all_rows)
+        # merge as we go so the candidate set stays small
+        if len(fronts) > 16:
+            merged = pd.concat(fronts, ignore_index=True)
+            em = merged["emissions_kgCO2e_per_kg"].to_numpy()
+            keep = pareto_mask(merged["mci_model"], em) | pareto_mask(merged["mci_formula"], em)
+            fronts[:] = [merged[keep]]
+
+    if n_jobs <= 1:
+        _init_worker(config)
+        for levers in batches:
+            n += len(next(iter(levers.values())))
+            collect(evaluate_batch(levers))
+    else:
+        config = dict(config, single_thread=True)
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(config,)) as pool:
+            pending = deque()
+            for levers in batches:
+                pending.append(pool.submit(evaluate_batch, levers))
+                n += len(next(iter(levers.values())))
+                # keep at most 2 batches per worker in flight
+                while len(pending) >= 2 * n_jobs:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+
+    if not fronts:
+        raise ValueError("no scenarios to evaluate")
+    candidates = pd.concat(fronts, ignore_index=True)
+    return {
+        "n_scenarios": n,
+        "elapsed_s": time.time() - t0,
+        "pareto_model": pareto_front(candidates, "mci_model"),
+        "pareto_formula": pareto_front(candidates, "mci_formula"),
+        "all": pd.concat(kept, ignore_index=True) if kept else None,
+    }
+
+
+# -------------------- base row --------------------
+def base_row(row, schema=None):
+    """
+    Complete a product row for sweeping: numeric inputs missing from `row` take the
+    feature-schema means, eol_recycle_pct defaults to 100 x recycled_output_kg_per_kg.
+    """
+    base = dict(row)
+    for c, st in ((schema or {}).get("numeric") or {}).items():
+        if pd.isna(base.get(c, np.nan)):
+            base[c] = st["mean"]
+    for c in LEVER_BOUNDS:
+        if c in base and not pd.isna(base[c]):
+            base[c] = float(base[c])
+    if pd.isna(base.get("eol_recycle_pct", np.nan)):
+        base["eol_recycle_pct"] = 100.0 * float(base.get("recycled_output_kg_per_kg", 0.0))
+    return base
+
+
+def _parse_range(spec):
+    name, _, rng = spec.partition("=")
+    parts = [float(p) for p in rng.split(":")]
+    if name not in LEVER_BOUNDS or len(parts) not in (2, 3) or (len(parts) == 3 and int(parts[2]) < 1):
+        raise argparse.ArgumentTypeError(f"expected <lever>=lo:hi[:n] (n >= 1) with lever in {list(LEVER_BOUNDS)}, got {spec!r}")
+    return name, parts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep circularity levers for one product and report Pareto frontiers.")
+    parser.add_argument("--input", default=DATA_PATH, help="CSV/Parquet holding the product row")
+    parser.add_argument("--row", type=int, default=0, help="row of --input to sweep")
+    parser.add_argument("--grid", nargs="+", type=_parse_range, default=None,
+                        help="full grid, e.g. recycled_content_frac=0:1:21 (levers left out stay at the base value)")
+    parser.add_argument("--random", type=int, default=100000, help="uniform random scenarios (when no --grid)")
+    parser.add_argument("--bounds", nargs="+", type=_parse_range, default=[],
+                        help="override lever bounds for --random, e.g. transport_distance_km=0:2000")
+    parser.add_argument("--model", default="model_rf.pkl")
+    parser.add_argument("--flat-model", default=None, help="score with a memory-mapped FlatForest directory")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--n-jobs", type=int, default=1, help="worker processes (-1 = all cores)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep-all", default=None, help="also write every scored scenario to this CSV/Parquet")
+    parser.add_argument("--output", default="scenarios_pareto.csv")
+    args = parser.parse_args(argv)
+    if not args.grid and args.random < 1:
+        parser.error(f"--random must be at least 1, got {args.random}")
+
+    if args.input == DATA_PATH:
+        df = load_dataset(DATA_PATH)
+    elif args.input.lower().endswith((".parquet", ".pq")):
+        df = pd.read_parquet(args.input)
+    else:
+        df = pd.read_csv(args.input)
+    try:
+        schema = load_feature_schema(FEATURE_SCHEMA_PATH)
+    except Exception:
+        schema = None
+    base = base_row(df.iloc[args.row].to_dict(), schema)
+    sensitivity = SensitivityModel.from_frame(df if args.input == DATA_PATH or not os.path.exists(DATA_PATH)
+                                              else load_dataset(DATA_PATH))
+
+    if args.grid:
+        batches = grid_batches({name: np.linspace(p[0], p[1], int(p[2]) if len(p) == 3 else 11)
+                                for name, p in args.grid}, args.batch_size)
+    else:
+        bounds = dict(LEVER_BOUNDS)
+        bounds.update({name: tuple(p[:2]) for name, p in args.bounds})
+        batches = random_batches(bounds, args.random, args.batch_size, args.seed)
+
+    n_jobs = (os.cpu_count() or 1) if args.n_jobs == -1 else args.n_jobs
+    config = {
+        "model": args.model,
+        "flat_model": args.flat_model,
+        "base": base,
+        "sensitivity": sensitivity,
+        "keep_all": bool(args.keep_all),
+        "single_thread": False,
+    }
+    result = run_sweep(config, batches, n_jobs=n_jobs)
+
+    # the base row itself, for reference
+    _init_worker(config)
+    ref = score_levers({k: np.array([base[k]]) for k in LEVER_BOUNDS if k in base})
+    print("Base:", ref.iloc[0].round(4).to_dict())
+    rate = result["n_scenarios"] / max(result["elapsed_s"], 1e-9)
+    print(f"Evaluated {result['n_scenarios']} scenarios in {result['elapsed_s']:.1f}s ({rate:.0f}/s)")
+
+    fronts = pd.concat([result["pareto_model"].assign(frontier="mci_model"),
+                        result["pareto_formula"].assign(frontier="mci_formula")], ignore_index=True)
+    fronts.to_csv(args.output, index=False)
+    print(f"Pareto frontiers: {len(result['pareto_model'])} (model) / {len(result['pareto_formula'])} (formula) "
+          f"points -> {args.output}")
+    if args.keep_all:
+        from lca_batch_score import ChunkWriter
+        writer = ChunkWriter(args.keep_all)
+        writer.write(result["all"])
+        writer.close()
+        print("All scenarios ->", args.keep_all)
+
+
+if __name__ == "__main__":
+    main()
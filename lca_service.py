@@ -0,0 +1,322 @@
+# lca_service.py
+"""
+Async HTTP inference service for the MCI predictor.
+
+    python lca_service.py --port 8008
+
+Endpoints:
+  POST /predict   {"rows": [{...feature: value...}], "explain": false, "circularity": false}
+  GET  /metrics   request/batch counters and p50/p99 latency (ms)
+  GET  /health
+
+Artifacts (pipeline, residual stats, Circularity AI) are loaded once at startup.
+With --flat-model the forest is predicted from memory-mapped FlatForest arrays, so
+several service processes on one host share a single copy of the trees.
+Concurrent requests are collected into micro-batches (up to --max-batch rows or
+--max-wait-ms) so the forest and SHAP run once per batch instead of per request.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+import tornado.web
+
+from lca_forest_export import FlatForest
+from lca_batch_score import split_pipeline, numeric_columns, top_shap_drivers
+from lca_input_utils import expected_columns, sanitize_and_validate_frame
+from lca_residuals import load_residual_stats, residual_std_array, RESIDUALS_PATH
+
+CIRCULARITY_ARTIFACT = "circularity_ai.pkl"
+CIRCULARITY_DATA = "LCA_multi_metal_with_MCI.csv"
+
+
+class Predictor:
+    """Holds the loaded artifacts and scores a DataFrame of request rows."""
+
+    def __init__(self, model_path="model_rf.pkl", residuals_path=RESIDUALS_PATH,
+                 circularity_data=CIRCULARITY_DATA, circularity_artifact=CIRCULARITY_ARTIFACT,
+                 shap_top_k=5, z=1.96, flat_model=None):
+        self.model_path = model_path
+        self.shap_top_k = shap_top_k
+        self.z = z
+        self.model = None
+        self.explainer = None
+        self.shap_names = None
+        if flat_model:
+            # predictions come from the mmap'd arrays; the pickle (needed for SHAP only)
+            # is loaded on the first request that asks for explanations
+            self.flat = FlatForest.load(flat_model, mmap_mode="r")
+            self.expected_cols = self.flat.columns
+            self.numeric_cols = self.flat.num_cols
+        else:
+            self.flat = None
+            self._load_model()
+            self.expected_cols = expected_columns(self.model)
+            self.numeric_cols = numeric_columns(self.model, self.expected_cols)
+        try:
+            self.resid_stats = load_residual_stats(residuals_path)
+        except Exception:
+            self.resid_stats = None
+        try:
+            from circularity_ai_refactor import CircularityAIRefactored
+            self.ai = CircularityAIRefactored.load_or_fit(circularity_data, circularity_artifact)
+        except Exception:
+            self.ai = None
+
+    def _load_model(self):
+        self.model = joblib.load(self.model_path)
+        self.preproc, estimator = split_pipeline(self.model)
+        try:
+            import shap
+            self.explainer = shap.TreeExplainer(estimator)
+        except Exception:
+            self.explainer = None
+        try:
+            self.shap_names = self.preproc.get_feature_names_out()
+        except Exception:
+            self.shap_names = None
+
+    def predict(self, frame, explain, circularity):
+        """
+        Score `frame` (one row per request row). `explain` / `circularity` are boolean
+        arrays selecting the rows that asked for SHAP drivers / Circularity AI output.
+        Returns a list of JSON-ready dicts, one per row.
+        """
+        X, issues = sanitize_and_validate_frame(frame, self.expected_cols, self.numeric_cols)
+        pred = (self.flat or self.model).predict(X)
+        results = [{"predicted_MCI": float(p), "issues": m} for p, m in zip(pred, issues["messages"])]
+
+        if self.resid_stats is not None:
+            half_width = self.z * residual_std_array(self.resid_stats, X)
+            for r, lo, hi in zip(results, np.maximum(0.0, pred - half_width), np.minimum(1.0, pred + half_width)):
+                r["ci_lower"], r["ci_upper"] = float(lo), float(hi)
+
+        idx = np.flatnonzero(explain)
+        if len(idx) and self.model is None:
+            self._load_model()
+        if len(idx) and self.explainer is not None:
+            Xe = X.iloc[idx]
+            Xt = self.preproc.transform(Xe) if self.preproc is not None else Xe.to_numpy(dtype=float)
+            shap_vals = self.explainer.shap_values(Xt)
+            if isinstance(shap_vals, list):
+                shap_vals = shap_vals[0]
+            names = self.shap_names if self.shap_names is not None else [f"f{i}" for i in range(np.shape(shap_vals)[1])]
+            top_names, top_vals = top_shap_drivers(shap_vals, names, self.shap_top_k)
+            for i, row_names, row_vals in zip(idx, top_names, top_vals):
+                results[i]["shap_drivers"] = [{"feature": str(n), "shap": float(v)} for n, v in zip(row_names, row_vals)]
+
+        idx = np.flatnonzero(circularity)
+        if len(idx) and self.ai is not None:
+            circ = self.ai.run_analysis_batch(X.iloc[idx])
+            for i, rec in zip(idx, circ.to_dict(orient="records")):
+                rec["cluster_id"] = None if pd.isna(rec["cluster_id"]) else int(rec["cluster_id"])
+                results[i]["circularity"] = rec
+        return results
+
+
+class LatencyTracker:
+    """Rolling window of request latencies (ms)."""
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+
+    def record_request(self, latency_ms, n_rows):
+        self.latencies.append(latency_ms)
+        self.requests += 1
+        self.rows += n_rows
+
+    def record_batch(self, n_rows):
+        self.batches += 1
+        self.batch_rows += n_rows
+
+    def snapshot(self):
+        lat = np.asarray(self.latencies, dtype=float)
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "mean_batch_rows": self.batch_rows / self.batches if self.batches else 0.0,
+            "p50_ms": float(np.percentile(lat, 50)) if lat.size else None,
+            "p99_ms": float(np.percentile(lat, 99)) if lat.size else None,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects rows from concurrent requests and scores them together.
+    A batch is flushed when it reaches `max_batch` rows or `max_wait_ms` after its
+    first request arrived; prediction runs in a worker thread so the event loop
+    keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, predictor, tracker, max_batch=256, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.tracker = tracker
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, rows, explain=False, circularity=False):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((rows, explain, circularity, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            n_rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                n_rows += len(item[0])
+            await self._flush(items, loop)
+
+    def _predict(self, items):
+        frame = pd.DataFrame([row for rows, _, _, _ in items for row in rows])
+        explain = np.concatenate([np.full(len(rows), e) for rows, e, _, _ in items])
+        circularity = np.concatenate([np.full(len(rows), c) for rows, _, c, _ in items])
+        return self.predictor.predict(frame, explain, circularity)
+
+    async def _flush(self, items, loop):
+        try:
+            results = await loop.run_in_executor(self.executor, self._predict, items)
+        except Exception as e:
+            if len(items) == 1:
+                if not items[0][3].done():
+                    items[0][3].set_exception(e)
+                return
+            # one bad request must not fail its batch-mates: score each on its own
+            for item in items:
+                await self._flush([item], loop)
+            return
+        self.tracker.record_batch(sum(len(rows) for rows, _, _, _ in items))
+        start = 0
+        for rows, _, _, future in items:
+            if not future.done():
+                future.set_result(results[start:start + len(rows)])
+            start += len(rows)
+
+
+# -------------------- handlers --------------------
+class PredictHandler(tornado.web.RequestHandler):
+    def initialize(self, batcher, tracker):
+        self.batcher = batcher
+        self.tracker = tracker
+
+    async def post(self):
+        t0 = time.perf_counter()
+        rows = []
+        try:
+            try:
+                body = json.loads(self.request.body or b"{}")
+                if not isinstance(body, dict):
+                    raise ValueError("body must be a JSON object")
+                rows = body["rows"]
+                if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows) or not rows:
+                    raise ValueError("'rows' must be a non-empty list of objects")
+                explain, circularity = body.get("explain", False), body.get("circularity", False)
+                if not isinstance(explain, bool) or not isinstance(circularity, bool):
+                    raise ValueError("'explain' and 'circularity' must be true or false")
+            except (ValueError, KeyError) as e:
+                self.set_status(400)
+                self.write({"error": f"bad request: {e}"})
+                return
+            try:
+                results = await self.batcher.submit(rows, explain, circularity)
+            except Exception as e:
+                self.set_status(500)
+                self.write({"error": str(e)})
+                return
+            self.write({"predictions": results})
+        finally:
+            # failed requests count towards p50/p99 too
+            self.tracker.record_request((time.perf_counter() - t0) * 1000.0, len(rows) if isinstance(rows, list) else 0)
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def initialize(self, tracker):
+        self.tracker = tracker
+
+    def get(self):
+        self.write(self.tracker.snapshot())
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def initialize(self, predictor):
+        self.predictor = predictor
+
+    def get(self):
+        self.write({
+            "status": "ok",
+            "expected_cols": self.predictor.expected_cols,
+            "shap": self.predictor.explainer is not None,
+            "flat_model": self.predictor.flat is not None,
+            "pickle_loaded": self.predictor.model is not None,
+            "circularity": self.predictor.ai is not None,
+        })
+
+
+def make_app(predictor, max_batch=256, max_wait_ms=5.0):
+    """Build the tornado application; call from inside a running event loop."""
+    tracker = LatencyTracker()
+    batcher = MicroBatcher(predictor, tracker, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    batcher.start()
+    return tornado.web.Application([
+        (r"/predict", PredictHandler, {"batcher": batcher, "tracker": tracker}),
+        (r"/metrics", MetricsHandler, {"tracker": tracker}),
+        (r"/health", HealthHandler, {"predictor": predictor}),
+    ])
+
+
+async def serve(args):
+    predictor = Predictor(
+        model_path=args.model, residuals_path=args.residuals,
+        circularity_data=args.circularity_data, circularity_artifact=args.circularity_artifact,
+        shap_top_k=args.shap_top_k, flat_model=args.flat_model
+    )
+    app = make_app(predictor, max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    app.listen(args.port, address=args.host)
+    print(f"LCA service listening on http://{args.host}:{args.port}")
+    await asyncio.Event().wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-batching HTTP service for the MCI predictor.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8008)
+    parser.add_argument("--model", default="model_rf.pkl")
+    parser.add_argument("--flat-model", default=None, help="memory-mapped FlatForest directory for predictions")
+    parser.add_argument("--residuals", default=RESIDUALS_PATH)
+    parser.add_argument("--circularity-data", default=CIRCULARITY_DATA)
+    parser.add_argument("--circularity-artifact", default=CIRCULARITY_ARTIFACT)
+    parser.add_argument("--shap-top-k", type=int, default=5)
+    parser.add_argument("--max-batch", type=int, default=256, help="max rows per micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="max time a request waits for batch-mates")
+    asyncio.run(serve(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# lca_shap.py
+"""
+SHAP helpers for the evaluation scripts: exact TreeExplainer values split
+row-wise across a process pool, and stratified row orderings for sampled
+global importance.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# per-process explainer, filled by _init_worker
+_STATE = {}
+
+
+def _as_matrix(vals):
+    return np.asarray(vals[0] if isinstance(vals, list) else vals)
+
+
+def _init_worker(estimator):
+    import shap
+    _STATE["explainer"] = shap.TreeExplainer(estimator)
+
+
+def _shap_chunk(X):
+    return _as_matrix(_STATE["explainer"].shap_values(X))
+
+
+class ParallelTreeShap:
+    """
+    Exact TreeExplainer SHAP values computed over `n_jobs` worker processes
+    (each worker unpickles the estimator once). With n_jobs=1 it runs in-process.
+
+        with ParallelTreeShap(rf, n_jobs=4) as ps:
+            vals = ps.shap_values(X_transformed)
+    """
+
+    def __init__(self, estimator, n_jobs=1, chunks_per_job=4):
+        import shap
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else max(1, n_jobs)
+        self.chunks_per_job = chunks_per_job
+        self.explainer = shap.TreeExplainer(estimator)
+        self._pool = None
+        if self.n_jobs > 1:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker, initargs=(estimator,))
+
+    @property
+    def expected_value(self):
+        return self.explainer.expected_value
+
+    def shap_values(self, X):
+        if self._pool is None or len(X) < 2 * self.n_jobs:
+            return _as_matrix(self.explainer.shap_values(X))
+        parts = np.array_split(np.arange(len(X)), self.n_jobs * self.chunks_per_job)
+        return np.vstack(list(self._pool.map(_shap_chunk, [X[idx] for idx in parts if len(idx)])))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def stratified_order(keys, seed=42):
+    """
+    Permutation of the rows such that every prefix samples each stratum (value of
+    `keys`) in proportion to its size, so growing a sample along this order stays
+    stratified at every size.
+    """
+    keys = np.asarray(keys)
+    rng = np.random.default_rng(seed)
+    _, inv, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    by_group = np.lexsort((rng.random(len(keys)), inv))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(len(keys))
+    rank[by_group] = np.arange(len(keys)) - starts[inv[by_group]]
+    # row k of a stratum of size c is drawn at "time" (k + u) / c, u ~ U(0, 1)
+    return np.argsort((rank + rng.random(len(keys))) / counts[inv], kind="stable")
+
+
+def importance_shift(prev, curr):
+    """Largest change in any feature's share of total mean |SHAP|, relative to the top share."""
+    prev = np.asarray(prev, dtype=float) / max(np.sum(prev), 1e-12)
+    curr = np.asarray(curr, dtype=float) / max(np.sum(curr), 1e-12)
+    return float(np.max(np.abs(curr - prev)) / max(curr.max(), 1e-12))
@@ -0,0 +1,144 @@
+# lca_shap_index.py
+"""
+Precomputed SHAP lookup for serving.
+
+Exact TreeSHAP values of indexed rows are stored next to their transformed feature
+vectors in a KD-tree. A query row's attribution is the inverse-distance-weighted
+average of its k nearest indexed rows; rows farther than `radius` from every
+indexed row are handed to an exact explainer instead.
+
+    index = ShapIndex.load()
+    shap_matrix, exact = index.explain(X_transformed, exact=explainer.shap_values)
+
+Built (and measured against exact SHAP) by model/step14_build_shap_index.py.
+"""
+import hashlib
+
+import joblib
+import numpy as np
+from sklearn.neighbors import KDTree
+
+SHAP_INDEX_PATH = "shap_index.pkl"
+SHAP_INDEX_VERSION = 1
+
+
+def forest_fingerprint(forest):
+    """Hash of every tree's split features, thresholds and leaf values (identifies the fitted forest)."""
+    h = hashlib.sha256()
+    for est in getattr(forest, "estimators_", [forest]):
+        t = est.tree_
+        for arr in (t.feature, t.threshold, t.value):
+            h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def _dense(Xt):
+    return np.asarray(Xt.toarray() if hasattr(Xt, "toarray") else Xt, dtype=np.float64)
+
+
+def top_drivers(shap_matrix, k=5):
+    """Indices of the k largest |SHAP| per row, largest first: shape (n_rows, k)."""
+    a = np.abs(np.atleast_2d(shap_matrix))
+    k = min(k, a.shape[1])
+    part = np.argpartition(-a, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(a, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def driver_agreement(approx, exact, k=5):
+    """
+    How well approximate attributions reproduce the exact top-k drivers, per row
+    averaged: same top-1 driver, share of the exact top-k found in the approximate
+    top-k, and identical top-k set (order ignored).
+    """
+    a, e = top_drivers(approx, k), top_drivers(exact, k)
+    overlap = np.array([len(set(x) & set(y)) for x, y in zip(a, e)]) / a.shape[1]
+    return {
+        "top1_agreement": float(np.mean(a[:, 0] == e[:, 0])),
+        f"top{k}_overlap": float(np.mean(overlap)),
+        f"top{k}_same_set": float(np.mean(overlap == 1.0)),
+    }
+
+
+class ShapIndex:
+    """KD-tree over transformed rows with their exact SHAP values, for nearest-neighbour attribution."""
+
+    def __init__(self, points, shap_values, expected_value, feature_names, radius,
+                 fingerprint=None, k=5, power=2.0):
+        self.points = np.asarray(points, dtype=np.float32)
+        self.shap_values = np.asarray(shap_values, dtype=np.float32)
+        self.expected_value = float(expected_value)
+        self.feature_names = [str(f) for f in feature_names]
+        self.radius = float(radius)
+        self.fingerprint = fingerprint
+        self.k = int(k)
+        self.power = float(power)
+        self.tree = KDTree(self.points)
+
+    @classmethod
+    def build(cls, Xt, shap_values, expected_value, feature_names, fingerprint=None, k=5, power=2.0,
+              radius_quantile=0.95):
+        """
+        Index `Xt` (rows as the forest sees them) with their exact `shap_values`. The
+        exact-fallback radius is the `radius_quantile` quantile of the indexed rows'
+        distances to their nearest other indexed row, i.e. the index's own spacing.
+        """
+        Xt = _dense(Xt)
+        index = cls(Xt, shap_values, expected_value, feature_names, radius=np.inf,
+                    fingerprint=fingerprint, k=k, power=power)
+        if len(Xt) > 1:
+            dist, _ = index.tree.query(Xt.astype(np.float32), k=2)
+            index.radius = float(np.quantile(dist[:, 1], radius_quantile))
+        return index
+
+    @property
+    def n_rows(self):
+        return len(self.points)
+
+    def query(self, Xt):
+        """(approximate SHAP matrix, distance to the nearest indexed row) for every row of Xt."""
+        Z = _dense(Xt).astype(np.float32)
+        k = min(self.k, self.n_rows)
+        dist, idx = self.tree.query(Z, k=k)
+        w = 1.0 / np.maximum(dist, 1e-12) ** self.power
+        w[dist[:, 0] <= 1e-12] = np.eye(k)[0]   # exact hit: take that row's values
+        w /= w.sum(axis=1, keepdims=True)
+        approx = np.einsum("rk,rkf->rf", w, self.shap_values[idx])
+        return approx.astype(np.float64), dist[:, 0]
+
+    def explain(self, Xt, exact=None):
+        """
+        (SHAP matrix, is_exact mask). Rows beyond `radius` from the index get values
+        from `exact(rows)` (e.g. TreeExplainer.shap_values) when it is given.
+        """
+        approx, nearest = self.query(Xt)
+        far = nearest > self.radius
+        if exact is not None and far.any():
+            vals = exact(_dense(Xt)[far])
+            approx[far] = np.asarray(vals[0] if isinstance(vals, list) else vals).reshape(int(far.sum()), -1)
+        else:
+            far[:] = False
+        return approx, far
+
+    # -------------------- persistence --------------------
+    def save(self, path=SHAP_INDEX_PATH):
+        joblib.dump({
+            "version": SHAP_INDEX_VERSION,
+            "points": self.points,
+            "shap_values": self.shap_values,
+            "expected_value": self.expected_value,
+            "feature_names": self.feature_names,
+            "radius": self.radius,
+            "fingerprint": self.fingerprint,
+            "k": self.k,
+            "power": self.power,
+        }, path)
+        return path
+
+    @classmethod
+    def load(cls, path=SHAP_INDEX_PATH):
+        state = joblib.load(path)
+        if state.get("version") != SHAP_INDEX_VERSION:
+            raise ValueError(f"{path}: SHAP index version {state.get('version')} != {SHAP_INDEX_VERSION}")
+        state.pop("version")
+        return cls(**state)
@@ -0,0 +1,115 @@
+# lca_surrogate.py
+"""
+Monotone-constrained surrogate of the MCI forest for interactive what-ifs.
+
+    sur = Surrogate.load()
+    sur.predict(X)                                       # a few ms per call, any batch size up to ~1e3
+    sur.curve(X.iloc[[0]], "recycled_content_frac", np.linspace(0, 1, 25))
+
+A HistGradientBoostingRegressor is fitted to the forest's *predictions* (not the
+labels) on the training rows plus rows with the levers resampled, with monotonic
+constraints on the features whose forest partial dependence is monotone, so the
+curves it serves move in the same direction as the forest's. The forest stays
+the reference for the final number; model/step16_build_surrogate.py measures the
+fidelity gap and stores it with the surrogate.
+"""
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import spearmanr
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+SURROGATE_PATH = "model_surrogate.pkl"
+SURROGATE_VERSION = 1
+
+
+def partial_dependence_curve(predict, X, feature, grid):
+    """Mean prediction over the rows of X with `feature` set to each grid value (one batched call)."""
+    Xg = X.loc[X.index.repeat(len(grid))].reset_index(drop=True)
+    Xg[feature] = np.tile(np.asarray(grid, dtype=float), len(X))
+    return np.asarray(predict(Xg), dtype=float).reshape(len(X), len(grid)).mean(axis=0)
+
+
+def infer_monotone(predict, X, features, grid_size=15, min_rho=0.9, min_range=1e-3, sample=300, seed=42):
+    """
+    Constraint per feature (+1 increasing, -1 decreasing, 0 none) from the partial
+    dependence of `predict` over the 2.5-97.5% quantile range of each feature: a
+    sign is imposed only where the curve is (Spearman) monotone beyond `min_rho`
+    and moves by more than `min_range`.
+    """
+    Xs = X.sample(min(sample, len(X)), random_state=seed)
+    out, curves = {}, {}
+    for f in features:
+        grid = np.unique(np.nanquantile(X[f].to_numpy(dtype=float), np.linspace(0.025, 0.975, grid_size)))
+        if len(grid) < 3:
+            out[f] = 0
+            continue
+        pd_curve = partial_dependence_curve(predict, Xs, f, grid)
+        curves[f] = (grid, pd_curve)
+        rho = spearmanr(grid, pd_curve).statistic if np.ptp(pd_curve) > 0 else 0.0
+        out[f] = int(np.sign(rho)) if abs(rho) >= min_rho and np.ptp(pd_curve) > min_range else 0
+    return out, curves
+
+
+class Surrogate:
+    """HistGradientBoosting stand-in for the forest, on the same raw input columns."""
+
+    def __init__(self, model, columns, categories, monotone, fidelity=None, fingerprint=None):
+        self.model = model
+        self.columns = list(columns)
+        self.categories = {c: list(v) for c, v in categories.items()}
+        self.monotone = dict(monotone)
+        self.fidelity = dict(fidelity or {})
+        self.fingerprint = fingerprint
+
+    def _matrix(self, X):
+        """Float matrix in `columns` order; categories become their code (unseen -> NaN = missing)."""
+        codes = {c: {v: float(i) for i, v in enumerate(cats)} for c, cats in self.categories.items()}
+        out = np.empty((len(X), len(self.columns)))
+        for j, c in enumerate(self.columns):
+            values = X[c].to_numpy()
+            if c in codes:
+                out[:, j] = [codes[c].get(str(v), np.nan) for v in values]
+            else:
+                out[:, j] = pd.to_numeric(values, errors="coerce")
+        return out
+
+    @classmethod
+    def fit(cls, X, y_forest, monotone, categorical_cols, fingerprint=None, **params):
+        """
+        Fit to forest predictions `y_forest`; `monotone` = {feature: -1/0/+1}, and
+        `fingerprint` identifies the forest (lca_shap_index.forest_fingerprint).
+        """
+        categories = {c: sorted(X[c].dropna().astype(str).unique().tolist()) for c in categorical_cols}
+        sur = cls(None, X.columns, categories, {f: s for f, s in monotone.items() if s}, fingerprint=fingerprint)
+        params = {"max_iter": 500, "learning_rate": 0.1, "max_leaf_nodes": 63, "min_samples_leaf": 10,
+                  "early_stopping": True, "validation_fraction": 0.1, "random_state": 42, **params}
+        # plain arrays: predicting from a DataFrame re-encodes categoricals through a
+        # ColumnTransformer on every call, which costs more than the trees themselves
+        sur.model = HistGradientBoostingRegressor(
+            categorical_features=[c in categories for c in sur.columns],
+            monotonic_cst=[sur.monotone.get(c, 0) for c in sur.columns], **params)
+        sur.model.fit(sur._matrix(X), np.ravel(y_forest))
+        return sur
+
+    def predict(self, X):
+        """Surrogate MCI, clipped to [0, 1] (boosting can overshoot where the forest cannot)."""
+        return np.clip(self.model.predict(self._matrix(X)), 0.0, 1.0)
+
+    def curve(self, X, feature, grid):
+        """Partial-dependence (or, for a single row, ICE) curve of `feature` over `grid`."""
+        return partial_dependence_curve(self.predict, X, feature, grid)
+
+    # -------------------- persistence --------------------
+    def save(self, path=SURROGATE_PATH):
+        joblib.dump({"version": SURROGATE_VERSION, "model": self.model, "columns": self.columns,
+                     "categories": self.categories, "monotone": self.monotone, "fidelity": self.fidelity, "fingerprint": self.fingerprint}, path)
+        return path
+
+    @classmethod
+    def load(cls, path=SURROGATE_PATH):
+        state = joblib.load(path)
+        if state.get("version") != SURROGATE_VERSION:
+            raise ValueError(f"{path}: surrogate version {state.get('version')} != {SURROGATE_VERSION}")
+        state.pop("version")
+        return cls(**state)
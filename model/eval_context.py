@@ -0,0 +1,107 @@
+# eval_context.py
+"""
+Load-once state shared by the evaluation stages (step5, step7, step8, step9).
+
+Artifacts are read once, the preprocessor transforms the full dataset once and
+the estimator predicts on it once; every stage reads the cached results.
+Run the stages together with run_evaluation.py to share one context.
+"""
+from functools import cached_property
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+
+
+_SHARED = {}
+
+
+def _as_frame(X):
+    if isinstance(X, pd.DataFrame):
+        return X
+    return pd.DataFrame(X, columns=[f"f{i}" for i in range(X.shape[1])])
+
+
+class EvalContext:
+    def __init__(self, model, X_train, X_test, y_train, y_test):
+        self.model = model
+        self.X_train = _as_frame(X_train)
+        self.X_test = _as_frame(X_test)
+        self.y_train = np.ravel(y_train)
+        self.y_test = np.ravel(y_test)
+        self.sources = None  # (model_path, split_path) when loaded from disk
+
+    @classmethod
+    def load(cls, model_path="model_rf.pkl", split_path="train_test_split.pkl"):
+        model = joblib.load(model_path)
+        X_train, X_test, y_train, y_test = joblib.load(split_path)
+        ctx = cls(model, X_train, X_test, y_train, y_test)
+        ctx.sources = (model_path, split_path)
+        return ctx
+
+    @classmethod
+    def shared(cls, model_path="model_rf.pkl", split_path="train_test_split.pkl"):
+        """Process-wide instance, so stages run in one process share one load and one predict."""
+        key = (model_path, split_path)
+        if key not in _SHARED:
+            _SHARED[key] = cls.load(model_path, split_path)
+        return _SHARED[key]
+
+    # -------------------- data --------------------
+    @cached_property
+    def X(self):
+        """Full dataset (train rows first, then test rows)."""
+        return pd.concat([self.X_train, self.X_test], ignore_index=True)
+
+    @cached_property
+    def y(self):
+        return np.concatenate([self.y_train, self.y_test])
+
+    @property
+    def test_slice(self):
+        return slice(len(self.X_train), len(self.X_train) + len(self.X_test))
+
+    # -------------------- model parts --------------------
+    @cached_property
+    def preprocessor(self):
+        """Everything before the final estimator (None for a bare estimator)."""
+        if isinstance(self.model, Pipeline) and len(self.model.steps) > 1:
+            return self.model[:-1]
+        return None
+
+    @cached_property
+    def estimator(self):
+        return self.model[-1] if isinstance(self.model, Pipeline) else self.model
+
+    @cached_property
+    def feature_names(self):
+        if self.preprocessor is not None:
+            try:
+                return np.asarray(self.preprocessor.get_feature_names_out())
+            except Exception:
+                return np.array([f"f{i}" for i in range(self.X_transformed.shape[1])])
+        return np.asarray(self.X.columns)
+
+    # -------------------- computed once --------------------
+    @cached_property
+    def X_transformed(self):
+        """Full dataset as seen by the final estimator."""
+        if self.preprocessor is not None:
+            return self.preprocessor.transform(self.X)
+        return self.X.values
+
+    @cached_property
+    def y_pred(self):
+        """Predictions for the full dataset (one pass)."""
+        if self.preprocessor is None:
+            return self.model.predict(self.X)
+        return self.estimator.predict(self.X_transformed)
+
+    @property
+    def y_pred_test(self):
+        return self.y_pred[self.test_slice]
+
+    @cached_property
+    def residuals(self):
+        return self.y - self.y_pred
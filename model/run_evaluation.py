@@ -0,0 +1,43 @@
+# run_evaluation.py
+"""
+Run the evaluation stages in one process so they share a single EvalContext:
+model and split are loaded once, the full dataset is transformed once and the
+model predicts on it once.
+
+    python model/run_evaluation.py
+    python model/run_evaluation.py --stages step5_evaluate step8_grouped_residuals
+
+Unrecognised flags are left for the stages (e.g. --sample / --n-jobs for step9).
+"""
+import argparse
+import runpy
+import time
+from pathlib import Path
+
+from eval_context import EvalContext
+
+HERE = Path(__file__).resolve().parent
+STAGES = ["step5_evaluate", "step7_error_analysis", "step8_grouped_residuals", "step9_shap_analysis"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run evaluation report stages on one shared context.")
+    parser.add_argument("--stages", nargs="+", default=STAGES,
+                        help="stage scripts in model/ (name without .py) or paths to other stage scripts")
+    args, _ = parser.parse_known_args(argv)
+
+    t0 = time.time()
+    ctx = EvalContext.shared()
+    ctx.y_pred  # load, transform and predict once up front
+    print(f"Context ready in {time.time() - t0:.1f}s ({len(ctx.y)} rows)")
+
+    for stage in args.stages:
+        path = Path(stage) if stage.endswith(".py") else HERE / f"{stage}.py"
+        t = time.time()
+        print(f"\n=== {path.stem} ===")
+        runpy.run_path(str(path), run_name="__main__")
+        print(f"[{path.stem}] done in {time.time() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
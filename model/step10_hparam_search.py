@@ -0,0 +1,182 @@
+# step10_hparam_search.py
+import os
+import time
+import pickle
+import argparse
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.stats import randint, uniform, loguniform
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV, KFold, cross_validate
+from sklearn.ensemble import RandomForestRegressor, HistGradientBoostingRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.pipeline import Pipeline
+import warnings
+warnings.filterwarnings("ignore")
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+
+parser = argparse.ArgumentParser(description="Successive-halving search over RF / HistGradientBoosting / XGBoost for the MCI pipeline.")
+parser.add_argument("--families", nargs="+", default=["rf", "hgb", "xgb"], choices=["rf", "hgb", "xgb"])
+parser.add_argument("--n-candidates", type=int, default=24, help="candidates sampled per family in the first halving round")
+parser.add_argument("--factor", type=int, default=3, help="halving factor (keep 1/factor of candidates, x factor samples)")
+parser.add_argument("--cv", type=int, default=3)
+parser.add_argument("--n-jobs", type=int, default=-1)
+parser.add_argument("--latency-budget-ms", type=float, default=None,
+                    help="max single-row p50 latency for the selected model (default: no budget)")
+parser.add_argument("--save-best", default=None, help="write the selected pipeline here (e.g. model_rf.pkl)")
+args = parser.parse_args()
+
+# Load preprocessor and train/test splits (from step3)
+preprocessor = joblib.load("preprocessor.pkl")
+X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+y_train, y_test = np.ravel(y_train), np.ravel(y_test)
+
+print("Data shapes -> X_train:", X_train.shape, "X_test:", X_test.shape)
+
+
+# -------------------- search spaces --------------------
+def make_families():
+    """family -> (estimator, param distributions); params are prefixed for the 'model' pipeline step."""
+    families = {
+        "rf": (
+            RandomForestRegressor(random_state=42),
+            {
+                "n_estimators": [50, 100, 200, 400],
+                "max_depth": [None, 8, 12, 20],
+                "min_samples_leaf": randint(1, 8),
+                "max_features": [1.0, 0.6, 0.3, "sqrt"],
+            },
+        ),
+        "hgb": (
+            # early stopping bounds the boosting rounds inside every fit
+            HistGradientBoostingRegressor(max_iter=1000, early_stopping=True, validation_fraction=0.1,
+                                          n_iter_no_change=20, random_state=42),
+            {
+                "learning_rate": loguniform(0.02, 0.3),
+                "max_leaf_nodes": randint(15, 128),
+                "min_samples_leaf": randint(5, 60),
+                "l2_regularization": loguniform(1e-4, 1.0),
+            },
+        ),
+    }
+    try:
+        from xgboost import XGBRegressor
+        families["xgb"] = (
+            XGBRegressor(n_estimators=600, tree_method="hist", random_state=42, verbosity=0),
+            {
+                "learning_rate": loguniform(0.02, 0.3),
+                "max_depth": randint(3, 10),
+                "subsample": uniform(0.6, 0.4),
+                "colsample_bytree": uniform(0.5, 0.5),
+                "min_child_weight": loguniform(0.5, 20),
+            },
+        )
+    except ImportError:
+        print("xgboost not installed; skipping the xgb family")
+    return families
+
+
+# -------------------- serving cost --------------------
+def latency_ms(model, X, repeats):
+    """Median wall time (ms) of model.predict(X) over `repeats` calls."""
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        model.predict(X)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def model_size_kb(model):
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1024.0
+
+
+def search_family(name, estimator, params):
+    pipe = Pipeline(steps=[("preprocessor", clone(preprocessor)), ("model", estimator)])
+    folds = KFold(n_splits=args.cv, shuffle=True, random_state=42)
+    search = HalvingRandomSearchCV(
+        pipe,
+        {f"model__{k}": v for k, v in params.items()},
+        n_candidates=args.n_candidates,
+        factor=args.factor,
+        resource="n_samples",
+        min_resources=max(200, len(X_train) // args.factor ** 3),
+        cv=folds,
+        scoring="neg_mean_absolute_error",
+        refit=True,
+        random_state=42,
+        n_jobs=args.n_jobs,
+    )
+    t0 = time.time()
+    search.fit(X_train, y_train)
+    search_time = time.time() - t0
+
+    # Halving search takes a single metric, and its last round may not use every
+    # training row. So re-score the winning configuration on the full folds with
+    # both metrics: these are the numbers the families are compared (and chosen) on.
+    cv_res = cross_validate(clone(pipe).set_params(**search.best_params_), X_train, y_train, cv=folds,
+                            scoring={"mae": "neg_mean_absolute_error", "r2": "r2"}, n_jobs=args.n_jobs)
+
+    best = search.best_estimator_
+    # serving-time threads: one row at a time is how the app and service call it
+    for k in best.get_params():
+        if k == "model__n_jobs":
+            best.set_params(**{k: 1})
+    row = {
+        "family": name,
+        "cv_mae": -cv_res["test_mae"].mean(),
+        "cv_r2": cv_res["test_r2"].mean(),
+        "latency_1row_ms": latency_ms(best, X_test.iloc[:1], repeats=50),
+        "latency_batch_ms_per_1k": latency_ms(best, X_test, repeats=5) * 1000.0 / len(X_test),
+        "model_size_kb": model_size_kb(best),
+        "search_time_s": search_time,
+        "n_candidates": int(search.n_candidates_[0]),
+        "n_iterations": int(search.n_iterations_),
+        "best_params": {k.replace("model__", ""): v for k, v in search.best_params_.items()},
+    }
+    print(f"[{name}] CV MAE = {row['cv_mae']:.6f}, R² = {row['cv_r2']:.4f} | "
+          f"1-row {row['latency_1row_ms']:.2f} ms, {row['model_size_kb']:.0f} KB | search {search_time:.1f}s")
+    return row, best
+
+
+families = make_families()
+rows, models = [], {}
+for name in args.families:
+    if name not in families:
+        continue
+    row, best = search_family(name, *families[name])
+    rows.append(row)
+    models[name] = best
+
+if not rows:
+    raise SystemExit(f"None of the requested families {args.families} is available (is xgboost installed?)")
+results = pd.DataFrame(rows)
+results["meets_budget"] = True if args.latency_budget_ms is None else results["latency_1row_ms"] <= args.latency_budget_ms
+
+# Pick the lowest CV MAE that meets the latency budget (fall back to the fastest).
+# The test set stays out of the choice and only scores the selected model.
+eligible = results[results["meets_budget"]]
+if len(eligible):
+    chosen = eligible.sort_values("cv_mae").iloc[0]["family"]
+else:
+    chosen = results.sort_values("latency_1row_ms").iloc[0]["family"]
+    print(f"No model meets the {args.latency_budget_ms} ms budget; choosing the fastest")
+results["selected"] = results["family"] == chosen
+
+y_pred = models[chosen].predict(X_test)
+test_mae, test_r2 = mean_absolute_error(y_test, y_pred), r2_score(y_test, y_pred)
+results["test_mae"] = np.where(results["selected"], test_mae, np.nan)
+results["test_r2"] = np.where(results["selected"], test_r2, np.nan)
+
+results.to_csv(f"{OUTDIR}/model_search.csv", index=False)
+print("\n" + results.drop(columns=["best_params"]).to_string(index=False))
+print(f"\nSelected: {chosen} (test MAE = {test_mae:.6f}, R² = {test_r2:.4f})")
+print(f"Saved search results to {OUTDIR}/model_search.csv")
+
+if args.save_best:
+    joblib.dump(models[chosen], args.save_best)
+    print("Selected pipeline saved as", args.save_best)
@@ -0,0 +1,76 @@
+# step11_export_forest.py
+import os
+import sys
+import time
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_forest_export import FlatForest, FLAT_FOREST_PATH
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+
+# Load pipeline (step4) and train/test split
+t0 = time.perf_counter()
+model = joblib.load("model_rf.pkl")
+pickle_load_s = time.perf_counter() - t0
+X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+X = pd.concat([X_train, X_test], ignore_index=True)
+
+# Export
+flat = FlatForest.from_pipeline(model)
+flat.save(FLAT_FOREST_PATH)
+t0 = time.perf_counter()
+FlatForest.load(FLAT_FOREST_PATH, mmap_mode=None)
+flat_read_s = time.perf_counter() - t0
+t0 = time.perf_counter()
+flat = FlatForest.load(FLAT_FOREST_PATH)   # memory-mapped, as the serving processes load it
+flat_load_s = time.perf_counter() - t0
+flat_size_kb = sum(os.path.getsize(os.path.join(FLAT_FOREST_PATH, f)) for f in os.listdir(FLAT_FOREST_PATH)) / 1024.0
+print(f"Exported {flat.n_trees} trees / {flat.n_nodes} nodes (max depth {flat.max_depth}) to {FLAT_FOREST_PATH}")
+
+# Parity with Pipeline.predict, including unseen categories and a missing value
+y_ref = model.predict(X)
+y_flat = flat.predict(X)
+max_diff = float(np.max(np.abs(y_ref - y_flat)))
+print(f"Parity on {len(X)} rows: max |Pipeline - flat| = {max_diff:.3e}")
+assert max_diff < 1e-9, "flat forest predictions differ from Pipeline.predict"
+
+X_odd = X_test.iloc[:50].copy()
+X_odd["material"] = "Unobtainium"
+X_odd.loc[X_odd.index[::4], "recycled_content_frac"] = np.nan
+assert np.allclose(model.predict(X_odd), flat.predict(X_odd), rtol=0, atol=1e-9), "parity failed on unseen categories / NaNs"
+print("Parity on unseen categories and missing values: OK")
+
+
+# Benchmark: single-row and batch latency
+def median_ms(fn, arg, repeats):
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(arg)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+model.set_params(rf__n_jobs=1)   # per-request serving is single-threaded
+one_row = X_test.iloc[:1]
+rows = [
+    {"model": "pipeline", "file": "model_rf.pkl", "size_kb": os.path.getsize("model_rf.pkl") / 1024.0,
+     "load_s": pickle_load_s, "load_in_memory_s": pickle_load_s,
+     "latency_1row_ms": median_ms(model.predict, one_row, 50),
+     "latency_batch_ms": median_ms(model.predict, X_test, 5)},
+    {"model": "flat", "file": FLAT_FOREST_PATH, "size_kb": flat_size_kb,
+     "load_s": flat_load_s, "load_in_memory_s": flat_read_s,
+     "latency_1row_ms": median_ms(flat.predict, one_row, 50),
+     "latency_batch_ms": median_ms(flat.predict, X_test, 5)},
+]
+bench = pd.DataFrame(rows)
+bench["batch_rows"] = len(X_test)
+bench["max_abs_diff"] = [0.0, max_diff]
+bench.to_csv(f"{OUTDIR}/forest_export_benchmark.csv", index=False)
+print("\n" + bench.to_string(index=False))
+print(f"\nSaved benchmark to {OUTDIR}/forest_export_benchmark.csv")
@@ -0,0 +1,135 @@
+# step12_train_streaming.py
+import sys
+import time
+import argparse
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler, OneHotEncoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_dataset import DATA_PATH, DROP_COLS, TARGET_COL
+from lca_input_utils import FeatureSchemaAccumulator, iter_input_chunks, save_feature_schema, FEATURE_SCHEMA_PATH
+from lca_residuals import compute_residual_stats, save_residual_stats, GROUP_COLS, RESIDUALS_PATH
+
+# Out-of-core alternative to step3 + step4: the dataset is only ever read in chunks.
+#   pass 1: scaler moments, one-hot vocabularies and the feature schema (partial_fit / merge)
+#   pass 2: a warm-started RandomForest grows a few trees on each training chunk
+#   pass 3: streamed holdout evaluation and residual statistics
+# The output is the same Pipeline(preprocessor, rf) layout step4 writes, so app.py,
+# lca_batch_score.py, lca_service.py and step11_export_forest.py load it unchanged.
+
+parser = argparse.ArgumentParser(description="Train the MCI pipeline over chunks of a CSV/Parquet dataset.")
+parser.add_argument("--data", default=DATA_PATH, help="input .csv or .parquet")
+parser.add_argument("--chunksize", type=int, default=100000, help="rows per chunk (bounds memory)")
+parser.add_argument("--n-estimators", type=int, default=200, help="total trees, spread over the training chunks")
+parser.add_argument("--holdout-frac", type=float, default=0.2, help="fraction of rows held out for evaluation")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--n-jobs", type=int, default=-1)
+parser.add_argument("--output", default="model_rf.pkl")
+args = parser.parse_args()
+
+
+def chunks():
+    """(chunk_no, X, y, holdout_mask) for every chunk; the mask is reproducible across passes."""
+    for i, chunk in enumerate(iter_input_chunks(args.data, args.chunksize)):
+        y = chunk[TARGET_COL].to_numpy(dtype=float)
+        X = chunk.drop(columns=[c for c in DROP_COLS if c in chunk.columns])
+        holdout = np.random.default_rng([args.seed, i]).random(len(chunk)) < args.holdout_frac
+        yield i, X.reset_index(drop=True), y, holdout
+
+
+def is_numeric(col):
+    return pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col)
+
+
+# -------------------- pass 1: preprocessing statistics --------------------
+t0 = time.time()
+scaler = StandardScaler()
+schema_acc = FeatureSchemaAccumulator()
+numerical_cols = categorical_cols = None
+vocab = {}
+train_chunks = []
+n_train = n_holdout = 0
+for i, X, y, holdout in chunks():
+    if numerical_cols is None:
+        numerical_cols = [c for c in X.columns if is_numeric(X[c])]
+        categorical_cols = [c for c in X.columns if c not in numerical_cols]
+        vocab = {c: set() for c in categorical_cols}
+    X_tr = X[~holdout]
+    if len(X_tr):
+        scaler.partial_fit(X_tr[numerical_cols].to_numpy(dtype=float))
+        schema_acc.update(X_tr)
+        for c in categorical_cols:
+            vocab[c].update(X_tr[c].dropna().unique().tolist())
+        train_chunks.append(i)
+    n_train += int((~holdout).sum())
+    n_holdout += int(holdout.sum())
+if not train_chunks:
+    raise SystemExit(f"No training rows in {args.data}")
+
+print("Categorical:", categorical_cols)
+print("Numerical (first 10):", numerical_cols[:10])
+print(f"Pass 1: {n_train} training / {n_holdout} holdout rows in {len(train_chunks)} chunks ({time.time() - t0:.1f}s)")
+
+# OneHotEncoder with the full (sorted, as fit() would order them) vocabularies
+categories = [sorted(vocab[c], key=str) for c in categorical_cols]
+preprocessor = ColumnTransformer(
+    transformers=[
+        ("num", Pipeline(steps=[("scaler", StandardScaler())]), numerical_cols),
+        ("cat", OneHotEncoder(handle_unknown="ignore", categories=categories), categorical_cols)
+    ]
+)
+
+# -------------------- pass 2: trees per chunk --------------------
+# spread the trees evenly over the training chunks, at least one per chunk
+bounds = np.linspace(0, args.n_estimators, len(train_chunks) + 1).round().astype(int)
+trees_per_chunk = dict(zip(train_chunks, np.maximum(1, np.diff(bounds))))
+
+rf = RandomForestRegressor(n_estimators=0, warm_start=True, random_state=args.seed, n_jobs=args.n_jobs)
+t0 = time.time()
+for i, X, y, holdout in chunks():
+    if i not in trees_per_chunk:
+        continue
+    X_tr, y_tr = X[~holdout], y[~holdout]
+    if not hasattr(preprocessor, "transformers_"):
+        # fit once for the fitted structure, then install the statistics of the whole dataset
+        preprocessor.fit(X_tr)
+        preprocessor.named_transformers_["num"].named_steps["scaler"].__dict__.update(scaler.__dict__)
+    rf.set_params(n_estimators=len(getattr(rf, "estimators_", [])) + int(trees_per_chunk[i]))
+    rf.fit(preprocessor.transform(X_tr), y_tr)
+    print(f"  chunk {i}: {len(X_tr)} rows -> {len(rf.estimators_)} trees")
+rf.set_params(warm_start=False)
+model = Pipeline(steps=[("preprocessor", preprocessor), ("rf", rf)])
+print(f"Pass 2: {len(rf.estimators_)} trees in {time.time() - t0:.1f}s")
+
+# -------------------- pass 3: holdout evaluation --------------------
+y_true, y_pred, groups = [], [], []
+for i, X, y, holdout in chunks():
+    if holdout.any():
+        X_ho = X[holdout]
+        y_true.append(y[holdout])
+        y_pred.append(model.predict(X_ho))
+        groups.append(X_ho[[c for c in GROUP_COLS if c in X_ho.columns]].astype(str))
+if y_true:
+    y_true, y_pred = np.concatenate(y_true), np.concatenate(y_pred)
+    mae = float(np.mean(np.abs(y_true - y_pred)))
+    r2 = 1.0 - float(np.sum((y_true - y_pred) ** 2)) / float(np.sum((y_true - y_true.mean()) ** 2))
+    print("Holdout results:")
+    print("MAE:", round(mae, 4))
+    print("R²:", round(r2, 4))
+    # residual statistics from held-out rows only (step4 uses train+test predictions)
+    save_residual_stats(compute_residual_stats(y_true, y_pred, pd.concat(groups, ignore_index=True)), RESIDUALS_PATH)
+    print("Residual statistics saved as", RESIDUALS_PATH)
+else:
+    print("No holdout rows (--holdout-frac 0); residual statistics not updated")
+
+# Save
+joblib.dump(model, args.output)
+print("Model saved as", args.output)
+save_feature_schema(schema_acc.result(), FEATURE_SCHEMA_PATH)
+print("Feature schema saved as", FEATURE_SCHEMA_PATH)
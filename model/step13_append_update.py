@@ -0,0 +1,124 @@
+# step13_append_update.py
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_absolute_error, r2_score
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_dataset import TARGET_COL
+from lca_forest_export import FlatForest, FLAT_FOREST_PATH
+from lca_incremental import append_update
+from lca_input_utils import (FeatureSchemaAccumulator, expected_columns, iter_input_chunks, load_feature_schema,
+                             save_feature_schema, FEATURE_SCHEMA_PATH)
+from lca_residuals import load_residual_stats, merge_residual_stats, save_residual_stats, RESIDUALS_PATH
+
+# Append mode: fold a batch of new labelled rows into the trained pipeline without
+# a new split or a full refit. New categories extend the one-hot vocabularies, the
+# existing trees are re-indexed (not refit), and --n-new-trees trees are grown on
+# the new rows plus a replay sample of the original training rows. Only the new
+# rows are evaluated: the model *before* the update scores them (they are unseen),
+# those residuals are merged into the residual statistics, and a line is appended
+# to outputs_eval/append_history.csv.
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+HISTORY = f"{OUTDIR}/append_history.csv"
+
+parser = argparse.ArgumentParser(description="Update model_rf.pkl with newly arrived labelled rows.")
+parser.add_argument("new_rows", help="new rows (.csv or .parquet) with the dataset's columns, incl. the MCI target")
+parser.add_argument("--model", default="model_rf.pkl")
+parser.add_argument("--output", default=None, help="where to write the updated pipeline (default: --model)")
+parser.add_argument("--n-new-trees", type=int, default=20)
+parser.add_argument("--max-trees", type=int, default=None, help="drop the oldest trees beyond this many")
+parser.add_argument("--replay-rows", type=int, default=2000, help="original training rows mixed into the new trees")
+parser.add_argument("--split", default="train_test_split.pkl", help="source of the replay rows")
+parser.add_argument("--rescale", action="store_true",
+                    help="also update the scaler feeding the trees (thresholds remapped; approximate)")
+parser.add_argument("--append-to", default=None,
+                    help="also append the rows to this dataset CSV (refreshes its cache and the Circularity AI artifact on next load)")
+parser.add_argument("--seed", type=int, default=42)
+args = parser.parse_args()
+output = args.output or args.model
+
+t0 = time.time()
+model = joblib.load(args.model)
+new = pd.concat(list(iter_input_chunks(args.new_rows, 100000)), ignore_index=True)
+cols = expected_columns(model)
+missing = [c for c in cols + [TARGET_COL] if c not in new.columns]
+if missing:
+    raise SystemExit(f"{args.new_rows} is missing columns: {missing}")
+X_new = new[cols]
+y_new = new[TARGET_COL].to_numpy(dtype=float)
+print(f"New rows: {len(X_new)}")
+
+# Evaluate the current model on the new (unseen) rows before touching it
+y_before = model.predict(X_new)
+mae_before = mean_absolute_error(y_new, y_before)
+r2_before = r2_score(y_new, y_before) if len(y_new) > 1 else np.nan
+print(f"Current model on new rows: MAE = {mae_before:.4f}, R² = {r2_before:.4f}")
+
+# Replay sample of the original training rows
+X_replay = y_replay = None
+if args.replay_rows > 0 and os.path.exists(args.split):
+    X_train, _, y_train, _ = joblib.load(args.split)
+    n = min(args.replay_rows, len(X_train))
+    idx = np.random.default_rng(args.seed).choice(len(X_train), size=n, replace=False)
+    X_replay, y_replay = X_train.iloc[idx][cols], np.ravel(y_train)[idx]
+
+n_before = len(model[-1].estimators_)
+updated, added = append_update(model, X_new, y_new, n_new_trees=args.n_new_trees,
+                               X_replay=X_replay, y_replay=y_replay, max_trees=args.max_trees,
+                               rescale=args.rescale)
+n_after = len(updated[-1].estimators_)
+y_after = updated.predict(X_new)
+mae_after = mean_absolute_error(y_new, y_after)
+print(f"Trees: {n_before} -> {n_after}; new categories: {added or 'none'}")
+print(f"Updated model on new rows (now seen): MAE = {mae_after:.4f}")
+
+# Save the pipeline; the serving artifacts derived from it follow only in-place updates
+joblib.dump(updated, output)
+print("Model saved as", output)
+in_place = os.path.abspath(output) == os.path.abspath(args.model)
+if not in_place:
+    print("Written to a new path: flat forest, residual statistics and feature schema left as they are")
+if in_place and os.path.isdir(FLAT_FOREST_PATH):
+    FlatForest.from_pipeline(updated).save(FLAT_FOREST_PATH)
+    print("Flat forest re-exported to", FLAT_FOREST_PATH)
+
+if in_place and os.path.exists(RESIDUALS_PATH):
+    stats = merge_residual_stats(load_residual_stats(RESIDUALS_PATH), y_new, y_before, X_new)
+    save_residual_stats(stats, RESIDUALS_PATH)
+    print("Residual statistics updated in", RESIDUALS_PATH)
+
+if in_place and os.path.exists(FEATURE_SCHEMA_PATH):
+    acc = FeatureSchemaAccumulator.from_schema(load_feature_schema(FEATURE_SCHEMA_PATH))
+    save_feature_schema(acc.update(X_new).result(), FEATURE_SCHEMA_PATH)
+    print("Feature schema updated in", FEATURE_SCHEMA_PATH)
+
+if args.append_to:
+    header = pd.read_csv(args.append_to, nrows=0).columns
+    new.reindex(columns=header).to_csv(args.append_to, mode="a", header=False, index=False)
+    print(f"Appended {len(new)} rows to {args.append_to}")
+
+elapsed = time.time() - t0
+record = pd.DataFrame([{
+    "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "new_rows_file": args.new_rows,
+    "n_new_rows": len(X_new),
+    "new_categories": "; ".join(f"{c}: {', '.join(map(str, v))}" for c, v in added.items()),
+    "trees_before": n_before,
+    "trees_after": n_after,
+    "rescaled": args.rescale,
+    "mae_before_update": mae_before,
+    "r2_before_update": r2_before,
+    "mae_after_update_in_sample": mae_after,
+    "elapsed_s": elapsed,
+}])
+record.to_csv(HISTORY, mode="a", header=not os.path.exists(HISTORY), index=False)
+print(f"Appended run to {HISTORY} ({elapsed:.1f}s)")
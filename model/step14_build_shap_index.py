@@ -0,0 +1,98 @@
+# step14_build_shap_index.py
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_forest_export import _find_column_transformer
+from lca_shap import ParallelTreeShap, stratified_order
+from lca_shap_index import ShapIndex, SHAP_INDEX_PATH, forest_fingerprint, driver_agreement
+
+# Offline SHAP index for the app's recommendation drivers: exact TreeSHAP values of
+# (a stratified sample of) the training rows, looked up by nearest neighbours at
+# request time. The index is then scored against exact SHAP on test rows: top-5
+# driver agreement, exact-fallback rate and per-row latency of both paths
+# (outputs_eval/shap_index_report.csv).
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+STRATA = ["material", "route"]
+
+parser = argparse.ArgumentParser(description="Build the nearest-neighbour SHAP index served by app.py.")
+parser.add_argument("--max-rows", type=int, default=5000, help="training rows indexed (stratified sample; 0 = all)")
+parser.add_argument("--eval-rows", type=int, default=200, help="test rows compared against exact SHAP")
+parser.add_argument("--k", type=int, default=5, help="neighbours averaged per query")
+parser.add_argument("--radius-quantile", type=float, default=0.95,
+                    help="exact fallback beyond this quantile of the index's nearest-neighbour spacing")
+parser.add_argument("--n-jobs", type=int, default=1, help="worker processes for the exact SHAP values (-1 = all cores)")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--output", default=SHAP_INDEX_PATH)
+args = parser.parse_args()
+
+model = joblib.load("model_rf.pkl")
+X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+ct, forest = _find_column_transformer(model)
+feature_names = ct.get_feature_names_out()
+
+
+def strat_sample(X, n):
+    if n <= 0 or n >= len(X):
+        return np.arange(len(X))
+    strata = X[[c for c in STRATA if c in X.columns]].astype(str).agg("|".join, axis=1)
+    return np.sort(stratified_order(strata.to_numpy(), seed=args.seed)[:n])
+
+
+rows = strat_sample(X_train, args.max_rows)
+eval_rows = strat_sample(X_test, args.eval_rows)
+Xt_index = ct.transform(X_train.iloc[rows])
+Xt_eval = ct.transform(X_test.iloc[eval_rows])
+
+with ParallelTreeShap(forest, n_jobs=args.n_jobs) as ps:
+    t0 = time.time()
+    shap_index = ps.shap_values(Xt_index)
+    print(f"Exact SHAP for {len(rows)} training rows in {time.time() - t0:.1f}s")
+    shap_eval = ps.shap_values(Xt_eval)
+    expected_value = float(np.ravel(ps.expected_value)[0])
+
+index = ShapIndex.build(Xt_index, shap_index, expected_value, feature_names,
+                        fingerprint=forest_fingerprint(forest), k=args.k,
+                        radius_quantile=args.radius_quantile)
+index.save(args.output)
+print(f"Index of {index.n_rows} rows saved as {args.output} (exact fallback beyond distance {index.radius:.3f})")
+
+# Agreement with exact SHAP on unseen rows: index alone, and with the exact fallback
+approx, nearest = index.query(Xt_eval)
+far = nearest > index.radius
+served = approx.copy()
+served[far] = shap_eval[far]
+plain = driver_agreement(approx, shap_eval)
+report = {"index_rows": index.n_rows, "eval_rows": len(eval_rows), "k": index.k, "radius": index.radius,
+          "fallback_rate": float(far.mean())}
+report.update({f"index_only_{k}": v for k, v in plain.items()})
+report.update({f"served_{k}": v for k, v in driver_agreement(served, shap_eval).items()})
+report["mean_abs_shap_error"] = float(np.mean(np.abs(approx - shap_eval)))
+
+
+# Per-row latency (single requests, as the app issues them)
+def median_ms(fn, repeats=50):
+    times = []
+    for i in range(repeats):
+        row = Xt_eval[i % len(Xt_eval)][None, :]
+        t0 = time.perf_counter()
+        fn(row)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+with ParallelTreeShap(forest) as ps:
+    report["exact_ms_per_row"] = median_ms(ps.shap_values, repeats=10)
+report["index_ms_per_row"] = median_ms(index.query)
+
+print(pd.Series(report).to_string())
+pd.DataFrame([report]).to_csv(os.path.join(OUTDIR, "shap_index_report.csv"), index=False)
+print(f"Report saved in {OUTDIR}/shap_index_report.csv")
@@ -0,0 +1,127 @@
+# step15_mci_parity.py
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from circularity_ai_refactor import CircularityAIRefactored, mci_components
+from lca_dataset import DATA_PATH, load_dataset
+
+# Parity checks for the array MCI (mci_components / calculate_mci_scores):
+#   1. against the scalar calculate_mci_score, on dataset rows and on edge cases
+#   2. against the LFI / F / MCI_raw / MCI columns stored in the dataset
+#   3. run_analysis_batch against run_analysis row by row, with and without peers
+#   4. throughput of both paths (outputs_eval/mci_parity.csv)
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+
+ai = CircularityAIRefactored()   # calculate_mci_score(s) need no fitted state
+df = load_dataset(DATA_PATH)
+rng = np.random.default_rng(42)
+
+# --- 1. scalar vs array ---
+rows = pd.DataFrame({
+    "material_mass_kg": rng.choice([1.0, 25.0, 100.0], len(df)),
+    "product_lifetime_years": df["product_lifetime_years"].to_numpy(dtype=float),
+    "recycled_content_frac": df["recycled_content_frac"].to_numpy(dtype=float),
+    "route": df["route"].astype(object).to_numpy(),
+    "eol_reuse_pct": rng.uniform(0, 20, len(df)).round(1),
+    "eol_recycle_pct": 100.0 * df["recycled_output_kg_per_kg"].to_numpy(dtype=float),
+})
+edge = pd.DataFrame({
+    "material_mass_kg": [0.0, -1.0, 1.0, 1.0, 1.0, 50.0, 1.0, 1.0, 1.0, 1.0],
+    "product_lifetime_years": [5.0, 5.0, 0.0, -2.0, 200.0, 15.0, 1e-9, 10.0, 30.0, 0.0],
+    "recycled_content_frac": [0.5, 0.5, 0.2, 0.2, 1.0, 0.0, 0.3, 0.3, 0.0, 0.0],
+    "route": ["Primary", "Secondary", "virgin", "PRIMARY-mixed", "Recycled", "Virgin", "secondary", None, None, np.nan],
+    "eol_reuse_pct": [0.0, 10.0, 0.0, 0.0, 50.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+    "eol_recycle_pct": [50.0, 50.0, 100.0, 0.0, 50.0, 0.0, 10.0, 90.0, 80.0, 0.0],
+})
+checks = pd.concat([rows, edge], ignore_index=True)
+t0 = time.perf_counter()
+scalar = np.array([ai.calculate_mci_score(r)
+                   for r in checks.to_dict("records")])
+scalar_s = time.perf_counter() - t0
+vector = ai.calculate_mci_scores(checks)
+mismatch = int(np.sum(scalar != vector))
+print(f"Scalar vs array on {len(checks)} rows ({len(edge)} edge cases): {mismatch} mismatches")
+assert mismatch == 0, checks[scalar != vector].assign(scalar=scalar[scalar != vector], array=vector[scalar != vector])
+# a missing route means 'Primary' on both paths, whether None, NaN or absent
+for route in (None, np.nan, "Primary"):
+    row = {"route": route, "product_lifetime_years": 30.0, "eol_recycle_pct": 80.0}
+    assert ai.calculate_mci_score(row) == ai.calculate_mci_scores(pd.DataFrame([row]))[0] \
+        == ai.calculate_mci_score({k: v for k, v in row.items() if k != "route"}), route
+
+# --- 2. dataset columns ---
+# The dataset counts 1 - recycled content as virgin input on every route, with unit
+# mass and recycled_output_kg_per_kg as the recovered fraction. F (and so MCI_raw
+# and MCI) is stored rounded to 6 decimals.
+terms = mci_components(
+    material_mass=1.0,
+    lifetime=df["product_lifetime_years"].to_numpy(dtype=float),
+    recycled_content=df["recycled_content_frac"].to_numpy(dtype=float),
+    is_virgin=True,
+    eol_recycle_pct=100.0 * df["recycled_output_kg_per_kg"].to_numpy(dtype=float),
+)
+dataset_diff = {}
+for term, col, tol in [("virgin_mass", "V_kg", 1e-9), ("unrecoverable_waste", "W_kg", 1e-9), ("LFI", "LFI", 1e-9),
+                       ("F", "F", 1e-6), ("MCI_raw", "MCI_raw", 1e-6), ("MCI", "MCI", 1e-6)]:
+    if col not in df.columns:
+        continue
+    dataset_diff[col] = float(np.max(np.abs(terms[term] - df[col].to_numpy(dtype=float))))
+    print(f"  {term:>20} vs {col:<8} max |diff| = {dataset_diff[col]:.2e}")
+    assert dataset_diff[col] <= tol, f"{term} differs from the dataset's {col}"
+
+# --- 3. run_analysis_batch vs run_analysis ---
+fitted = CircularityAIRefactored.load_or_fit(DATA_PATH, "circularity_ai.pkl")
+analysis_rows = pd.concat([
+    df.sample(200, random_state=42),
+    pd.DataFrame([
+        {"route": None, "product_lifetime_years": 0},
+        {"route": np.nan, "material": df["material"].iloc[0]},
+        {"route": "Primary", "recycled_content_frac": "n/a"},
+        {},
+    ]),
+], ignore_index=True)
+
+
+def flatten(result):
+    out = {"cluster_id": result["cluster_id"], "recommendations": result["recommendations"]}
+    for stage in ("baseline", "optimized", "ideal"):
+        out.update({f"{stage}_{k}": v for k, v in result[stage].items()})
+    return out
+
+
+analysis_mismatch = 0
+for peers in (None, 10):
+    batch = fitted.run_analysis_batch(analysis_rows, peers=peers).to_dict("records")
+    for row, b in zip(analysis_rows.to_dict("records"), batch):
+        single = flatten(fitted.run_analysis(row, peers=peers))
+        diff = {k: (v, b[k]) for k, v in single.items() if not (v == b[k] or (v is None and pd.isna(b[k])))}
+        analysis_mismatch += bool(diff)
+        assert not diff, (peers, row, diff)
+print(f"run_analysis vs run_analysis_batch on {len(analysis_rows)} rows x (no peers, 10 peers): "
+      f"{analysis_mismatch} mismatches")
+
+# --- 4. throughput ---
+n = 1_000_000
+big = checks.iloc[rng.integers(0, len(checks), n)].reset_index(drop=True)
+t0 = time.perf_counter()
+ai.calculate_mci_scores(big)
+array_s = time.perf_counter() - t0
+report = pd.DataFrame([{
+    "rows_checked": len(checks),
+    "scalar_mismatches": mismatch,
+    "analysis_rows_checked": 2 * len(analysis_rows),
+    "analysis_mismatches": analysis_mismatch,
+    **{f"max_abs_diff_{k}": v for k, v in dataset_diff.items()},
+    "scalar_us_per_row": 1e6 * scalar_s / len(checks),
+    "array_us_per_row": 1e6 * array_s / n,
+    "array_rows_per_s": n / array_s,
+}])
+print(report.T.to_string(header=False))
+report.to_csv(os.path.join(OUTDIR, "mci_parity.csv"), index=False)
+print(f"Saved {OUTDIR}/mci_parity.csv")
@@ -0,0 +1,138 @@
+# step16_build_surrogate.py
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+import joblib
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from sklearn.metrics import mean_absolute_error, r2_score
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_dataset import DATA_PATH, load_dataset
+from lca_optimize import lever_bounds
+from lca_scenarios import LEVER_BOUNDS, SensitivityModel, base_row, scenario_inputs
+from lca_shap_index import forest_fingerprint
+from lca_surrogate import Surrogate, SURROGATE_PATH, infer_monotone, partial_dependence_curve
+
+# Fit the what-if surrogate to model_rf.pkl's predictions and report how far it is
+# from the forest: R² / MAE against the forest on test rows and on lever-resampled
+# rows, MAE against the true MCI for both models, partial-dependence gaps per lever
+# and along the app's lever sliders (outputs_eval/surrogate_fidelity.csv,
+# surrogate_pd_curves.png), and single-row latency.
+
+OUTDIR = "outputs_eval"
+os.makedirs(OUTDIR, exist_ok=True)
+# input columns the app's what-if levers move (directly or through the sensitivity model)
+WHAT_IF_FEATURES = ["recycled_content_frac", "renewable_electricity_frac", "electricity_grid_renewable_pct",
+                    "transport_distance_km", "recycled_output_kg_per_kg", "product_lifetime_years",
+                    "energy_MJ_per_kg", "emissions_kgCO2e_per_kg"]
+
+parser = argparse.ArgumentParser(description="Build the monotone surrogate served by app.py's what-if panel.")
+parser.add_argument("--augment", type=int, default=3, help="lever-resampled copies of the training rows")
+parser.add_argument("--min-rho", type=float, default=0.9, help="PD monotonicity needed to impose a constraint")
+parser.add_argument("--slider-rows", type=int, default=50, help="test rows whose lever sweeps are compared")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--output", default=SURROGATE_PATH)
+args = parser.parse_args()
+
+model = joblib.load("model_rf.pkl")
+X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+rng = np.random.default_rng(args.seed)
+categorical_cols = X_train.select_dtypes(include=["object", "category", "string"]).columns.tolist()
+numeric_cols = [c for c in X_train.columns if c not in categorical_cols]
+levers = [c for c in WHAT_IF_FEATURES if c in numeric_cols]
+
+
+def resample_levers(X, copies):
+    """Copies of X with every lever drawn uniformly from its training range (grid pct kept = 100 x frac)."""
+    parts = []
+    for _ in range(copies):
+        Xa = X.copy()
+        for c in levers:
+            lo, hi = X_train[c].min(), X_train[c].max()
+            Xa[c] = rng.uniform(lo, hi, len(Xa))
+        if {"renewable_electricity_frac", "electricity_grid_renewable_pct"} <= set(Xa.columns):
+            Xa["electricity_grid_renewable_pct"] = 100.0 * Xa["renewable_electricity_frac"]
+        parts.append(Xa)
+    return pd.concat(parts, ignore_index=True) if parts else X.iloc[:0]
+
+
+# Monotonic constraints from the forest's partial dependence
+t0 = time.time()
+monotone, _ = infer_monotone(model.predict, X_train, numeric_cols, min_rho=args.min_rho, seed=args.seed)
+print("Monotone constraints:", {f: s for f, s in monotone.items() if s} or "none")
+
+# Fit to forest predictions on real + lever-resampled rows
+X_fit = pd.concat([X_train, resample_levers(X_train, args.augment)], ignore_index=True)
+y_fit = model.predict(X_fit)
+sur = Surrogate.fit(X_fit, y_fit, monotone, categorical_cols, fingerprint=forest_fingerprint(model[-1]))
+print(f"Surrogate fitted on {len(X_fit)} rows in {time.time() - t0:.1f}s ({sur.model.n_iter_} iterations)")
+
+# Fidelity
+X_aug_test = resample_levers(X_test, 1)
+rf_test, rf_aug = model.predict(X_test), model.predict(X_aug_test)
+s_test, s_aug = sur.predict(X_test), sur.predict(X_aug_test)
+fidelity = {
+    "r2_vs_forest_test": r2_score(rf_test, s_test),
+    "mae_vs_forest_test": mean_absolute_error(rf_test, s_test),
+    "r2_vs_forest_resampled": r2_score(rf_aug, s_aug),
+    "mae_vs_forest_resampled": mean_absolute_error(rf_aug, s_aug),
+    "mae_vs_true_forest": mean_absolute_error(y_test, rf_test),
+    "mae_vs_true_surrogate": mean_absolute_error(y_test, s_test),
+}
+
+# Partial-dependence gaps on the levers
+X_pd = X_test.sample(min(200, len(X_test)), random_state=args.seed)
+fig, axes = plt.subplots(2, (len(levers) + 1) // 2, figsize=(4 * ((len(levers) + 1) // 2), 7), squeeze=False)
+for ax, c in zip(axes.ravel(), levers):
+    grid = np.linspace(X_train[c].min(), X_train[c].max(), 25)
+    pd_rf = partial_dependence_curve(model.predict, X_pd, c, grid)
+    pd_sur = sur.curve(X_pd, c, grid)
+    fidelity[f"pd_max_gap_{c}"] = float(np.max(np.abs(pd_rf - pd_sur)))
+    ax.plot(grid, pd_rf, label="forest")
+    ax.plot(grid, pd_sur, "--", label="surrogate")
+    ax.set_title(c, fontsize=9)
+axes.ravel()[0].legend()
+plt.tight_layout()
+plt.savefig(os.path.join(OUTDIR, "surrogate_pd_curves.png"))
+plt.close()
+
+# Slider sweeps as the app's what-if panel builds them (levers mapped by lca_scenarios)
+sensitivity = SensitivityModel.from_frame(load_dataset(DATA_PATH))
+slider_levers = list(LEVER_BOUNDS)
+lo, hi = lever_bounds(slider_levers)
+bases = [base_row(row) for row in X_test.sample(min(args.slider_rows, len(X_test)), random_state=args.seed)
+         .to_dict("records")]
+for j, lever in enumerate(slider_levers):
+    sweeps = [scenario_inputs(b, {lever: np.linspace(lo[j], hi[j], 21)}, X_train.columns, sensitivity)[0]
+              for b in bases]
+    X_sw = pd.concat(sweeps, ignore_index=True)
+    gap = np.abs(model.predict(X_sw) - sur.predict(X_sw))
+    fidelity[f"slider_mae_{lever}"] = float(gap.mean())
+    fidelity[f"slider_p95_gap_{lever}"] = float(np.quantile(gap, 0.95))
+
+
+# Latency: one what-if row and one 25-point curve
+def median_ms(fn, repeats=30):
+    times = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000.0)
+    return float(np.median(times))
+
+
+one = X_test.iloc[[0]]
+model.set_params(rf__n_jobs=1)
+fidelity["forest_ms_per_row"] = median_ms(lambda: model.predict(one))
+fidelity["surrogate_ms_per_row"] = median_ms(lambda: sur.predict(one))
+fidelity["surrogate_ms_per_curve"] = median_ms(lambda: sur.curve(one, levers[0], np.linspace(0, 1, 25)))
+
+sur.fidelity = fidelity
+sur.save(args.output)
+print(pd.Series(fidelity).round(5).to_string())
+pd.DataFrame([fidelity]).to_csv(os.path.join(OUTDIR, "surrogate_fidelity.csv"), index=False)
+print(f"Surrogate saved as {args.output}; report in {OUTDIR}/surrogate_fidelity.csv")
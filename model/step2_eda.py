@@ -1,17 +1,20 @@
 # step2_eda.py
-import pandas as pd
+import sys
 import numpy as np
 from pathlib import Path
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_dataset import load_dataset
+
 sns.set(style="whitegrid", rc={"figure.figsize": (8,5)})
 
 DATA = "LCA_multi_metal_with_MCI.csv"  # adjust if different path
 OUTDIR = Path("outputs_eda")
 OUTDIR.mkdir(exist_ok=True)
 
-df = pd.read_csv(DATA)
+df = load_dataset(DATA)   # typed Parquet cache, rebuilt when the CSV changes
 
 # Basic info
 with open(OUTDIR / "eda_report.txt", "w") as f:
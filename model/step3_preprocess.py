@@ -1,5 +1,6 @@
 # step3_preprocess.py
-import pandas as pd
+import sys
+from pathlib import Path
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, OneHotEncoder
 from sklearn.compose import ColumnTransformer
@@ -7,23 +8,23 @@ from sklearn.pipeline import Pipeline
 import numpy as np
 import joblib
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_dataset import load_dataset, DROP_COLS, TARGET_COL
+from lca_input_utils import build_feature_schema, save_feature_schema, FEATURE_SCHEMA_PATH
+
 DATA = "LCA_multi_metal_with_MCI.csv"
 
 # Load
-df = pd.read_csv(DATA)
+df = load_dataset(DATA)
 
 # Target variable
-y = df["MCI"]
+y = df[TARGET_COL]
 
 # Features: drop columns that leak info or not useful
-drop_cols = [
-    "MCI", "MCI_percent", "MCI_raw", "circularity_index_default",
-    "missing_data_flag", "LFI", "F", "W_kg", "V_kg", "recovered_kg", "lifespan_clipped"
-]
-X = df.drop(columns=[c for c in drop_cols if c in df.columns])
+X = df.drop(columns=[c for c in DROP_COLS if c in df.columns])
 
 # Identify categorical vs numerical
-categorical_cols = X.select_dtypes(include=["object"]).columns.tolist()
+categorical_cols = X.select_dtypes(include=["object", "category"]).columns.tolist()
 numerical_cols = X.select_dtypes(include=[np.number]).columns.tolist()
 
 print("Categorical:", categorical_cols)
@@ -53,6 +54,9 @@ print("X_train:", X_train.shape, "X_test:", X_test.shape)
 # Save splits and preprocessing pipeline
 joblib.dump((X_train, X_test, y_train, y_test), "train_test_split.pkl")
 joblib.dump(preprocessor, "preprocessor.pkl")
+# Compact feature schema: what serving needs from the training data, without the data
+save_feature_schema(build_feature_schema(X_train), FEATURE_SCHEMA_PATH)
 
 print("Preprocessing pipeline saved as preprocessor.pkl")
 print("Train/test splits saved as train_test_split.pkl")
+print("Feature schema saved as", FEATURE_SCHEMA_PATH)
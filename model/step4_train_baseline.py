@@ -1,10 +1,16 @@
 # step4_train_baseline.py
+import sys
+from pathlib import Path
 import joblib
 import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.pipeline import Pipeline
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_residuals import compute_residual_stats, save_residual_stats, RESIDUALS_PATH
+
 # Load preprocessor and train/test splits
 preprocessor = joblib.load("preprocessor.pkl")
 X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
@@ -41,3 +47,14 @@ print("R²:", round(r2, 4))
 # Save model
 joblib.dump(model, "model_rf.pkl")
 print("Model saved as model_rf.pkl")
+
+# Residual statistics for serving-time CIs (overall and per material/route),
+# so the app never has to run a prediction pass over the training data
+y_pred_train = model.predict(X_train)
+resid_stats = compute_residual_stats(
+    np.concatenate([np.ravel(y_train), np.ravel(y_test)]),
+    np.concatenate([y_pred_train, y_pred]),
+    pd.concat([X_train, X_test], ignore_index=True)
+)
+save_residual_stats(resid_stats, RESIDUALS_PATH)
+print("Residual statistics saved as", RESIDUALS_PATH)
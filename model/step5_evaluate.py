@@ -1,6 +1,5 @@
 # step5_evaluate.py (fixed + more robust)
 import os
-import joblib
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
@@ -9,18 +8,21 @@ from sklearn.metrics import mean_absolute_error, r2_score
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 
+from eval_context import EvalContext
+
 sns.set(style="whitegrid", rc={"figure.figsize": (7,5)})
 
 # Ensure output directory exists BEFORE any savefig call
 OUTDIR = "outputs_eval"
 os.makedirs(OUTDIR, exist_ok=True)
 
-# Load model and data
-model = joblib.load("model_rf.pkl")
-X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
+# Load model and data (shared with the other evaluation stages)
+ctx = EvalContext.shared()
+model = ctx.model
+X_train, X_test, y_train, y_test = ctx.X_train, ctx.X_test, ctx.y_train, ctx.y_test
 
-# Predict
-y_pred = model.predict(X_test)
+# Predict (test slice of the single full-data prediction pass)
+y_pred = ctx.y_pred_test
 
 # Metrics
 mae = mean_absolute_error(y_test, y_pred)
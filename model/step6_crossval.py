@@ -1,9 +1,11 @@
 # step6_crossval.py
 import os
+import time
+import argparse
 import joblib
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import cross_val_score, cross_val_predict, KFold
+from sklearn.model_selection import cross_validate, KFold, GroupKFold
 from sklearn.metrics import mean_absolute_error, r2_score
 import warnings
 warnings.filterwarnings("ignore")
@@ -11,6 +13,14 @@ warnings.filterwarnings("ignore")
 OUTDIR = "outputs_eval"
 os.makedirs(OUTDIR, exist_ok=True)
 
+parser = argparse.ArgumentParser(description="Cross-validate the MCI pipeline under one or more CV strategies.")
+parser.add_argument("--strategies", nargs="+", default=["kfold"],
+                    choices=["kfold", "group_material", "group_country", "temporal_year"],
+                    help="kfold = shuffled 5-fold; group_* = unseen material/country; temporal_year = forward-chaining by year")
+parser.add_argument("--n-jobs", type=int, default=-1, help="total cores for folds x trees (-1 = all)")
+parser.add_argument("--min-train-years", type=int, default=2, help="years always in training for temporal_year")
+args = parser.parse_args()
+
 # Load pipeline and train/test split
 model = joblib.load("model_rf.pkl")
 X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
@@ -39,32 +49,111 @@ y = np.concatenate([np.ravel(y_train), np.ravel(y_test)])
 
 print("Data shapes -> X:", X.shape, "y:", y.shape)
 
-# K-Fold CV settings
+if "temporal_year" in args.strategies:
+    n_years = X["year"].nunique()
+    if not 1 <= args.min_train_years < n_years:
+        parser.error(f"--min-train-years must be between 1 and {n_years - 1} "
+                     f"(the data has {n_years} distinct years), got {args.min_train_years}")
+
 n_splits = 5
-kf = KFold(n_splits=n_splits, shuffle=True, random_state=42)
-
-# Cross-validation: MAE and R²
-scores_mae = cross_val_score(model, X, y, scoring="neg_mean_absolute_error", cv=kf, n_jobs=-1)
-scores_r2  = cross_val_score(model, X, y, scoring="r2", cv=kf, n_jobs=-1)
-
-mae_scores = -scores_mae  # convert back to positive MAE
-print(f"\n{kf.get_n_splits()}-fold CV MAE: mean = {mae_scores.mean():.6f}, std = {mae_scores.std():.6f}")
-print(f"{kf.get_n_splits()}-fold CV R² : mean = {scores_r2.mean():.6f}, std = {scores_r2.std():.6f}")
-
-# Cross-validated predictions (optional)
-y_pred_cv = cross_val_predict(model, X, y, cv=kf, n_jobs=-1)
-mae_cv = mean_absolute_error(y, y_pred_cv)
-r2_cv  = r2_score(y, y_pred_cv)
-print(f"\nCross-val predicted on full data -> MAE = {mae_cv:.6f}, R² = {r2_cv:.6f}")
-
-# Save CV results to CSV
-res_df = pd.DataFrame({
-    "fold": list(range(1, n_splits+1)),
-    "mae_fold": mae_scores,
-    "r2_fold": scores_r2
-})
-res_df.loc["mean"] = ["mean", mae_scores.mean(), scores_r2.mean()]
-res_df.loc["std"]  = ["std",  mae_scores.std(),  scores_r2.std()]
-res_df.to_csv(os.path.join(OUTDIR, "cv_results.csv"), index=False)
-
-print(f"\nSaved CV results to {OUTDIR}/cv_results.csv")
+
+
+def make_splits(strategy):
+    """(train_idx, test_idx) pairs for the chosen strategy."""
+    if strategy == "kfold":
+        return list(KFold(n_splits=n_splits, shuffle=True, random_state=42).split(X, y))
+    if strategy in ("group_material", "group_country"):
+        groups = X[strategy.split("_", 1)[1]].astype(str).to_numpy()
+        k = min(n_splits, len(np.unique(groups)))
+        return list(GroupKFold(n_splits=k).split(X, y, groups))
+    # temporal_year: train on all years before the test year (forward chaining)
+    years = X["year"].to_numpy()
+    uniq = np.sort(np.unique(years))
+    return [(np.flatnonzero(years < yr), np.flatnonzero(years == yr)) for yr in uniq[args.min_train_years:]]
+
+
+def set_inner_jobs(estimator, n_jobs):
+    """Cap the estimator's own threads (e.g. RandomForest n_jobs) to avoid oversubscription."""
+    params = {k: n_jobs for k in estimator.get_params() if k == "n_jobs" or k.endswith("__n_jobs")}
+    return estimator.set_params(**params)
+
+
+def run_cv(strategy):
+    splits = make_splits(strategy)
+    n_folds = len(splits)
+    total = (os.cpu_count() or 1) if args.n_jobs == -1 else max(1, args.n_jobs)
+    outer = min(n_folds, total)
+    inner = max(1, total // outer)
+    estimator = set_inner_jobs(model, inner)
+
+    # Cross-validation: one fit per fold; MAE, R² and out-of-fold predictions all
+    # come from the same fold models. Folds run in a process pool (outer jobs),
+    # each fold's forest uses the remaining cores (inner jobs).
+    t0 = time.time()
+    cv_res = cross_validate(
+        estimator, X, y, cv=splits, n_jobs=outer,
+        scoring={"mae": "neg_mean_absolute_error", "r2": "r2"},
+        return_estimator=True, return_indices=True
+    )
+    cv_wall = time.time() - t0
+    print(f"\n[{strategy}] CV wall time: {cv_wall:.1f}s ({n_folds} fits, {outer} fold processes x {inner} tree jobs)")
+
+    mae_scores = -cv_res["test_mae"]  # convert back to positive MAE
+    scores_r2 = cv_res["test_r2"]
+    print(f"[{strategy}] {n_folds}-fold CV MAE: mean = {mae_scores.mean():.6f}, std = {mae_scores.std():.6f}")
+    print(f"[{strategy}] {n_folds}-fold CV R² : mean = {scores_r2.mean():.6f}, std = {scores_r2.std():.6f}")
+
+    # Cross-validated (out-of-fold) predictions from the fitted fold models, no refit
+    # (rows never in a test fold, e.g. the first years for temporal_year, stay NaN)
+    y_pred_cv = np.full(len(y), np.nan)
+    fold_of_row = np.zeros(len(y), dtype=int)
+    for fold, (est, test_idx) in enumerate(zip(cv_res["estimator"], cv_res["indices"]["test"]), start=1):
+        y_pred_cv[test_idx] = est.predict(X.iloc[test_idx])
+        fold_of_row[test_idx] = fold
+    covered = ~np.isnan(y_pred_cv)
+    mae_cv = mean_absolute_error(y[covered], y_pred_cv[covered])
+    r2_cv  = r2_score(y[covered], y_pred_cv[covered])
+    print(f"[{strategy}] Cross-val predicted on {covered.sum()} rows -> MAE = {mae_cv:.6f}, R² = {r2_cv:.6f}")
+
+    # Save CV results to CSV (the default kfold run keeps the original file names)
+    suffix = "" if strategy == "kfold" else f"_{strategy}"
+    fit_times = cv_res["fit_time"]
+    score_times = cv_res["score_time"]
+    res_df = pd.DataFrame({
+        "fold": list(range(1, n_folds+1)),
+        "mae_fold": mae_scores,
+        "r2_fold": scores_r2,
+        "fit_time_s": fit_times,
+        "score_time_s": score_times
+    })
+    res_df.loc["mean"] = ["mean", mae_scores.mean(), scores_r2.mean(), fit_times.mean(), score_times.mean()]
+    res_df.loc["std"]  = ["std",  mae_scores.std(),  scores_r2.std(),  fit_times.std(),  score_times.std()]
+    res_df.to_csv(os.path.join(OUTDIR, f"cv_results{suffix}.csv"), index=False)
+
+    # Save out-of-fold predictions
+    oof_df = pd.DataFrame({"row": np.arange(len(y)), "fold": fold_of_row, "y_true": y, "y_pred_oof": y_pred_cv})
+    oof_df["residual"] = oof_df["y_true"] - oof_df["y_pred_oof"]
+    oof_df.to_csv(os.path.join(OUTDIR, f"cv_oof_predictions{suffix}.csv"), index=False)
+    print(f"[{strategy}] Saved {OUTDIR}/cv_results{suffix}.csv and {OUTDIR}/cv_oof_predictions{suffix}.csv")
+
+    return {
+        "strategy": strategy,
+        "n_folds": n_folds,
+        "mae_mean": mae_scores.mean(),
+        "mae_std": mae_scores.std(),
+        "r2_mean": scores_r2.mean(),
+        "r2_std": scores_r2.std(),
+        "oof_mae": mae_cv,
+        "oof_r2": r2_cv,
+        "oof_rows": int(covered.sum()),
+        "wall_time_s": cv_wall,
+        "fit_time_mean_s": fit_times.mean(),
+        "fold_jobs": outer,
+        "tree_jobs": inner
+    }
+
+
+summary = pd.DataFrame([run_cv(s) for s in args.strategies])
+summary.to_csv(os.path.join(OUTDIR, "cv_strategy_comparison.csv"), index=False)
+print("\n" + summary[["strategy", "n_folds", "mae_mean", "r2_mean", "wall_time_s"]].to_string(index=False))
+print(f"\nSaved strategy comparison to {OUTDIR}/cv_strategy_comparison.csv")
@@ -1,28 +1,23 @@
 # step7_error_analysis.py
 import os
-import joblib
-import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import mean_absolute_error, r2_score
 
+from eval_context import EvalContext
+
 sns.set(style="whitegrid", rc={"figure.figsize": (7,5)})
 
 OUTDIR = "outputs_eval"
 os.makedirs(OUTDIR, exist_ok=True)
 
-# Load data and model
-model = joblib.load("model_rf.pkl")
-X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
-
-# Combine full dataset
-X = pd.concat([pd.DataFrame(X_train), pd.DataFrame(X_test)], ignore_index=True)
-y = np.concatenate([np.ravel(y_train), np.ravel(y_test)])
+# Load data and model (shared with the other evaluation stages)
+ctx = EvalContext.shared()
 
-# Predict
-y_pred = model.predict(X)
-residuals = y - y_pred
+# Full dataset, predictions and residuals (computed once in the context)
+y = ctx.y
+y_pred = ctx.y_pred
+residuals = ctx.residuals
 
 print(f"Overall MAE: {mean_absolute_error(y, y_pred):.6f}, R²: {r2_score(y, y_pred):.6f}")
 
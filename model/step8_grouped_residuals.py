@@ -1,28 +1,22 @@
 # step8_grouped_residuals.py
 import os
-import joblib
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.metrics import mean_absolute_error
 
+from eval_context import EvalContext
+
 sns.set(style="whitegrid", rc={"figure.figsize": (8,6)})
 OUTDIR = "outputs_eval"
 os.makedirs(OUTDIR, exist_ok=True)
 
-# Load data and model
-model = joblib.load("model_rf.pkl")
-X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
-
-# Convert to DataFrame if needed
-if isinstance(X_train, np.ndarray):
-    X_train = pd.DataFrame(X_train, columns=[f"f{i}" for i in range(X_train.shape[1])])
-if isinstance(X_test, np.ndarray):
-    X_test = pd.DataFrame(X_test, columns=[f"f{i}" for i in range(X_test.shape[1])])
+# Load data and model (shared with the other evaluation stages)
+ctx = EvalContext.shared()
 
-X = pd.concat([X_train, X_test], ignore_index=True)
-y = np.concatenate([np.ravel(y_train), np.ravel(y_test)])
+# Copy: the columns added below must not leak into the shared context
+X = ctx.X.copy()
+y = ctx.y
 
 # If you have metal_type / route info, add it here
 # Example: randomly assign for demonstration (replace with your real columns)
@@ -31,8 +25,8 @@ if "metal_type" not in X.columns:
 if "route" not in X.columns:
     X["route"] = np.random.choice(["primary", "recycled"], size=X.shape[0])
 
-# Predict
-y_pred = model.predict(X)
+# Predict (single full-data prediction pass from the context)
+y_pred = ctx.y_pred
 X["residual"] = y - y_pred
 X["predicted"] = y_pred
 X["actual"] = y
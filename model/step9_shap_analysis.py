@@ -1,27 +1,50 @@
 # step9_shap_analysis.py
 import os
-import joblib
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
 import pandas as pd
 import numpy as np
 import shap
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from eval_context import EvalContext
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from lca_shap import ParallelTreeShap, stratified_order, importance_shift
+
+# Global SHAP importance on a stratified (material x route) sample that grows until
+# the importance ranking stops moving, or on every row with --sample 0. The exact
+# TreeExplainer values are split across --n-jobs processes, and the SHAP matrix is
+# cached in outputs_eval/shap_values.npz so the plots re-render without recomputing
+# it while the model, split and sampling settings are unchanged.
+#   python model/step9_shap_analysis.py --sample 4000 --n-jobs 4
+#   python model/run_evaluation.py --sample 0        (flags pass through to this stage)
+
 sns.set(style="whitegrid")
 OUTDIR = "outputs_eval"
 os.makedirs(OUTDIR, exist_ok=True)
+CACHE_PATH = os.path.join(OUTDIR, "shap_values.npz")
+STRATA = ["material", "route"]
 
-# Load model and data
-model = joblib.load("model_rf.pkl")
-X_train, X_test, y_train, y_test = joblib.load("train_test_split.pkl")
-
-# Convert to DataFrame if needed
-if isinstance(X_train, np.ndarray):
-    X_train = pd.DataFrame(X_train, columns=[f"f{i}" for i in range(X_train.shape[1])])
-if isinstance(X_test, np.ndarray):
-    X_test = pd.DataFrame(X_test, columns=[f"f{i}" for i in range(X_test.shape[1])])
+parser = argparse.ArgumentParser(description="SHAP global importance and plots.")
+parser.add_argument("--sample", type=int, default=2000, help="max rows explained (0 = every row, no sampling)")
+parser.add_argument("--sample-start", type=int, default=250, help="first sample size; doubled until converged")
+parser.add_argument("--tol", type=float, default=0.02,
+                    help="converged when no feature's importance share moves by more than tol x the top share")
+parser.add_argument("--n-jobs", type=int, default=1, help="worker processes for the exact SHAP values (-1 = all cores)")
+parser.add_argument("--seed", type=int, default=42)
+parser.add_argument("--no-cache", action="store_true", help="recompute even if a matching cache exists")
+args, _ = parser.parse_known_args()
 
-X = pd.concat([X_train, X_test], ignore_index=True)
+# Load model and data (shared with the other evaluation stages)
+ctx = EvalContext.shared()
+model = ctx.model
+X = ctx.X
 
 # For tree-based models inside pipeline, we need to extract the fitted estimator
 rf = None
@@ -40,16 +63,12 @@ if isinstance(model, Pipeline):
 else:
     rf = model
 
-# Transform data through pipeline up to estimator
+# Transform data through pipeline up to estimator (transformed once in the context)
 if preprocessor is not None:
-    X_transformed = preprocessor.transform(X)
+    X_transformed = ctx.X_transformed
 else:
     X_transformed = X.values
 
-# SHAP explainer
-explainer = shap.TreeExplainer(rf)
-shap_values = explainer.shap_values(X_transformed)
-
 # Feature names
 if preprocessor is not None:
     try:
@@ -59,6 +78,75 @@ if preprocessor is not None:
 else:
     feature_names = X.columns
 
+
+def cache_key():
+    """Identifies model + split files (path, size, mtime) and the sampling settings; None if unknown."""
+    if ctx.sources is None:
+        return None
+    stamps = []
+    for p in ctx.sources:
+        st = os.stat(p)
+        stamps.append([os.path.abspath(p), st.st_size, st.st_mtime_ns])
+    settings = {"sample": args.sample, "sample_start": args.sample_start, "tol": args.tol, "seed": args.seed}
+    return hashlib.sha256(json.dumps([stamps, settings]).encode()).hexdigest()
+
+
+def compute():
+    """(shap_values, rows, expected_value, history) with rows the explained row indices of X."""
+    n = X_transformed.shape[0]
+    if args.sample <= 0 or args.sample >= n:
+        rows, sizes = np.arange(n), [n]
+    else:
+        strata = X[[c for c in STRATA if c in X.columns]].astype(str).agg("|".join, axis=1)
+        rows = stratified_order(strata.to_numpy(), seed=args.seed)[:args.sample]
+        sizes = []
+        size = min(args.sample_start, args.sample)
+        while size < args.sample:
+            sizes.append(size)
+            size *= 2
+        sizes.append(args.sample)
+
+    parts, history, prev, done = [], [], None, 0
+    with ParallelTreeShap(rf, n_jobs=args.n_jobs) as ps:
+        for size in sizes:
+            parts.append(ps.shap_values(X_transformed[rows[done:size]]))
+            done = size
+            imp = np.abs(np.vstack(parts)).mean(axis=0)
+            shift = importance_shift(prev, imp) if prev is not None else np.nan
+            history.append((size, shift))
+            print(f"  {size} rows: importance shift {shift:.4f}")
+            if shift <= args.tol:
+                break
+            prev = imp
+        expected_value = ps.expected_value
+    return np.vstack(parts), rows[:done], expected_value, history
+
+
+# SHAP matrix: from the cache when model, data and settings match, else computed
+t0 = time.time()
+key = cache_key()
+cached = None
+if key is not None and not args.no_cache and os.path.exists(CACHE_PATH):
+    with np.load(CACHE_PATH) as f:
+        if str(f["key"]) == key:
+            cached = {k: f[k] for k in f.files}
+if cached is not None:
+    shap_values, rows = cached["shap_values"], cached["rows"]
+    expected_value = float(cached["expected_value"])
+    history = [tuple(h) for h in cached["history"]]
+    print(f"SHAP values loaded from {CACHE_PATH} ({len(rows)} rows)")
+else:
+    shap_values, rows, expected_value, history = compute()
+    expected_value = float(np.ravel(expected_value)[0])
+    if key is not None:
+        np.savez(CACHE_PATH, key=key, shap_values=shap_values, rows=rows,
+                 expected_value=expected_value, history=np.array(history, dtype=float))
+    print(f"SHAP values for {len(rows)} rows in {time.time() - t0:.1f}s")
+last_shift = history[-1][1]
+if len(rows) < X_transformed.shape[0] and not last_shift <= args.tol:
+    print(f"Warning: importance not converged at {len(rows)} rows (shift {last_shift:.4f} > {args.tol}); raise --sample")
+X_explained = X_transformed[rows]
+
 # --- Global feature importance ---
 shap_abs_mean = np.abs(shap_values).mean(axis=0)
 feat_imp = pd.DataFrame({"feature": feature_names, "mean_abs_shap": shap_abs_mean})
@@ -66,20 +154,20 @@ feat_imp = feat_imp.sort_values("mean_abs_shap", ascending=False).head(20)
 
 plt.figure(figsize=(8,6))
 sns.barplot(x="mean_abs_shap", y="feature", data=feat_imp)
-plt.title("Top 20 Features by SHAP Importance")
+plt.title(f"Top 20 Features by SHAP Importance ({len(rows)} rows)")
 plt.tight_layout()
 plt.savefig(os.path.join(OUTDIR, "shap_feature_importance.png"))
 plt.close()
 
 # --- SHAP summary plot ---
-shap.summary_plot(shap_values, X_transformed, feature_names=feature_names, show=False)
+shap.summary_plot(shap_values, X_explained, feature_names=feature_names, show=False)
 plt.tight_layout()
 plt.savefig(os.path.join(OUTDIR, "shap_summary.png"))
 plt.close()
 
-# Optional: explain single prediction
+# Optional: explain single prediction (first explained row)
 sample_idx = 0
-shap.force_plot(explainer.expected_value, shap_values[sample_idx,:], X_transformed[sample_idx,:],
+shap.force_plot(expected_value, shap_values[sample_idx,:], X_explained[sample_idx,:],
                 feature_names=feature_names, matplotlib=True, show=False)
 plt.savefig(os.path.join(OUTDIR, "shap_force_sample0.png"), bbox_inches="tight")
 plt.close()